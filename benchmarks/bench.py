@@ -0,0 +1,431 @@
+"""
+Reg Replace.
+
+Licensed under MIT
+Copyright (c) 2011 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import types
+try:
+    from RegReplace import rr_batch
+    from RegReplace.rr_buffer import TextBuffer
+    from RegReplace.rr_cache import PatternCache
+    from RegReplace.rr_engine import REGEX_SUPPORT
+    from RegReplace.rr_rules import RuleRegistry
+except ImportError:
+    # Running from a checkout that isn't named `RegReplace`
+    package = types.ModuleType('RegReplace')
+    package.__path__ = [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+    sys.modules['RegReplace'] = package
+    from RegReplace import rr_batch
+    from RegReplace.rr_buffer import TextBuffer
+    from RegReplace.rr_cache import PatternCache
+    from RegReplace.rr_engine import REGEX_SUPPORT
+    from RegReplace.rr_rules import RuleRegistry
+try:
+    # Only available when run by Sublime Text's Python
+    import sublime
+    from RegReplace.rr_engine import EngineOptions
+    from RegReplace.rr_replacer import FindReplace
+except ImportError:
+    sublime = None
+
+DEFAULT_SIZES = '10k,1m'
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.1
+# Cases faster than this are too noisy to flag as regressions
+MIN_SECONDS = 0.005
+# Timings are also given relative to this case at the same size, which tells more than seconds from another machine
+REFERENCE_CASE = 'regex_greedy'
+SIZE_UNITS = {'k': 1024, 'm': 1024 * 1024}
+SELECTION_COUNT = 5000
+
+WORDS = (
+    'alpha', 'beta', 'gamma', 'delta', 'foo', 'bar', 'baz', 'lorem', 'ipsum', 'dolor',
+    'snake_case', 'other_name', 'value', 'ba', 'abba', 'TODO'
+)
+
+RULES = {
+    'trailing_spaces': {'find': r'[ \t]+$', 'replace': ''},
+    'swap_words': {'find': r'(\w+)_(\w+)', 'replace': r'\2_\1'},
+    'upper_words': {'find': r'(\w+)_(\w+)', 'replace': r'\C\1\E_\2'},
+    'literal': {'find': 'foo', 'replace': 'qux', 'literal': True},
+    'literal_ignorecase': {'find': 'FOO', 'replace': 'qux', 'literal': True, 'literal_ignorecase': True},
+    'constant': {'find': r'\bbar\b', 'replace': 'quux'},
+    'word_todo': {'find': r'\bTODO\b', 'replace': 'DONE'},
+    'first_todo': {'find': r'TODO', 'replace': 'DONE', 'greedy': False},
+    'plugin': {'find': r'(lorem) (ipsum)', 'plugin': 'rr_modules.example'},
+    'comment_todo': {'scope': 'comment', 'find': r'TODO', 'replace': 'DONE'},
+    'comment_scopes': {'scope': 'comment', 'find': r'(?s).*', 'replace': '# removed', 'literal': False},
+    'code_foo': {'find': r'foo', 'replace': 'qux', 'scope_filter': ['-comment']},
+    'bubble': {'find': r'ba', 'replace': 'ab'}
+}
+
+# name: (rules, options); cases with an `unfused` option fuse rules, and must not be slower than the named case.
+# Cases with the `view` option run `FindReplace` on a view, like commands do in the editor, so they only run in it.
+CASES = [
+    ('regex_greedy', ['trailing_spaces'], {}),
+    ('regex_non_greedy', ['first_todo'], {'cursor': 0.5}),
+    ('regex_group_template', ['swap_words'], {}),
+    ('regex_constant_template', ['constant'], {}),
+    ('literal', ['literal'], {}),
+    ('literal_ignorecase', ['literal_ignorecase'], {}),
+    ('backrefs_template', ['upper_words'], {'settings': {'extended_back_references': True}}),
+    ('regex_module', ['swap_words'], {'settings': {'use_regex_module': True}, 'regex': True}),
+    ('backrefs_regex_module', ['upper_words'], {
+        'settings': {'use_regex_module': True, 'extended_back_references': True}, 'regex': True
+    }),
+    ('plugin', ['plugin'], {}),
+    ('scope', ['comment_todo'], {'scopes': True}),
+    ('scope_regions', ['comment_scopes'], {'scopes': True}),
+    ('scope_filter', ['code_foo'], {'scopes': True}),
+    ('find_only', ['swap_words'], {'find_only': True}),
+    ('count', ['swap_words'], {'action': 'count'}),
+    ('selection_only', ['swap_words'], {'find_only': True, 'selections': SELECTION_COUNT}),
+    ('selection_only_full_file', ['swap_words'], {'find_only': True, 'selections': SELECTION_COUNT, 'full_file': True}),
+    ('sequence', ['trailing_spaces', 'literal', 'constant', 'word_todo'], {}),
+    ('sequence_fused', ['trailing_spaces', 'literal', 'constant', 'word_todo'], {
+        'settings': {'fuse_rules': True}, 'unfused': 'sequence'
+    }),
+    ('multi_pass', ['bubble', 'trailing_spaces'], {'multi_pass': True}),
+    ('view_find_only', ['swap_words'], {'find_only': True, 'view': True}),
+    ('view_non_greedy', ['first_todo'], {'cursor': 0.5, 'view': True}),
+]
+
+
+class BenchSettings(dict):
+    """A view's settings."""
+
+    def set(self, key, value):
+        """Set a setting."""
+
+        self[key] = value
+
+
+class BenchView(object):
+    """
+    A view over a text buffer to run `FindReplace` on.
+
+    The engine reads and edits it through the view API, a region at a time, as it does in the editor.
+    """
+
+    def __init__(self, buffer):
+        """Initialize."""
+
+        self.buffer = buffer
+        self.view_settings = BenchSettings()
+
+    def size(self):
+        """Get the size of the text."""
+
+        return self.buffer.size()
+
+    def substr(self, region):
+        """Get the text of the region."""
+
+        return self.buffer.substr(region.begin(), region.end())
+
+    def replace(self, edit, region, text):
+        """Replace the text of the region."""
+
+        self.buffer.replace(region.begin(), region.end(), text)
+
+    def sel(self):
+        """Get the selections."""
+
+        return self.buffer.sel()
+
+    def find_by_selector(self, selector):
+        """Get the regions of the scope."""
+
+        return [sublime.Region(begin, end) for begin, end in self.buffer.scopes.get(selector, [])]
+
+    def score_selector(self, pt, selector):
+        """Score the scope at the point."""
+
+        return self.buffer.score_selector(pt, selector)
+
+    def show(self, pt):
+        """Nothing to show."""
+
+    def settings(self):
+        """Get the view's settings."""
+
+        return self.view_settings
+
+
+def parse_size(value):
+    """Parse a size like `10k` or `100m`."""
+
+    value = value.strip().lower()
+    if value[-1:] in SIZE_UNITS:
+        return int(float(value[:-1]) * SIZE_UNITS[value[-1]])
+    return int(value)
+
+
+def format_size(size):
+    """Format a size for display."""
+
+    for unit in ('m', 'k'):
+        if size >= SIZE_UNITS[unit] and size % SIZE_UNITS[unit] == 0:
+            return '%d%s' % (size // SIZE_UNITS[unit], unit)
+    return str(size)
+
+
+def generate(size, seed=0):
+    """
+    Generate a synthetic buffer of about `size` characters, and the `(begin, end)` spans of its comments.
+
+    A block of random lines (with trailing spaces, comments, snake case names, etc.)
+    is generated and repeated to reach the size.
+    """
+
+    rand = random.Random(seed)
+    lines = []
+    length = 0
+    while length < min(size, 64 * 1024):
+        words = [rand.choice(WORDS) for _ in range(rand.randint(0, 12))]
+        line = ' '.join(words)
+        if rand.random() < 0.2:
+            line = '# ' + line
+        if rand.random() < 0.3:
+            line += ' ' * rand.randint(1, 4)
+        lines.append(line + '\n')
+        length += len(lines[-1])
+    block = ''.join(lines)
+    text = (block * (size // len(block) + 1))[:size]
+
+    comments = []
+    pos = 0
+    for line in text.splitlines(True):
+        if line.startswith('# '):
+            comments.append((pos, pos + len(line.rstrip('\n'))))
+        pos += len(line)
+    return text, comments
+
+
+def selections(text, count):
+    """Select `count` evenly spaced lines."""
+
+    lines = text.splitlines(True)
+    step = max(1, len(lines) // count)
+    spans = []
+    pos = 0
+    for index, line in enumerate(lines):
+        if index % step == 0 and len(spans) < count:
+            spans.append((pos, pos + len(line)))
+        pos += len(line)
+    return spans
+
+
+def run_case(rules, options, text, comments, registry):
+    """Run a case once with the rules of the registry and return the time it took and the number of matches."""
+
+    settings = options.get('settings', {})
+    scopes = {'comment': list(comments)} if options.get('scopes') else None
+    sels = selections(text, options['selections']) if 'selections' in options else ()
+    if 'cursor' in options:
+        pt = int(len(text) * options['cursor'])
+        sels = [(pt, pt)]
+    find_only = options.get('find_only', False)
+    action = options.get('action')
+    selection_only = bool(options.get('selections'))
+    shadow = not find_only and action is None and not selection_only
+
+    start = time.perf_counter()
+    buffer = TextBuffer(text, sels, scopes)
+    if options.get('view'):
+        # Commands only use a shadow buffer if it is enabled, which it isn't by default
+        engine = FindReplace(
+            BenchView(buffer), None, find_only, options.get('full_file', False), selection_only, 100, action,
+            options=EngineOptions(settings)
+        )
+        engine.errors = []
+    else:
+        engine = rr_batch.BatchEngine(
+            buffer, settings, find_only, options.get('full_file', False), selection_only, 100, action, shadow
+        )
+    result = engine.apply_sequence(
+        rules, registry, options.get('multi_pass', False), bool(settings.get('fuse_rules', False))
+    )
+    engine.commit()
+    elapsed = time.perf_counter() - start
+    if engine.errors:
+        raise RuntimeError('; '.join(engine.errors))
+    return elapsed, result.total
+
+
+def run(sizes, repeat, names=None):
+    """
+    Run the benchmarks and return the results.
+
+    The reference case always runs, so the others can be timed relative to it.
+    """
+
+    rr_batch.init_worker({'packages': os.path.dirname(rr_batch.PACKAGE_PATH)})
+    results = []
+    for size in sizes:
+        text, comments = generate(size)
+        reference = None
+        for name, rules, options in CASES:
+            if names and name not in names and name != REFERENCE_CASE:
+                continue
+            if options.get('regex') and not REGEX_SUPPORT:
+                continue
+            if options.get('view') and sublime is None:
+                continue
+            # Compiled patterns are cached between runs, and rules keep what was compiled for them
+            # as they do between commands, so the first run is a warm up
+            PatternCache.clear()
+            registry = RuleRegistry(RULES)
+            times = []
+            for _ in range(repeat + 1):
+                elapsed, matches = run_case(rules, options, text, comments, registry)
+                times.append(elapsed)
+            best = min(times[1:]) if repeat else times[0]
+            if name == REFERENCE_CASE:
+                reference = best
+            results.append(
+                {
+                    'name': name,
+                    'size': size,
+                    'seconds': best,
+                    'relative': best / reference if reference else 0.0,
+                    'first': times[0],
+                    'matches': matches,
+                    'mb_per_second': size / (1024.0 * 1024.0) / best if best else 0.0
+                }
+            )
+            print(
+                '%-26s %6s %10.4fs (first %.4fs) %9d matches' % (
+                    name, format_size(size), best, times[0], matches
+                ),
+                file=sys.stderr
+            )
+    return results
+
+
+def compare(results, baseline, threshold, relative=False):
+    """
+    Compare the results to a baseline and return the regressions (slower, or a different number of matches).
+
+    With `relative`, the baseline comes from another machine: its timings are scaled, for each size, by
+    the median of how much slower or faster each case ran here.
+    """
+
+    previous = {(r['name'], r['size']): r for r in baseline['results']}
+    ratios = {}
+    for result in results:
+        old = previous.get((result['name'], result['size']))
+        if old is not None and old['seconds']:
+            ratios.setdefault(result['size'], []).append(result['seconds'] / old['seconds'])
+    scale = dict((size, statistics.median(values) if relative else 1.0) for size, values in ratios.items())
+
+    regressions = []
+    for result in results:
+        old = previous.get((result['name'], result['size']))
+        if old is None or not old['seconds']:
+            continue
+        expected = old['seconds'] * scale[result['size']]
+        change = result['seconds'] / expected - 1.0
+        result['baseline'] = expected
+        result['change'] = change
+        status = ''
+        if result['matches'] != old['matches']:
+            # The engine's behavior changed; the times can't be compared
+            status = 'MATCHES CHANGED (%d -> %d)' % (old['matches'], result['matches'])
+            regressions.append(result)
+        elif change > threshold and result['seconds'] >= MIN_SECONDS:
+            status = 'REGRESSION'
+            regressions.append(result)
+        elif change < -threshold:
+            status = 'improved'
+        print(
+            '%-26s %6s %10.4fs -> %10.4fs %+7.1f%% %s' % (
+                result['name'], format_size(result['size']), expected, result['seconds'], change * 100, status
+            ),
+            file=sys.stderr
+        )
+    return regressions
+
+
+def check_fused(results, threshold):
+    """Check that fused cases are not slower than the same rules unfused; returns the ones that are."""
+
+    unfused = dict((name, options['unfused']) for name, rules, options in CASES if 'unfused' in options)
+    timed = {(r['name'], r['size']): r for r in results}
+    slower = []
+    for result in results:
+        other = timed.get((unfused.get(result['name']), result['size']))
+        if other is None:
+            continue
+        change = result['seconds'] / other['seconds'] - 1.0 if other['seconds'] else 0.0
+        if change > threshold and result['seconds'] >= MIN_SECONDS:
+            slower.append(result)
+            print(
+                '%-26s %6s %10.4fs is %.1f%% slower than %s' % (
+                    result['name'], format_size(result['size']), result['seconds'], change * 100, other['name']
+                ),
+                file=sys.stderr
+            )
+    return slower
+
+
+def main(argv=None):
+    """
+    Run the benchmarks.
+
+    The exit code is 1 if there are regressions against the baseline, or if fusing rules made a case slower.
+    """
+
+    parser = argparse.ArgumentParser(prog='bench', description='Benchmark the RegReplace engine.')
+    parser.add_argument(
+        '--sizes', default=DEFAULT_SIZES, help='Comma separated buffer sizes, e.g. "10k,1m,100m".'
+    )
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Timed runs per case (best is kept).')
+    parser.add_argument('--case', action='append', help='Only run the given cases.')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    parser.add_argument('--baseline', help='Compare to results saved with "--output".')
+    parser.add_argument(
+        '--relative', action='store_true',
+        help='Scale the baseline by the median change over the cases, for a baseline from another machine.'
+    )
+    parser.add_argument(
+        '--threshold', type=float, default=DEFAULT_THRESHOLD,
+        help='Slow down (as a fraction) that counts as a regression.'
+    )
+    args = parser.parse_args(argv)
+
+    sizes = [parse_size(size) for size in args.sizes.split(',') if size.strip()]
+    results = run(sizes, args.repeat, args.case)
+    regressions = check_fused(results, args.threshold)
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions.extend(compare(results, json.load(f), args.threshold, args.relative))
+
+    report = {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'regex_module': REGEX_SUPPORT,
+        'repeat': args.repeat,
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
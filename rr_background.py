@@ -0,0 +1,164 @@
+"""
+Reg Replace.
+
+Licensed under MIT
+Copyright (c) 2011 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+import sublime
+import threading
+import traceback
+from RegReplace.rr_engine import Cancelled
+
+# How many times a sequence is run again if the view keeps changing while it runs
+MAX_RERUNS = 3
+
+
+class BackgroundJob(object):
+    """
+    Run a `reg_replace` command's sequence on the async thread over a snapshot of the view.
+
+    The command's find and replace object must work on a `SnapshotBuffer`.  When the run is done,
+    `reg_replace_finish` is run on the main thread to apply the results to the view, but only
+    if the view's change count still matches the snapshot; otherwise the sequence is run again
+    on a new snapshot.  There is at most one job per view: starting a new one cancels the old one.
+    """
+
+    jobs = {}
+    count = 0
+
+    def __init__(self, command):
+        """Initialize."""
+
+        BackgroundJob.count += 1
+        self.id = BackgroundJob.count
+        self.command = command
+        self.view = command.view
+        self.cancelled = threading.Event()
+        self.runs = 0
+        self.results = None
+        self.replace_obj = None
+
+    @classmethod
+    def start(cls, command):
+        """Start running the command's sequence in the background."""
+
+        cls.cancel(command.view)
+        job = cls(command)
+        cls.jobs[command.view.id()] = job
+        job.run()
+        return job
+
+    @classmethod
+    def get(cls, view, job_id):
+        """Get the view's job if it is the given one."""
+
+        job = cls.jobs.get(view.id())
+        return job if job is not None and job.id == job_id else None
+
+    @classmethod
+    def cancel(cls, view):
+        """Cancel the view's job; returns whether there was one."""
+
+        job = cls.jobs.pop(view.id(), None)
+        if job is not None:
+            job.cancelled.set()
+        return job is not None
+
+    @classmethod
+    def is_running(cls, view):
+        """Check if the view has a job."""
+
+        return view.id() in cls.jobs
+
+    def is_current(self):
+        """Check if this is still the view's job."""
+
+        return self.jobs.get(self.view.id()) is self
+
+    def forget(self):
+        """Stop tracking the job as the view's job."""
+
+        if self.is_current():
+            del self.jobs[self.view.id()]
+
+    def run(self):
+        """Run the sequence on the command's current snapshot."""
+
+        self.runs += 1
+        self.replace_obj = self.command.replace_obj
+        self.replace_obj.cancelled = self.cancelled
+        self.replace_obj.progress = self.progress
+        sublime.set_timeout_async(self.work, 0)
+
+    def progress(self, name, index, count, sweep):
+        """Show the progress in the status bar."""
+
+        if sweep > 1:
+            sublime.status_message('RegReplace: sweep %d: %s (%d/%d)...' % (sweep, name, index + 1, count))
+        else:
+            sublime.status_message('RegReplace: %s (%d/%d)...' % (name, index + 1, count))
+
+    def work(self):
+        """Find (and replace in the snapshot) on the async thread."""
+
+        if self.cancelled.is_set():
+            return
+        try:
+            self.results = self.command.find_and_replace()
+        except Cancelled:
+            sublime.set_timeout(self.stopped, 0)
+            return
+        except Exception:
+            print(str(traceback.format_exc()))
+            sublime.set_timeout(self.failed, 0)
+            return
+        sublime.set_timeout(self.done, 0)
+
+    def done(self):
+        """Apply the results on the main thread."""
+
+        if not self.is_current() or not self.view.is_valid():
+            self.forget()
+            self.replace_obj.close()
+        else:
+            self.view.run_command('reg_replace_finish', {'job': self.id})
+
+    def stopped(self):
+        """Clean up after the job was cancelled."""
+
+        self.forget()
+        self.replace_obj.close()
+        sublime.status_message('RegReplace: cancelled')
+
+    def failed(self):
+        """Clean up after the job failed."""
+
+        self.forget()
+        self.replace_obj.close()
+        sublime.status_message('RegReplace: failed! See console.')
+
+    def finish(self, edit):
+        """
+        Apply the results to the view if it hasn't changed since the snapshot.
+
+        If it has, the sequence is run again on a new snapshot, up to `MAX_RERUNS` times.
+        """
+
+        if self.view.change_count() != self.replace_obj.buffer.change_count:
+            self.replace_obj.close()
+            if self.runs > MAX_RERUNS:
+                self.forget()
+                sublime.status_message('RegReplace: the view kept changing; the sequence was not applied')
+                return
+            # The view changed while the sequence ran; run it again on the new text
+            self.command.replace_obj = self.command.create_replacer(edit)
+            self.run()
+            return
+
+        self.forget()
+        shown = self.replace_obj.buffer.shown
+        self.replace_obj.attach(edit)
+        if shown is not None:
+            self.view.show(shown)
+        self.command.commit()
+        self.command.finish_sequence(self.results)
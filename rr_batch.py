@@ -0,0 +1,479 @@
+"""
+Reg Replace.
+
+Licensed under MIT
+Copyright (c) 2011 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+import argparse
+import codecs
+import hashlib
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import types
+from fnmatch import fnmatch
+try:
+    from RegReplace.rr_buffer import TextBuffer
+    from RegReplace.rr_engine import ReplaceEngine, EngineOptions
+    from RegReplace.rr_rules import load_settings, OnSaveIndex, RuleRegistry
+    from RegReplace.rr_stream import RuleStream, StreamError, NotStreamable, stream_sequence
+    from RegReplace.rr_stream import DEFAULT_CHUNK_SIZE, DEFAULT_OVERLAP
+except ImportError:
+    # Running as a script from a folder that isn't named `RegReplace`
+    package = types.ModuleType('RegReplace')
+    package.__path__ = [os.path.dirname(os.path.abspath(__file__))]
+    sys.modules['RegReplace'] = package
+    from RegReplace.rr_buffer import TextBuffer
+    from RegReplace.rr_engine import ReplaceEngine, EngineOptions
+    from RegReplace.rr_rules import load_settings, OnSaveIndex, RuleRegistry
+    from RegReplace.rr_stream import RuleStream, StreamError, NotStreamable, stream_sequence
+    from RegReplace.rr_stream import DEFAULT_CHUNK_SIZE, DEFAULT_OVERLAP
+
+PACKAGE_PATH = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SETTINGS = os.path.join(PACKAGE_PATH, 'reg_replace.sublime-settings')
+DEFAULT_EXCLUDES = ('.git', '.hg', '.svn', '.tox', '__pycache__')
+DEFAULT_MULTI_PASS_MAX_SWEEP = 100
+BINARY_CHECK_SIZE = 8192
+SIZE_UNITS = {'k': 1024, 'm': 1024 * 1024, 'g': 1024 * 1024 * 1024}
+
+# Per worker state: the configuration, and plugins loaded by the worker
+worker = {}
+
+
+class BatchEngine(ReplaceEngine):
+    """Replace engine for files; errors are collected for the file's report."""
+
+    def __init__(self, *args, **kwargs):
+        """Initialize."""
+
+        super(BatchEngine, self).__init__(*args, **kwargs)
+        self.errors = []
+
+    def error(self, msg):
+        """Collect an error."""
+
+        self.errors.append(msg)
+
+    def load_plugin(self, module_name):
+        """Load a replace plugin from the package, or the packages folder, like the editor does."""
+
+        return load_plugin(module_name, worker['packages'])
+
+
+def load_plugin(module_name, packages):
+    """Load a plugin module by its dotted name; modules are cached per worker."""
+
+    plugins = worker.setdefault('plugins', {})
+    module = plugins.get(module_name)
+    if module is None:
+        if module_name.startswith('rr_modules.'):
+            path_name = os.path.join(PACKAGE_PATH, *module_name.split('.')) + '.py'
+        else:
+            path_name = os.path.join(packages, *module_name.split('.')) + '.py'
+        with codecs.open(path_name, 'r', encoding='utf-8') as f:
+            source = f.read()
+        name = 'rr_batch_plugin_%s' % hashlib.sha1(path_name.encode('utf-8')).hexdigest()
+        module = types.ModuleType(name)
+        exec(compile(source, path_name, 'exec'), module.__dict__)
+        plugins[module_name] = module
+    return module
+
+
+def plan_file(file_name, sequences, on_save_index):
+    """
+    Get the sequences to apply to the file as `(names, multi_pass)` pairs.
+
+    If `sequences` is given, it applies to every file; otherwise the `on_save_sequences`
+    entries that match the file are used (from an `OnSaveIndex`).  Entries with an action
+    (mark, fold, unfold) only make sense in the editor and are skipped, and there is no
+    syntax to match entries by.
+    """
+
+    if sequences is not None:
+        return [sequences]
+    plan = []
+    for item in on_save_index.match(file_name):
+        if 'action' in item or bool(item.get('highlight', False)):
+            continue
+        plan.append((tuple(item['sequence']), bool(item.get('multi_pass', False))))
+    return plan
+
+
+def walk(paths, excludes):
+    """Walk the paths and yield the files, skipping excluded files and folders."""
+
+    def excluded(name):
+        """Check if the file or folder is excluded."""
+
+        return any(fnmatch(name, pattern) for pattern in excludes)
+
+    for path in paths:
+        if os.path.isfile(path):
+            yield os.path.abspath(path)
+            continue
+        for root, dirnames, filenames in os.walk(os.path.abspath(path)):
+            dirnames[:] = sorted(d for d in dirnames if not excluded(d))
+            for filename in sorted(filenames):
+                if not excluded(filename):
+                    yield os.path.join(root, filename)
+
+
+def parse_size(value):
+    """Parse a size like `64k` or `512m`."""
+
+    value = value.strip().lower()
+    try:
+        if value[-1:] in SIZE_UNITS:
+            return int(float(value[:-1]) * SIZE_UNITS[value[-1]])
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid size: "%s"' % value)
+
+
+def temp_file(file_name):
+    """Create a temporary file next to the file; returns `(fd, path)`."""
+
+    return tempfile.mkstemp(
+        dir=os.path.dirname(file_name), prefix='.%s.' % os.path.basename(file_name), suffix='.tmp'
+    )
+
+
+def write_atomic(file_name, data):
+    """Write the file by replacing it with a finished temporary file."""
+
+    fd, temp = temp_file(file_name)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        shutil.copymode(file_name, temp)
+        os.replace(temp, file_name)
+    except Exception:
+        os.remove(temp)
+        raise
+
+
+def init_worker(config):
+    """
+    Set up a worker; compiled patterns, templates, and plugins are cached for the life of the worker.
+
+    The rules and settings are resolved once per worker.
+    """
+
+    worker.clear()
+    worker.update(config)
+    if 'rules' in config:
+        worker['rules'] = RuleRegistry(config['rules'])
+    if 'settings' in config:
+        worker['options'] = EngineOptions(config['settings'])
+
+
+def process_file(task):
+    """
+    Apply the planned sequences to the file.
+
+    Returns `(file_name, status, counts, notes, errors)` where status is `changed`, `unchanged`, or `skipped`.
+    Notes are reported, but only errors fail the run.  Files of at least the `stream` size are streamed
+    if the plan allows it.
+    """
+
+    file_name, plan = task
+    stream = worker.get('stream')
+    if stream is not None:
+        try:
+            large = os.path.getsize(file_name) >= stream
+        except Exception as err:
+            return file_name, 'skipped', [], [], [str(err)]
+        if large:
+            try:
+                return stream_file(file_name, plan)
+            except NotStreamable as err:
+                file_name, status, counts, notes, errors = read_file(file_name, plan)
+                return file_name, status, counts, ['not streamed: %s' % err] + notes, errors
+    return read_file(file_name, plan)
+
+
+def read_file(file_name, plan):
+    """Apply the planned sequences to the whole file at once."""
+
+    settings = worker['settings']
+    rules = worker['rules']
+    try:
+        with open(file_name, 'rb') as f:
+            data = f.read()
+        if b'\0' in data[:BINARY_CHECK_SIZE]:
+            return file_name, 'skipped', [], ['binary file'], []
+        text = data.decode('utf-8')
+    except UnicodeDecodeError:
+        return file_name, 'skipped', [], ['not UTF-8'], []
+    except Exception as err:
+        return file_name, 'skipped', [], [], [str(err)]
+
+    # The editor works on Unix line endings; files with mixed line endings are left as they are
+    crlf = uses_crlf(text.count('\n'), text.count('\r\n'))
+    if crlf:
+        text = text.replace('\r\n', '\n')
+
+    buffer = TextBuffer(text)
+    counts = []
+    notes = []
+    errors = []
+    max_sweeps = settings.get('multi_pass_max_sweeps', DEFAULT_MULTI_PASS_MAX_SWEEP)
+    fuse = bool(settings.get('fuse_rules', False))
+    for names, multi_pass in plan:
+        engine = BatchEngine(buffer, worker['options'], False, False, False, max_sweeps, None, True)
+        result = engine.apply_sequence(list(names), rules, multi_pass, fuse)
+        engine.commit()
+        counts.extend([(name, count) for name, count in result.counts if count])
+        errors.extend(['rule "%s" not found' % name for name in result.not_found])
+        if result.cycle is not None:
+            notes.append('stopped a cycle of: %s' % ', '.join(result.cycle[0]))
+        errors.extend(['rule "%s" ran out of time' % name for name in result.timed_out])
+        if result.out_of_time is not None:
+            errors.append('sequence ran out of time at "%s"' % result.out_of_time)
+        errors.extend(engine.errors)
+
+    if buffer.text == text:
+        return file_name, 'unchanged', counts, notes, errors
+    text = buffer.text
+    if crlf:
+        text = text.replace('\n', '\r\n')
+    if not worker['check']:
+        try:
+            write_atomic(file_name, text.encode('utf-8'))
+        except Exception as err:
+            return file_name, 'skipped', counts, notes, errors + ['could not write: %s' % err]
+    return file_name, 'changed', counts, notes, errors
+
+
+def uses_crlf(lf, crlf):
+    """Check if a file with `lf` line feeds, `crlf` of which end Windows line endings, uses them throughout."""
+
+    return crlf > 0 and crlf == lf
+
+
+def read_chunks(file_name, chunk_size, crlf=True):
+    """Read the file as UTF-8 in chunks; with `crlf`, Windows line endings are read as Unix line endings."""
+
+    with open(file_name, 'r', encoding='utf-8', newline='') as f:
+        carry = ''
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            if not crlf:
+                yield chunk
+                continue
+            chunk = carry + chunk
+            carry = ''
+            if chunk.endswith('\r'):
+                # The line ending may be split between chunks
+                carry = '\r'
+                chunk = chunk[:-1]
+            yield chunk.replace('\r\n', '\n')
+        if carry:
+            yield carry
+
+
+def stream_file(file_name, plan):
+    """
+    Apply the planned sequences to the file in chunks, without reading it whole.
+
+    Raises `NotStreamable`, before the file is read, if the plan has multi-pass sequences or rules
+    with `selection_inputs` or that search in reverse.  The file is read once first to check if it
+    is binary and if it has Windows line endings throughout.  Time budgets don't apply to streamed files.
+    """
+
+    rules = worker['rules']
+    chunk_size = worker['chunk_size']
+    engine = BatchEngine(TextBuffer(''), worker['options'], False, False, False, 1, None)
+    streams = []
+    errors = []
+    for names, multi_pass in plan:
+        if multi_pass:
+            raise NotStreamable('multi-pass sequence')
+        for name in names:
+            if name not in rules:
+                errors.append('rule "%s" not found' % name)
+            elif rules[name].selection_inputs:
+                raise NotStreamable('"%s" uses selection inputs' % name)
+            else:
+                streams.append(RuleStream(engine, rules[name], chunk_size, worker['overlap']))
+
+    original = hashlib.sha1()
+    lf = 0
+    crlf = 0
+    try:
+        with open(file_name, 'rb') as f:
+            data = f.read(BINARY_CHECK_SIZE)
+            if b'\0' in data:
+                return file_name, 'skipped', [], ['binary file'], []
+            last = b''
+            while data:
+                original.update(data)
+                lf += data.count(b'\n')
+                crlf += (last + data).count(b'\r\n')
+                last = data[-1:]
+                data = f.read(chunk_size)
+    except Exception as err:
+        return file_name, 'skipped', [], [], [str(err)]
+    crlf = uses_crlf(lf, crlf)
+
+    result = hashlib.sha1()
+    fd, temp = (None, None) if worker['check'] else temp_file(file_name)
+    status = None
+    try:
+        with (os.fdopen(fd, 'wb') if fd is not None else open(os.devnull, 'wb')) as out:
+            for text in stream_sequence(streams, read_chunks(file_name, chunk_size, crlf)):
+                if crlf:
+                    text = text.replace('\n', '\r\n')
+                data = text.encode('utf-8')
+                result.update(data)
+                out.write(data)
+    except UnicodeDecodeError:
+        status = (file_name, 'skipped', [], ['not UTF-8'], [])
+    except StreamError as err:
+        status = (file_name, 'skipped', [], [], [str(err)])
+    except Exception as err:
+        status = (file_name, 'skipped', [], [], [str(err)])
+
+    counts = [(stream.rule.name, stream.count) for stream in streams if stream.count]
+    errors.extend(engine.errors)
+    if status is None:
+        status = (file_name, 'unchanged' if result.digest() == original.digest() else 'changed', counts, [], errors)
+    try:
+        if temp is not None:
+            if status[1] == 'changed':
+                shutil.copymode(file_name, temp)
+                os.replace(temp, file_name)
+            else:
+                os.remove(temp)
+    except Exception as err:
+        os.remove(temp)
+        return file_name, 'skipped', counts, [], errors + ['could not write: %s' % err]
+    return status
+
+
+def parse_arguments(argv):
+    """Parse the command line."""
+
+    parser = argparse.ArgumentParser(
+        prog='rr_batch',
+        description=(
+            'Apply RegReplace sequences to files without the editor.  By default, the "on_save_sequences" '
+            'of the settings are applied to the files they match.'
+        )
+    )
+    parser.add_argument('paths', nargs='+', help='Files and folders to process.')
+    parser.add_argument('--rules', required=True, help='Rules file (reg_replace_rules.sublime-settings).')
+    parser.add_argument(
+        '--settings', default=DEFAULT_SETTINGS,
+        help='Settings file (reg_replace.sublime-settings); defaults to the package defaults.'
+    )
+    parser.add_argument(
+        '--packages', default=os.path.dirname(PACKAGE_PATH),
+        help='Sublime Packages folder to load plugins outside of "rr_modules" from.'
+    )
+    parser.add_argument(
+        '--sequence', action='append', metavar='RULE',
+        help='Apply these rules, in order, to every file instead of the "on_save_sequences".'
+    )
+    parser.add_argument('--multi-pass', action='store_true', help='Apply the "--sequence" rules with multi-pass.')
+    parser.add_argument('--check', action='store_true', help='Only report the files that would change.')
+    parser.add_argument(
+        '--stream', type=parse_size, metavar='SIZE',
+        help='Stream files of at least this size (e.g. "512m") in chunks instead of reading them whole.'
+    )
+    parser.add_argument(
+        '--chunk-size', type=parse_size, default=DEFAULT_CHUNK_SIZE, metavar='SIZE',
+        help='Size of the chunks streamed files are read in; no match can be longer.'
+    )
+    parser.add_argument(
+        '--overlap', type=parse_size, default=DEFAULT_OVERLAP, metavar='SIZE',
+        help='How far past a match a streamed file is read before the match is accepted (for unbounded rules).'
+    )
+    parser.add_argument(
+        '--exclude', action='append', default=list(DEFAULT_EXCLUDES), metavar='GLOB',
+        help='Skip files and folders whose names match.'
+    )
+    parser.add_argument(
+        '--jobs', '-j', type=int, default=os.cpu_count() or 1, help='Number of worker processes.'
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Run the batch and return the exit code: 1 if files changed in check mode, 2 if there were errors."""
+
+    args = parse_arguments(argv)
+    settings = load_settings(args.settings)
+    rules = load_settings(args.rules).get('replacements', {})
+    sequences = (tuple(args.sequence), args.multi_pass) if args.sequence else None
+    on_save_sequences = settings.get('on_save_sequences', [])
+    config = {
+        'settings': settings, 'rules': rules, 'packages': args.packages, 'check': args.check,
+        'stream': args.stream, 'chunk_size': args.chunk_size, 'overlap': args.overlap
+    }
+
+    # Report missing rules once instead of for every file
+    if sequences is not None:
+        names = sequences[0]
+    else:
+        names = [name for item in on_save_sequences if 'action' not in item for name in item.get('sequence', [])]
+    missing = sorted(set(name for name in names if name not in rules))
+    if missing:
+        for name in missing:
+            print('Error: rule "%s" not found' % name, file=sys.stderr)
+        return 2
+    on_save_index = OnSaveIndex(on_save_sequences)
+    if sequences is None and on_save_index.errors:
+        for err in on_save_index.errors:
+            print('Error: %s' % err, file=sys.stderr)
+        return 2
+
+    tasks = (
+        (file_name, plan) for file_name, plan in (
+            (file_name, plan_file(file_name, sequences, on_save_index))
+            for file_name in walk(args.paths, args.exclude)
+        ) if plan
+    )
+
+    totals = {'changed': 0, 'unchanged': 0, 'skipped': 0}
+    failed = False
+    if args.jobs > 1:
+        pool = multiprocessing.Pool(args.jobs, initializer=init_worker, initargs=(config,))
+        results = pool.imap_unordered(process_file, tasks, chunksize=16)
+    else:
+        pool = None
+        init_worker(config)
+        results = (process_file(task) for task in tasks)
+
+    try:
+        for file_name, status, counts, notes, errors in results:
+            totals[status] += 1
+            if status == 'changed':
+                summary = ', '.join('%s: %d' % count for count in counts)
+                print('%s%s (%s)' % ('Would change: ' if args.check else 'Changed: ', file_name, summary))
+            for note in notes:
+                print('%s: %s: %s' % (status.capitalize(), file_name, note), file=sys.stderr)
+            for err in errors:
+                failed = True
+                print('Error: %s: %s' % (file_name, err), file=sys.stderr)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    print(
+        '%d files %s, %d unchanged, %d skipped' % (
+            totals['changed'], 'would change' if args.check else 'changed', totals['unchanged'], totals['skipped']
+        )
+    )
+    if failed:
+        return 2
+    return 1 if args.check and totals['changed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
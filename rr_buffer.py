@@ -0,0 +1,231 @@
+"""
+Reg Replace.
+
+Licensed under MIT
+Copyright (c) 2011 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+from bisect import bisect_left
+from itertools import accumulate
+
+
+def move(pt, begin, end, delta):
+    """Move a point after the replace of `[begin, end)` that changed the size of the text by `delta`."""
+
+    if pt >= end and pt > begin:
+        return pt + delta
+    if pt > begin:
+        return min(pt, end + delta)
+    return pt
+
+
+class Region(object):
+    """Region of text from `a` to `b`; `a` may be after `b` (as with a reversed selection)."""
+
+    __slots__ = ('a', 'b')
+
+    def __init__(self, a, b=None):
+        """Initialize."""
+
+        self.a = a
+        self.b = a if b is None else b
+
+    def begin(self):
+        """Get the start of the region."""
+
+        return min(self.a, self.b)
+
+    def end(self):
+        """Get the end of the region."""
+
+        return max(self.a, self.b)
+
+    def size(self):
+        """Get the size of the region."""
+
+        return abs(self.b - self.a)
+
+    def empty(self):
+        """Check if the region is empty."""
+
+        return self.a == self.b
+
+    def __len__(self):
+        """Get the size of the region."""
+
+        return self.size()
+
+    def __eq__(self, other):
+        """Compare regions."""
+
+        return isinstance(other, Region) and self.a == other.a and self.b == other.b
+
+    def __ne__(self, other):
+        """Compare regions."""
+
+        return not self == other
+
+    def __lt__(self, other):
+        """Order regions by where they start and end."""
+
+        return (self.begin(), self.end()) < (other.begin(), other.end())
+
+    def __hash__(self):
+        """Hash the region."""
+
+        return hash((self.a, self.b))
+
+    def __repr__(self):
+        """Represent the region."""
+
+        return 'Region(%d, %d)' % (self.a, self.b)
+
+
+def region_key(region):
+    """Sort regions by where they start and end."""
+
+    return region.begin(), region.end()
+
+
+class Selection(object):
+    """Sorted list of selected regions; any region class with `begin()` and `end()` can be used."""
+
+    def __init__(self, regions=()):
+        """Initialize."""
+
+        self.regions = []
+        self.add_all(regions)
+
+    def __len__(self):
+        """Get the number of selections."""
+
+        return len(self.regions)
+
+    def __iter__(self):
+        """Iterate the selections."""
+
+        return iter(self.regions)
+
+    def __getitem__(self, index):
+        """Get a selection."""
+
+        return self.regions[index]
+
+    def clear(self):
+        """Remove all selections."""
+
+        self.regions = []
+
+    def add(self, region):
+        """Add a selection."""
+
+        self.regions.append(region)
+        self.regions.sort(key=region_key)
+
+    def add_all(self, regions):
+        """Add several selections."""
+
+        self.regions.extend(regions)
+        self.regions.sort(key=region_key)
+
+
+class TextBuffer(object):
+    """
+    Plain string buffer for running the replace engine outside of the editor.
+
+    Selections are given as `(begin, end)` pairs.  There is no syntax highlighting, so scopes
+    can be supplied as a mapping of selector to `(begin, end)` pairs; other selectors find nothing.
+    Like in the editor, selections and scopes are moved along as the text is edited.
+    """
+
+    def __init__(self, text, selections=(), scopes=None):
+        """Initialize."""
+
+        self.text = text
+        self.selection = Selection(Region(begin, end) for begin, end in selections)
+        self.scopes = {} if scopes is None else scopes
+
+    def size(self):
+        """Get the size of the text."""
+
+        return len(self.text)
+
+    def substr(self, begin, end):
+        """Get a portion of the text."""
+
+        return self.text[begin:end]
+
+    def replace(self, begin, end, text):
+        """Replace a portion of the text."""
+
+        self.text = self.text[:begin] + text + self.text[end:]
+        delta = len(text) - (end - begin)
+        if delta:
+            self.selection.regions = [
+                Region(move(r.a, begin, end, delta), move(r.b, begin, end, delta)) for r in self.selection.regions
+            ]
+            for selector, spans in self.scopes.items():
+                self.scopes[selector] = [(move(b, begin, end, delta), move(e, begin, end, delta)) for b, e in spans]
+
+    def replace_all(self, edits):
+        """
+        Replace several portions of the text at once.
+
+        The `(begin, end, text)` edits are sorted and apart from each other.  The text is rebuilt once,
+        and points are moved as if each portion was replaced on its own, from the last to the first.
+        """
+
+        if not edits:
+            return
+        pieces = []
+        last = 0
+        for begin, end, text in edits:
+            pieces.append(self.text[last:begin])
+            pieces.append(text)
+            last = end
+        pieces.append(self.text[last:])
+        self.text = ''.join(pieces)
+
+        begins = [edit[0] for edit in edits]
+        shifts = list(accumulate(len(text) - (end - begin) for begin, end, text in edits))
+
+        def moved(pt):
+            """Move a point past the edits that start before it."""
+
+            index = bisect_left(begins, pt)
+            if not index:
+                return pt
+            begin, end, text = edits[index - 1]
+            return move(pt, begin, end, len(text) - (end - begin)) + (shifts[index - 2] if index > 1 else 0)
+
+        self.selection.regions = [Region(moved(r.a), moved(r.b)) for r in self.selection.regions]
+        for selector, spans in self.scopes.items():
+            self.scopes[selector] = [(moved(b), moved(e)) for b, e in spans]
+
+    def sel(self):
+        """Get the selections."""
+
+        return self.selection
+
+    def find_by_selector(self, selector):
+        """Get the regions of the scope."""
+
+        return [Region(begin, end) for begin, end in self.scopes.get(selector, [])]
+
+    def score_selector(self, pt, selector):
+        """Score how well the scope at the point matches the selector."""
+
+        for begin, end in self.scopes.get(selector, []):
+            if begin <= pt < end:
+                return 1
+        return 0
+
+    def show(self, pt):
+        """Show the point; there is nothing to scroll."""
+
+    def disable_tab_translation(self):
+        """Disable tab translation while replacing; text is replaced as given."""
+
+        return False
+
+    def restore_tab_translation(self, state):
+        """Restore tab translation."""
@@ -0,0 +1,132 @@
+"""
+Reg Replace.
+
+Licensed under MIT
+Copyright (c) 2011 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+from collections import OrderedDict, namedtuple
+import threading
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+DEFAULT_CACHE_SIZE = 512
+
+# Maximum widths at or above this are unbounded
+MAXREPEAT = sre_parse.MAXREPEAT
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'size', 'maxsize'])
+
+
+class CachedError(object):
+    """Wrapper for a compile error so it can be raised again on a cache hit."""
+
+    def __init__(self, err):
+        """Initialize."""
+
+        self.err = err
+
+
+class PatternCache(object):
+    """
+    Process wide LRU cache of compiled find patterns.
+
+    Patterns are keyed by engine, pattern, flags, and the `regex` version flag.
+    Compile errors are cached as well so that a bad rule fails fast on every run.
+    """
+
+    maxsize = DEFAULT_CACHE_SIZE
+    hits = 0
+    misses = 0
+    _cache = OrderedDict()
+    _lock = threading.RLock()
+
+    @classmethod
+    def clear(cls):
+        """Clear the cache and reset the counters."""
+
+        with cls._lock:
+            cls._cache.clear()
+            cls.hits = 0
+            cls.misses = 0
+
+    @classmethod
+    def resize(cls, maxsize):
+        """Set the maximum number of cached entries."""
+
+        with cls._lock:
+            cls.maxsize = max(0, int(maxsize))
+            while len(cls._cache) > cls.maxsize:
+                cls._cache.popitem(last=False)
+
+    @classmethod
+    def info(cls):
+        """Get cache statistics."""
+
+        with cls._lock:
+            return CacheInfo(cls.hits, cls.misses, len(cls._cache), cls.maxsize)
+
+    @classmethod
+    def lookup(cls, key, factory):
+        """
+        Get the cached value for the key or create it with the factory.
+
+        Exceptions raised by the factory are cached and re-raised on subsequent lookups.
+        The factory runs without the lock held so that a slow compile doesn't hold up
+        other lookups; if two threads create the same value, the first one stored is kept.
+        """
+
+        with cls._lock:
+            value = cls._cache.get(key)
+            if value is not None:
+                cls.hits += 1
+                cls._cache.move_to_end(key)
+            else:
+                cls.misses += 1
+
+        if value is None:
+            try:
+                value = factory()
+            except Exception as err:
+                value = CachedError(err)
+            with cls._lock:
+                stored = cls._cache.get(key)
+                if stored is not None:
+                    value = stored
+                elif cls.maxsize:
+                    cls._cache[key] = value
+                    if len(cls._cache) > cls.maxsize:
+                        cls._cache.popitem(last=False)
+
+        if isinstance(value, CachedError):
+            raise value.err.with_traceback(None)
+        return value
+
+    @classmethod
+    def compile(cls, engine, find, flags=0, version_flag=0):
+        """
+        Compile the find pattern with the given engine.
+
+        Backrefs engines (`bre` and `bregex`) use `compile_search`, others use `compile`.
+        """
+
+        key = ('compile', engine.__name__, find, flags, version_flag)
+        compile_search = getattr(engine, 'compile_search', engine.compile)
+        return cls.lookup(key, lambda: compile_search(find, flags | version_flag))
+
+    @classmethod
+    def escape(cls, engine, text):
+        """Escape literal text with the given engine."""
+
+        return cls.lookup(('escape', engine.__name__, text), lambda: engine.escape(text))
+
+    @classmethod
+    def width(cls, find, flags=0):
+        """
+        Get the minimum and maximum width of a match of the find pattern.
+
+        Widths are computed with the `re` parser; patterns it can't parse raise an error.
+        """
+
+        return cls.lookup(('width', find, flags), lambda: tuple(sre_parse.parse(find, flags).getwidth()))
@@ -58,6 +58,8 @@ class ConvertPythonSrc2Obj(object):
     bool_keys = (
         'greedy', 'greedy_scope', 'format_replace', 'selection_inputs', 'multi_pass', 'literal', 'literal_ignorecase]'
     )
+    int_keys = ('multi_pass_margin',)
+    number_keys = ('timeout',)
     allowed_keys = (
         'literal',
         'literal_ignorecase',
@@ -68,6 +70,8 @@ class ConvertPythonSrc2Obj(object):
         'greedy',
         'greedy_scope',
         'multi_pass',
+        'multi_pass_margin',
+        'timeout',
         'scope',
         'scope_filter',
         'plugin',
@@ -150,6 +154,14 @@ class ConvertPythonSrc2Obj(object):
                             obj[name] = compile_expr(snippet.value)
                         elif name in self.bool_keys and class_name == 'Name' and snippet.value.id in ('True', 'False'):
                             obj[name] = compile_expr(snippet.value)
+                        elif name in self.int_keys and class_name == 'Num':
+                            value = compile_expr(snippet.value)
+                            if isinstance(value, int) and value >= 0:
+                                obj[name] = value
+                        elif name in self.number_keys and class_name == 'Num':
+                            value = compile_expr(snippet.value)
+                            if isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0:
+                                obj[name] = value
                         elif name == 'scope_filter' and class_name == 'List':
                             if all(ast_class(l) == 'Str' for l in snippet.value.elts):
                                 obj[name] = compile_expr(snippet.value)
@@ -472,6 +484,24 @@ class RegReplaceEditRegexCommand(sublime_plugin.WindowCommand):
             boolean = '%s = None\n' % name
         return boolean
 
+    def format_int(self, name, value):
+        """Format an integer."""
+
+        if value is not None and isinstance(value, int) and not isinstance(value, bool):
+            integer = '%s = %d\n' % (name, value)
+        else:
+            integer = '%s = None\n' % name
+        return integer
+
+    def format_number(self, name, value):
+        """Format a number."""
+
+        if value is not None and isinstance(value, (int, float)) and not isinstance(value, bool):
+            number = '%s = %r\n' % (name, value)
+        else:
+            number = '%s = None\n' % name
+        return number
+
     def parse_array(self, value, indent):
         """Parse array."""
 
@@ -608,6 +638,14 @@ class RegReplaceEditRegexCommand(sublime_plugin.WindowCommand):
             text += '#    and replace all instances of the regex when regex cannot be formatted to find\n'
             text += '#    all instances. Since a replace can change a scope, this can be useful.\n'
             text += self.format_bool('multi_pass', rule.get('multi_pass'))
+            text += '\n# multi_pass_margin (int): How far, in characters, a match can reach around an earlier edit.\n'
+            text += '#    Multi-pass sweeps only rescan around the edits of the previous sweep, and the margin is\n'
+            text += '#    normally worked out from the pattern.  Set this to allow rules with unbounded\n'
+            text += '#    repeats to be rescanned this way instead of scanning the whole buffer.\n'
+            text += self.format_int('multi_pass_margin', rule.get('multi_pass_margin'))
+            text += '\n# timeout (float): Time budget of the rule in seconds; overrides the "rule_timeout" setting.\n'
+            text += '#    A rule that runs out of time is aborted.  Set to 0 for no budget.\n'
+            text += self.format_number('timeout', rule.get('timeout'))
             text += '\n# plugin (str): Define replace plugin for more advanced replace logic.\n'
             text += self.format_string('plugin', rule.get('plugin'))
             text += '\n# args (dict): Arguments for \'plugin\'.\n'
@@ -616,7 +654,7 @@ class RegReplaceEditRegexCommand(sublime_plugin.WindowCommand):
             text += '# test: Here you can setup a test command.  This is not saved and is just used for this session.\n'
             text += '#     - replacements ([str]): A list of regex rules to sequence together.\n'
             text += '#     - find_only (bool): Highlight current find results and prompt for action.\n'
-            text += '#     - action (str): Apply the given action (fold|unfold|mark|unmark|select).\n'
+            text += '#     - action (str): Apply the given action (fold|unfold|mark|unmark|select|count).\n'
             text += '#       This overrides the default replace action.\n'
             text += '#     - options (dict): optional parameters for actions (see documentation for more info).\n'
             text += '#         - key (str): Unique name for highlighted region.\n'
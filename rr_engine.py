@@ -0,0 +1,1841 @@
+"""
+Reg Replace.
+
+Licensed under MIT
+Copyright (c) 2011 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+import backrefs
+from RegReplace.rr_buffer import Region
+from RegReplace.rr_cache import PatternCache, MAXREPEAT
+from RegReplace.rr_template import compile_template, parse_re_template, LiteralTemplate, GroupTemplate
+from RegReplace.rr_shadow import ShadowBuffer, trim_edit
+from RegReplace.rr_regions import ScopeFilter, RegionSet, DirtyRegions, ChunkHashes, digest
+from RegReplace.rr_rules import RuleRegistry
+from RegReplace.rr_fuse import FusedGroup, RuleChars, fuse_sequence
+from RegReplace.rr_pattern import pattern_chars, contains
+from RegReplace.rr_profile import NULL_PROFILE
+from RegReplace.rr_scan import ScanPool, MIN_PARALLEL_SIZE, batch_regions, search_strings
+from backrefs import bre
+import re
+import time
+import traceback
+import string
+import importlib
+from collections import deque
+from bisect import bisect_right
+from itertools import chain
+try:
+    import regex
+    from backrefs import bregex
+    REGEX_SUPPORT = True
+except ImportError:
+    regex = None
+    bregex = None
+    REGEX_SUPPORT = False
+
+FORMAT_REPLACE = backrefs.__version_info__ >= (2, 1, 0)
+
+# Lookarounds look at text outside of the match, so their patterns' widths don't bound what they look at.
+RE_LOOKAROUND = re.compile(r'\(\?<?[=!]')
+
+
+class RegexInputFormatter(string.Formatter):
+    """Regex input formatter."""
+
+    def __init__(self, engine):
+        """Initialize."""
+
+        self._engine = engine
+        self.implicit = -1
+        self.explicit = False
+        super(RegexInputFormatter, self).__init__()
+
+    def convert_field(self, value, conversion):
+        """Convert to escaped format."""
+
+        if conversion is not None and conversion == 'e':
+            return PatternCache.escape(self._engine, value)
+        return super(RegexInputFormatter, self).convert_field(value, conversion)
+
+    def get_value(self, key, args, kwargs):
+        """Get value."""
+
+        if key == '':
+            if not self.explicit:
+                self.implicit += 1
+                key = self.implicit
+            else:
+                raise ValueError("Cannot change from explicit index to implicit!")
+        elif self.implicit >= 0:
+            raise ValueError("Cannot change from implict to explicit indexing!")
+        return super(RegexInputFormatter, self).get_value(key, args, kwargs)
+
+
+class Cancelled(BaseException):
+    """
+    Raised at a checkpoint to stop a run that has been cancelled.
+
+    This is not an `Exception`, so the error handling around each rule doesn't catch it.
+    """
+
+
+class TimedOut(BaseException):
+    """
+    Raised at a checkpoint when a rule runs past its time budget, or the sequence past its own.
+
+    Like `Cancelled`, this gets past the error handling around each rule; the sequence aborts the rule.
+    """
+
+
+class SequenceResult(object):
+    """
+    Outcome of applying a sequence of rules.
+
+    `counts` holds `[name, replaced]` for each rule of the sequence that was found, in order,
+    summed over all sweeps.  `fused` holds the names of each group of rules that was fused,
+    and `cycle` holds the names of the rules going around in a cycle and how many sweeps
+    the cycle takes, if a multi-pass sequence was stopped because of one.  `timed_out` holds
+    the names of the rules that were aborted for running past their time budget, and `out_of_time`
+    the name of the step that was running (or next) when the sequence ran past its own.
+    """
+
+    def __init__(self):
+        """Initialize."""
+
+        self.counts = []
+        self.not_found = []
+        self.fused = []
+        self.cycle = None
+        self.sweeps = 0
+        self.timed_out = []
+        self.out_of_time = None
+
+    @property
+    def total(self):
+        """Get the total number of replacements."""
+
+        return sum(count for name, count in self.counts)
+
+
+class ScopeRepl(object):
+    """
+    Replace object for scopes.
+
+    Call on_replace event if there is a plugin to run.
+    """
+
+    def __init__(self, has_plugin, replace, expand, replace_event):
+        """Initialize."""
+
+        self.has_plugin = has_plugin
+        self.replace = replace
+        self.expand = expand
+        self.replace_event = replace_event
+
+    def repl(self, m):
+        """Apply replace."""
+
+        return self.replace_event(m) if self.has_plugin else self.expand(m, self.replace)
+
+
+class EngineOptions(object):
+    """
+    The engine's settings, resolved once.
+
+    Engines can share the options until the settings change.  `key` identifies the engine configuration
+    that compiled patterns depend on.
+    """
+
+    __slots__ = (
+        'extend', 'use_regex', 'regex_version_flag', 'sel_input_max_size', 'sel_input_max_count',
+        'rule_timeout', 'sequence_timeout', 'scan_threads', 'key'
+    )
+
+    def __init__(self, settings):
+        """Resolve the settings."""
+
+        self.extend = bool(settings.get("extended_back_references", False))
+        self.use_regex = bool(settings.get('use_regex_module', False)) and REGEX_SUPPORT
+        self.sel_input_max_size = int(settings.get('selection_input_max_size', 256))
+        self.sel_input_max_count = int(settings.get('selection_input_max_count', 10))
+        if self.use_regex:
+            regex_version = int(settings.get('regex_module_version', 0))
+            if regex_version > 1:
+                regex_version = 0
+            self.regex_version_flag = bregex.VERSION1 if regex_version else bregex.VERSION0
+        else:
+            self.regex_version_flag = 0
+        self.rule_timeout = float(settings.get('rule_timeout', 0))
+        self.sequence_timeout = float(settings.get('sequence_timeout', 0))
+        self.scan_threads = max(0, int(settings.get('scan_threads', 0)))
+        self.key = (self.extend, self.use_regex, self.regex_version_flag)
+
+
+class ReplaceEngine(object):
+    """
+    Find and replace using regex.
+
+    The engine works on a buffer object instead of the editor, so it can run anywhere.
+    The buffer provides `size()`, `substr(begin, end)`, `replace(begin, end, text)`, `replace_all(edits)`,
+    `sel()`, `find_by_selector(selector)`, `score_selector(pt, selector)`, `show(pt)`,
+    `disable_tab_translation()`, and `restore_tab_translation(state)`
+    (see `rr_buffer.TextBuffer`).  Regions are created with `Region`, which can be
+    replaced with any class with the same constructor and `begin()`, `end()`, and `size()`.
+    If a `profiler` (`rr_profile.Profiler`) is given, the time spent in each phase of each rule is recorded.
+
+    A run can be stopped from another thread by setting `cancelled` to a `threading.Event` before the run
+    and setting the event: `Cancelled` is raised before the next rule or match.  If set, `progress` is
+    called with the name of each step of a sequence, its index, the number of steps, and the sweep.
+
+    The settings can be given as `EngineOptions`, and the rules as a `rr_rules.RuleRegistry` so what is
+    compiled for each rule is kept between runs; a dictionary of rule definitions works as well.
+
+    Rules can be given a time budget (`rule_timeout`, or the rule's own `timeout`, in seconds), and so can
+    the sequence (`sequence_timeout`).  The budget is checked after each match, and `regex` module searches
+    are given what is left of it as their `timeout`, so even a search that backtracks forever is stopped.
+    A rule that runs out of time is aborted: its replacements are dropped when using a shadow buffer.
+
+    With the `regex` module, the regions of greedy scope rules and the selections of `selection_only` runs
+    can be searched in parallel on `scan_threads` threads (see `scan_regions`); the matches are still
+    expanded, and the buffer edited, in order on the calling thread.
+
+    A `find_only` run keeps what each regex rule that targets all of its matches found in `found`.  Given
+    to a later run on the same buffer as `reuse`, the rules use it instead of searching again, until the
+    run first edits the buffer (see `reusable`).
+    """
+
+    Region = Region
+
+    # Methods timed as a phase when profiling
+    PROFILED = (
+        ('compile', ('compile_find', 'compile_scope_find', 'get_template')),
+        ('scan', ('scan_regions',)),
+        ('scope', ('find_by_selector',)),
+        ('expand', ('expand',)),
+        ('plugin', ('on_replace',)),
+        ('edit', ('replace_region', 'flush', 'commit'))
+    )
+
+    def __init__(
+        self, buffer, settings, find_only, full_file, selection_only, max_sweeps, action, shadow=False, profiler=None
+    ):
+        """Initialize find replace object."""
+
+        self.buffer = buffer
+        self.find_only = find_only
+        self.full_file = full_file
+        self.selection_only = selection_only
+        self.max_sweeps = max_sweeps
+        self.action = action
+        self.target_regions = []
+        self.plugin = None
+        self.expander = None
+        self.shadow = ShadowBuffer(buffer.substr(0, buffer.size())) if shadow else None
+        self.pending = []
+        self.selectors = {}
+        self.dirty = None
+        self.hashes = None
+        self.copy = None
+        self.changed = None
+        self.margin = None
+        self.batch = []
+        self.rule = None
+        self.found = {} if find_only else None
+        self.reuse = None
+        self.edited = False
+        self.edits = 0
+        self.options = options = settings if isinstance(settings, EngineOptions) else EngineOptions(settings)
+        self.extend = options.extend
+        self.use_regex = options.use_regex
+        self.sel_input_max_size = options.sel_input_max_size
+        self.sel_input_max_count = options.sel_input_max_count
+        self.use_format = (self.extend or self.use_regex) and FORMAT_REPLACE
+        self.regex_version_flag = options.regex_version_flag
+        self.extend_module = bregex if self.use_regex else bre
+        self.normal_module = regex if self.use_regex else re
+        self.rule_timeout = options.rule_timeout
+        self.sequence_timeout = options.sequence_timeout
+        self.scan_threads = options.scan_threads if self.use_regex else 0
+        self.deadline = None
+        self.sequence_deadline = None
+        self.budget = None
+        self.cancelled = None
+        self.progress = None
+        self.profiler = profiler
+        if profiler is not None:
+            profiler.info.update(
+                {
+                    'engine': 'regex' if self.use_regex else 're',
+                    'extended_back_references': self.extend,
+                    'shadow_buffer': self.shadow is not None
+                }
+            )
+            for phase, names in self.PROFILED:
+                for name in names:
+                    setattr(self, name, profiler.timed(phase, getattr(self, name)))
+
+    def timed(self, phase, func):
+        """Count calls of the function toward the phase when profiling."""
+
+        return func if self.profiler is None else self.profiler.timed(phase, func)
+
+    def scan(self, matches, size):
+        """
+        Count the `size` characters searched and the matches found when profiling.
+
+        Check for cancellation and the time budget after each match.
+        """
+
+        if self.profiler is not None:
+            matches = self.profiler.scan(matches, size)
+        if self.cancelled is not None or self.deadline is not None:
+            matches = self.checked(matches)
+        return matches
+
+    def checked(self, matches):
+        """Check for cancellation and the time budget after each match."""
+
+        try:
+            for m in matches:
+                self.checkpoint()
+                yield m
+            # A slow scan that found nothing still has to be caught
+            self.checkpoint()
+        except TimeoutError:
+            # A `regex` module search ran out of the time it was given
+            raise TimedOut()
+
+    def checkpoint(self):
+        """Stop the run if it has been cancelled, or the rule if it is out of time."""
+
+        if self.cancelled is not None and self.cancelled.is_set():
+            raise Cancelled()
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise TimedOut()
+
+    def time_left(self):
+        """Get the keyword arguments that limit a `regex` module search to what is left of the time budget."""
+
+        if self.deadline is None or not self.use_regex:
+            return {}
+        # The `regex` module doesn't time out with a timeout of zero
+        return {'timeout': max(self.deadline - time.perf_counter(), 0.000001)}
+
+    def start_budget(self):
+        """Start the sequence's time budget."""
+
+        self.sequence_deadline = time.perf_counter() + self.sequence_timeout if self.sequence_timeout > 0 else None
+
+    def out_of_time(self):
+        """Check if the sequence has run past its time budget."""
+
+        return self.sequence_deadline is not None and time.perf_counter() >= self.sequence_deadline
+
+    def set_deadline(self, patterns):
+        """
+        Set when the rules about to run are out of time.
+
+        A fused group gets the sum of its rules' budgets; a rule without a budget is only limited by the
+        sequence's.  `budget` records which of the two budgets the deadline belongs to.
+        """
+
+        self.deadline = self.sequence_deadline
+        self.budget = 'sequence' if self.deadline is not None else None
+        budgets = [self.rule_timeout if rule.timeout is None else rule.timeout for rule in patterns]
+        if all(budget > 0 for budget in budgets):
+            deadline = time.perf_counter() + sum(budgets)
+            if self.deadline is None or deadline < self.deadline:
+                self.deadline = deadline
+                self.budget = 'rule'
+
+    def abort(self, regions):
+        """
+        Drop what the rule that ran out of time did, as far as possible.
+
+        Replacements waiting for the shadow buffer are dropped, as are the regions the rule found
+        (the first `regions` found before the rule are kept).  Without a shadow buffer, a scope rule
+        keeps the replacements it already made in the scopes it finished.
+        """
+
+        del self.target_regions[regions:]
+        if self.shadow is not None:
+            self.pending = []
+            self.batch = []
+        else:
+            # The edits were made; later sweeps still need to rescan around them
+            self.track([])
+
+    def profile_rule(self, key, name):
+        """Count what happens in the block toward the rule when profiling."""
+
+        return NULL_PROFILE if self.profiler is None else self.profiler.rule(key, name)
+
+    def error(self, msg):
+        """Report an error."""
+
+        print('RegReplace: %s' % msg)
+
+    def load_plugin(self, module_name):
+        """Load a replace plugin module."""
+
+        return importlib.import_module(module_name)
+
+    def replace_region(self, region, replacement, original=None):
+        """
+        Replace in the buffer.
+
+        Only the part of the region that changes is replaced, and a replacement that changes nothing
+        isn't made at all, so the buffer isn't modified, and undo, marks, and folds are left alone, where
+        the text stays the same.  `original` is the region's current text, if the caller has it already.
+        When using a shadow buffer, the replace is queued until the rule is done.
+        """
+
+        begin = region.begin()
+        end = region.end()
+        if self.dirty is not None:
+            # Multi-pass sweeps rescan around every replacement, whether or not it changed anything
+            self.batch.append((begin, end, len(replacement)))
+        trim = trim_edit(self.substr(region) if original is None else original, replacement)
+        if trim is None:
+            return
+        self.edited = True
+        self.edits += 1
+        prefix, suffix = trim
+        begin += prefix
+        end -= suffix
+        replacement = replacement[prefix:len(replacement) - suffix]
+        if self.shadow is not None:
+            self.pending.append((begin, end, replacement))
+        else:
+            self.buffer.replace(begin, end, replacement)
+
+    def replace_scope(self, region, string, extraction, edits=None):
+        """
+        Replace the text of a scope region, `string`, with the extraction made from it.
+
+        If the `(begin, end, size)` of the `edits` that made the extraction are known, each is replaced
+        on its own, so the text between them isn't replaced.
+        """
+
+        if edits is None:
+            self.replace_region(region, extraction, string)
+            return
+        start = region.begin()
+        shift = 0
+        replacements = []
+        for begin, end, size in sorted(edits):
+            replacements.append((begin, end, extraction[begin + shift:begin + shift + size]))
+            shift += size - (end - begin)
+        for begin, end, text in reversed(replacements):
+            self.replace_region(self.Region(start + begin, start + end), text, string[begin:end])
+
+    def disable_tab_translation(self):
+        """Disable tab translation while replacing and return whether it was enabled."""
+
+        if self.shadow is not None:
+            return False
+        return self.buffer.disable_tab_translation()
+
+    def restore_tab_translation(self, tabs_to_spaces):
+        """Restore tab translation."""
+
+        if tabs_to_spaces:
+            self.buffer.restore_tab_translation(tabs_to_spaces)
+
+    def substr(self, region):
+        """Get the text of the region from the buffer or shadow buffer."""
+
+        if self.shadow is not None:
+            return self.shadow.substr(region.begin(), region.end())
+        return self.buffer.substr(region.begin(), region.end())
+
+    def size(self):
+        """Get the size of the buffer or shadow buffer."""
+
+        return self.shadow.size() if self.shadow is not None else self.buffer.size()
+
+    def to_current_region(self, region):
+        """Map a region of the buffer to the shadow buffer."""
+
+        if self.shadow is None:
+            return region
+        return self.Region(self.shadow.to_current(region.begin()), self.shadow.to_current(region.end(), True))
+
+    def find_by_selector(self, scope):
+        """
+        Find regions by scope; map them to the shadow buffer if required.
+
+        With a shadow buffer, the buffer isn't edited until the shadow buffer is committed,
+        so the buffer's regions for each scope are only looked up once until then.
+        """
+
+        if self.shadow is None:
+            return self.buffer.find_by_selector(scope)
+        regions = self.selectors.get(scope)
+        if regions is None:
+            regions = self.selectors[scope] = list(self.buffer.find_by_selector(scope))
+        if self.shadow.modified():
+            return [self.to_current_region(region) for region in regions]
+        return list(regions)
+
+    def score_selector(self, pt, scope):
+        """Score the scope at the given point; map the point to the buffer if required."""
+
+        if self.shadow is not None:
+            pt = self.shadow.to_original(pt)
+        return self.buffer.score_selector(pt, scope)
+
+    def show(self, pt):
+        """Show the point in the buffer."""
+
+        if self.shadow is not None:
+            pt = self.shadow.to_original(pt)
+        self.buffer.show(pt)
+
+    def flush(self):
+        """Apply queued replacements to the shadow buffer."""
+
+        if self.pending:
+            self.shadow.apply(self.pending)
+            self.pending = []
+
+    def commit(self):
+        """Apply the shadow buffer to the buffer with an edit per changed span."""
+
+        if self.shadow is None or not self.shadow.modified():
+            return
+        tabs_to_spaces = self.buffer.disable_tab_translation()
+        self.buffer.replace_all(self.shadow.hunks())
+        self.restore_tab_translation(tabs_to_spaces)
+        self.shadow = ShadowBuffer(self.shadow.text)
+        self.selectors = {}
+
+    def track_edits(self):
+        """Track edits so later multi-pass sweeps only rescan the text around them."""
+
+        self.dirty = DirtyRegions()
+        if self.shadow is None:
+            # Without a shadow buffer, hashing the whole buffer would mean copying it out of the view
+            self.hashes = ChunkHashes()
+
+    def track(self, keys):
+        """Record the edits of the rules that just ran; the rules have now scanned the buffer."""
+
+        if self.dirty is None:
+            return
+        for key in keys:
+            self.dirty.scanned(key)
+        self.dirty.record(self.batch)
+        if self.hashes is not None:
+            self.hashes.record(self.batch)
+        self.batch = []
+
+    def sweep_margin(self, pattern):
+        """
+        Get how far around earlier edits a multi-pass sweep has to rescan for the pattern.
+
+        Returns `None` if the whole buffer has to be rescanned: the pattern searches in reverse,
+        can match an empty string, or has no bound on how much text it looks at (unless the rule
+        sets `multi_pass_margin`).  Widths are measured with the `re` parser, so patterns compiled
+        with the `regex` module, or that the `re` parser can't read, are always rescanned in full.
+        """
+
+        if self.use_regex:
+            return None
+        try:
+            low, high = PatternCache.width(pattern.pattern)
+        except Exception:
+            return None
+        if low == 0:
+            return None
+        if self.margin is not None:
+            return int(self.margin) + 1
+        if high >= MAXREPEAT or RE_LOOKAROUND.search(pattern.pattern):
+            return None
+        # Allow one more character for anchors and word boundaries
+        return high + 1
+
+    def sweep_windows(self, changed, margin):
+        """Get the windows to rescan around the changed spans."""
+
+        windows = []
+        for begin, end in changed:
+            begin = max(0, begin - margin)
+            end += margin
+            if windows and begin <= windows[-1][1]:
+                windows[-1][1] = end
+            else:
+                windows.append([begin, end])
+        return windows
+
+    def finditer(self, pattern, string, windows=None, margin=0):
+        """
+        Iterate the matches of the pattern, optionally only the ones starting in the given windows.
+
+        Windows are scanned as if scanning the whole string: a window starts no earlier than
+        the end of the last match.  Only patterns that can't match an empty string, and that
+        look at no more than `margin` characters, are scanned by window.
+        """
+
+        if windows is None:
+            return self.scan(pattern.finditer(string, **self.time_left()), len(string))
+        size = len(string)
+        scanned = sum(min(end + margin, size) - begin for begin, end in windows)
+        return self.scan(self.search_windows(pattern, string, windows, margin), scanned)
+
+    def search_windows(self, pattern, string, windows, margin):
+        """Iterate the matches of the pattern that start in the windows."""
+
+        size = len(string)
+        pos = 0
+        for begin, end in windows:
+            pos = max(begin, pos)
+            # Don't search past what a match starting in the window can look at
+            endpos = min(end + margin, size)
+            while pos < end:
+                m = pattern.search(string, pos, endpos, **self.time_left())
+                if m is None or m.start(0) >= end:
+                    break
+                if m.end(0) >= endpos - 1 and endpos < size:
+                    # The match may depend on where the search stopped; match it against the whole string
+                    m = pattern.match(string, m.start(0), **self.time_left())
+                    if m is None:
+                        pos += 1
+                        continue
+                pos = m.end(0)
+                yield m
+
+    def scan_regions(self, pattern, regions, first=False):
+        """
+        Search the regions in parallel on the scan threads, or only for the `first` match in each.
+
+        Returns the text and the matches of each region, or `None` if the regions are to be searched one at
+        a time: without the `regex` module (Python's `re` holds the GIL while it searches), with fewer than
+        two threads, or when there is too little text for threads to help.  All the regions are searched
+        before any is edited, so this is only for regions that don't overlap.
+        """
+
+        if self.scan_threads < 2 or len(regions) < 2:
+            return None
+        sizes = [region.size() for region in regions]
+        if sum(sizes) < MIN_PARALLEL_SIZE:
+            return None
+        self.checkpoint()
+        strings = [self.substr(region) for region in regions]
+        kwargs = self.time_left()
+        pool = ScanPool.get(self.scan_threads)
+        futures = [
+            pool.submit(search_strings, pattern, strings[begin:end], first, kwargs, self.cancelled)
+            for begin, end in batch_regions(sizes, self.scan_threads)
+        ]
+        try:
+            found = list(chain.from_iterable(future.result() for future in futures))
+        except TimeoutError:
+            # A search ran out of the time it was given
+            raise TimedOut()
+        finally:
+            for future in futures:
+                future.cancel()
+        self.checkpoint()
+        return [(string, self.scan(matches, len(string))) for string, matches in zip(strings, found)]
+
+    def close(self):
+        """Clean up for the object."""
+
+    def on_replace(self, m):
+        """Run the associated plugin on the replace event."""
+
+        try:
+            module = self.load_plugin(self.plugin)
+            text = module.replace(m, **self.plugin_args)
+        except Exception:
+            text = m.group(0)
+            print(str(traceback.format_exc()))
+        return text
+
+    def filter_by_selection(self, regions, extractions=None):
+        """Filter results by what is included in selected region."""
+
+        return RegionSet.from_regions(self.buffer.sel()).filter(regions, extractions)
+
+    def get_sel_point(self):
+        """See if there is a cursor and get the first selections starting point."""
+
+        sel = self.buffer.sel()
+        pt = None if len(sel) == 0 else sel[0].begin()
+        if pt is not None and self.shadow is not None:
+            pt = self.shadow.to_current(pt)
+        return pt
+
+    def get_scope_filter(self, rule):
+        """Get the rule's scope filter; qualifying matches is counted as scope time when profiling."""
+
+        scope_filter = ScopeFilter(rule.scope_filter, self.find_by_selector)
+        if self.profiler is not None:
+            scope_filter.qualify = self.timed('scope', scope_filter.qualify)
+        return scope_filter
+
+    def qualify_by_scope(self, region, scope_filter):
+        """Qualify the match with scopes."""
+
+        return scope_filter.qualify(region.begin(), region.end())
+
+    def greedy_replace(self, matches, regions, scope_filter):
+        """Perform a greedy replace."""
+
+        # Initialize replace
+        replaced = 0
+
+        if self.find_only or self.action is not None:
+            # If "find only" or replace action is overridden, just track regions
+            for region in reversed(regions):
+                # Does the scope qualify?
+                qualify = self.qualify_by_scope(region, scope_filter) if scope_filter else True
+                if qualify:
+                    replaced += 1
+                    self.target_regions.append(region)
+            return replaced
+
+        # Step through all targets and qualify them for replacement.
+        # Only expand replacements for qualifying targets, and do it in order so plugins see matches in order.
+        targets = []
+        for region, m in zip(regions, matches):
+            # Does the scope qualify?
+            qualify = self.qualify_by_scope(region, scope_filter) if scope_filter else True
+            if qualify:
+                targets.append((region, self.expander(m), m.group(0)))
+
+        # Apply replace
+        tabs_to_spaces = self.disable_tab_translation()
+        for region, text, original in reversed(targets):
+            self.replace_region(region, text, original)
+        self.restore_tab_translation(tabs_to_spaces)
+        return len(targets)
+
+    def cursor_order(self, regions):
+        """
+        Get the indexes of the sorted regions in the order a non-greedy rule visits them.
+
+        The walk starts at the first region that ends after the cursor and wraps around once.
+        """
+
+        pt = self.get_sel_point()
+        start = 0 if pt is None else bisect_right([region.end() for region in regions], pt)
+        return chain(range(start, len(regions)), range(start))
+
+    def non_greedy_replace(self, matches, regions, scope_filter):
+        """Perform a non-greedy replace."""
+
+        regions = list(regions)
+        for index in self.cursor_order(regions):
+            # Does the scope qualify?
+            qualify = self.qualify_by_scope(regions[index], scope_filter) if scope_filter else True
+            if qualify:
+                return self.replace_next(regions[index], matches[index])
+        return 0
+
+    def replace_next(self, region, m):
+        """Show and replace (or track) the match selected by a non-greedy rule."""
+
+        self.show(region.begin())
+        if self.find_only or self.action is not None:
+            # If "find only" or replace action is overridden, just track regions
+            self.target_regions.append(region)
+        else:
+            # Apply replace
+            tabs_to_spaces = self.disable_tab_translation()
+            self.replace_region(region, self.expander(m), m.group(0))
+            self.restore_tab_translation(tabs_to_spaces)
+        return 1
+
+    def can_span_lines(self, pattern):
+        """
+        Check if the pattern might match across a line break.
+
+        This is worked out from the pattern as parsed by the `re` parser, so patterns compiled
+        with the `regex` module, or that the parser can't read, are assumed to.
+        """
+
+        if self.use_regex:
+            return True
+        try:
+            return contains(pattern_chars(pattern.pattern, pattern.flags).consumed, '\n')
+        except Exception:
+            return True
+
+    def regex_find_next(self, find, flags, replace, literal, scope_filter):
+        """
+        Replace (or track) the first qualifying match that ends after the cursor, wrapping around once.
+
+        If matches can't span lines, the search starts on the cursor's line, as it will
+        find the same matches there as a search from the start of the buffer.
+        """
+
+        offset, bfr = self.get_buffer()
+        pattern = self.compile_find(find, flags, literal)
+        self.set_expander(pattern, replace, literal)
+        pt = self.get_sel_point()
+
+        if self.is_reverse(pattern):
+            # Reverse searches are selected from the full set of matches
+            matches = deque()
+            regions = self.collect_matches(pattern, bfr, offset, matches)
+            return self.non_greedy_replace(matches, regions, scope_filter) if regions else 0
+
+        anchor = 0
+        if pt is not None and not self.can_span_lines(pattern):
+            anchor = bfr.rfind('\n', 0, pt) + 1
+
+        selected = None
+        for m in self.scan(pattern.finditer(bfr, anchor, **self.time_left()), len(bfr) - anchor):
+            if not scope_filter or scope_filter.qualify(m.start(0), m.end(0)):
+                if pt is None or m.end(0) > pt:
+                    return self.replace_next(self.Region(m.start(0), m.end(0)), m)
+                if selected is None:
+                    selected = m
+
+        if anchor:
+            # Wrap around and search the lines before the cursor's line
+            for m in self.scan(pattern.finditer(bfr, **self.time_left()), anchor):
+                if m.start(0) >= anchor:
+                    break
+                if not scope_filter or scope_filter.qualify(m.start(0), m.end(0)):
+                    selected = m
+                    break
+
+        if selected is None:
+            return 0
+        return self.replace_next(self.Region(selected.start(0), selected.end(0)), selected)
+
+    def get_template(self, pattern, replace):
+        """Get the compiled replace template for the current rule; the rule keeps its own template."""
+
+        engine = self.extend_module if self.extend else self.normal_module
+        rule = self.rule
+        if rule is not None and replace is rule.replace:
+            return rule.memo(
+                ('template', self.options.key, pattern, self.format),
+                lambda: compile_template(engine, pattern, replace, self.format)
+            )
+        return compile_template(engine, pattern, replace, self.format)
+
+    def expand(self, m, replace):
+        """Apply replace."""
+
+        return self.template.expand(m)
+
+    def get_buffer(self, sel=None):
+        """Get the buffer (or the selection's portion of it) and its offset."""
+
+        if sel is not None:
+            return sel.begin(), self.substr(self.Region(sel.begin(), sel.end()))
+        if self.shadow is not None:
+            return 0, self.shadow.text
+        if self.copy is None or self.copy[0] != self.edits:
+            # The buffer is only copied again once it has been edited
+            self.copy = (self.edits, self.substr(self.Region(0, self.size())))
+        return 0, self.copy[1]
+
+    def fingerprint(self):
+        """
+        Get a fingerprint of the buffer to tell if sweeps have brought it back to an earlier state.
+
+        A shadow buffer's text is hashed as a whole.  Otherwise, while edits are tracked, only the chunks
+        of the buffer that were edited since the last fingerprint are read and hashed again.
+        """
+
+        if self.hashes is None:
+            text = self.get_buffer()[1]
+            return len(text), digest(text)
+        size = self.size()
+        return size, self.hashes.update(lambda begin, end: self.substr(self.Region(begin, end)), size)
+
+    def compile_find(self, find, flags, literal=False):
+        """Compile the find pattern of a regex rule; the current rule keeps its own pattern."""
+
+        rule = self.rule
+        if rule is not None and find is rule.find:
+            return rule.memo(('find', self.options.key, flags), lambda: self.compile_pattern(find, flags, literal))
+        return self.compile_pattern(find, flags, literal)
+
+    def compile_pattern(self, find, flags, literal=False):
+        """Compile a find pattern."""
+
+        if self.extend:
+            flags |= self.extend_module.MULTILINE
+        else:
+            flags |= self.normal_module.MULTILINE
+        if literal:
+            find = PatternCache.escape(self.normal_module, find)
+        if self.extend and not literal:
+            return PatternCache.compile(self.extend_module, find, flags, self.regex_version_flag)
+        return PatternCache.compile(self.normal_module, find, flags, self.regex_version_flag)
+
+    def compile_scope_find(self, find, literal=False, literal_ignorecase=False):
+        """Compile the find pattern of a scope rule; the current rule keeps its own pattern."""
+
+        rule = self.rule
+        if rule is not None and find is rule.find:
+            return rule.memo(
+                ('scope_find', self.options.key),
+                lambda: self.compile_scope_pattern(find, literal, literal_ignorecase)
+            )
+        return self.compile_scope_pattern(find, literal, literal_ignorecase)
+
+    def compile_scope_pattern(self, find, literal=False, literal_ignorecase=False):
+        """Compile a scope find pattern."""
+
+        if literal:
+            return PatternCache.compile(
+                self.normal_module,
+                PatternCache.escape(self.normal_module, find),
+                self.normal_module.I if literal_ignorecase else 0,
+                self.regex_version_flag
+            )
+        if self.extend:
+            return PatternCache.compile(self.extend_module, find, 0, self.regex_version_flag)
+        return PatternCache.compile(self.normal_module, find, 0, self.regex_version_flag)
+
+    def is_reverse(self, pattern):
+        """Check if the pattern searches in reverse (`regex` module only)."""
+
+        return self.use_regex and bool(pattern.flags & regex.REVERSE)
+
+    def set_expander(self, pattern, replace, literal=False):
+        """Set how replacements are expanded for the current rule."""
+
+        if literal:
+            self.expander = self.timed('expand', LiteralTemplate(replace).expand)
+        elif self.plugin is not None:
+            self.expander = self.on_replace
+        else:
+            self.template = self.get_template(pattern, replace)
+            self.expander = self.timed('expand', self.template.expand)
+
+    def collect_matches(self, pattern, bfr, offset, matches, windows=None, margin=0, found=None):
+        """Collect the matches of the pattern (or the matches already `found`) and their regions in buffer order."""
+
+        regions = deque()
+        reverse = self.is_reverse(pattern)
+        for m in (self.finditer(pattern, bfr, windows, margin) if found is None else found):
+            if reverse:
+                regions.appendleft(self.Region(offset + m.start(0), offset + m.end(0)))
+                matches.appendleft(m)
+            else:
+                regions.append(self.Region(offset + m.start(0), offset + m.end(0)))
+                matches.append(m)
+        return regions
+
+    def regex_findall(self, find, flags, replace, matches, literal=False, sel=None, sweep=False):
+        """
+        Find all with regex.
+
+        Matches are collected so replacements can be expanded later,
+        and only for the targets that actually get replaced.
+        If this is a later multi-pass `sweep`, only the text around the edits since the rule's
+        last sweep is searched when possible.
+        """
+
+        offset, bfr = self.get_buffer(sel)
+        pattern = self.compile_find(find, flags, literal)
+        self.set_expander(pattern, replace, literal)
+        windows = None
+        margin = 0
+        if sweep:
+            margin = self.sweep_margin(pattern)
+            if margin is not None:
+                windows = self.sweep_windows(self.changed, margin)
+        return self.collect_matches(pattern, bfr, offset, matches, windows, margin)
+
+    def reusable(self, pattern, find, flags):
+        """
+        Get the regions and matches an earlier find found for the rule, if they still apply.
+
+        They apply if the run hasn't edited the buffer yet, the rule and its find pattern are the same,
+        and the whole buffer (or every selection) is to be searched: later multi-pass sweeps only search
+        around earlier edits.
+        """
+
+        if self.reuse is None or self.edited or self.changed is not None:
+            return None
+        found = self.reuse.get(pattern.name)
+        if found is None or found[0] is not pattern or found[1] != find or found[2] != flags:
+            return None
+        return found[3], found[4]
+
+    def regex_findall_selections(self, find, flags, replace, matches, literal, sels):
+        """Find all with regex under each selection, searching the selections in parallel when possible."""
+
+        sels = list(sels)
+        pattern = self.compile_find(find, flags, literal)
+        self.set_expander(pattern, replace, literal)
+        scanned = self.scan_regions(pattern, sels)
+        if scanned is None:
+            scanned = [(None, None)] * len(sels)
+        regions = []
+        for sel, (bfr, found) in zip(sels, scanned):
+            if found is None:
+                offset, bfr = self.get_buffer(sel)
+            else:
+                offset = sel.begin()
+            regions += self.collect_matches(pattern, bfr, offset, matches, found=found)
+        return regions
+
+    def count(self, pattern, scope=False):
+        """Count the qualifying matches of a rule without building regions or replacements."""
+
+        total = 0
+        find = pattern.find
+        literal = pattern.literal
+        literal_ignorecase = pattern.literal_ignorecase
+
+        if scope and not pattern.scope:
+            return total
+
+        find, sels, sel_start, sel_size, errors = self.process_selections(
+            find, self.selection_only, pattern.selection_inputs, literal
+        )
+        if errors:
+            return total
+
+        try:
+            if scope:
+                regions = self.find_by_selector(pattern.scope)
+                if self.selection_only:
+                    regions = self.filter_by_selection(regions)[0]
+                if find is None:
+                    return len(regions)
+                compiled = self.compile_scope_find(find, literal, literal_ignorecase)
+                scanned = self.scan_regions(compiled, regions)
+                if scanned is not None:
+                    return sum(1 for string, matches in scanned for m in matches)
+                for region in regions:
+                    for m in self.finditer(compiled, self.substr(region)):
+                        total += 1
+                return total
+
+            flags = 0
+            if literal_ignorecase:
+                flags |= self.extend_module.IGNORECASE if self.extend else self.normal_module.IGNORECASE
+            compiled = self.compile_find(find, flags, literal)
+            scope_filter = self.get_scope_filter(pattern)
+            sel_set = RegionSet.from_regions(sels) if self.selection_only and self.full_file else None
+            for sel in (sels if self.selection_only and not self.full_file else [None]):
+                offset, bfr = self.get_buffer(sel)
+                for m in self.finditer(compiled, bfr):
+                    begin = offset + m.start(0)
+                    end = offset + m.end(0)
+                    if sel_set is not None and not sel_set.contains(begin, end):
+                        continue
+                    if scope_filter and not scope_filter.qualify(begin, end):
+                        continue
+                    total += 1
+        except Exception as err:
+            print(str(traceback.format_exc()))
+            self.error('REGEX ERROR: %s' % str(err))
+        return total
+
+    def apply(self, pattern):
+        """Normal find and replace."""
+
+        # Initialize replacement variables
+        regions = []
+        flags = 0
+        replaced = 0
+
+        # Grab pattern definitions
+        find = pattern.find
+        replace = pattern.replace
+        selection_inputs = pattern.selection_inputs
+        greedy = pattern.greedy
+        scope_filter = self.get_scope_filter(pattern)
+        self.format = pattern.format_replace and self.use_format
+        self.plugin = pattern.plugin
+        self.plugin_args = pattern.args
+        self.margin = pattern.margin
+        literal = pattern.literal
+        literal_ignorecase = pattern.literal_ignorecase
+
+        # Ignore Case?
+        if literal_ignorecase:
+            if self.extend:
+                flags |= self.extend_module.IGNORECASE
+            else:
+                flags |= self.normal_module.IGNORECASE
+
+        find, sels, sel_start, sel_size, errors = self.process_selections(
+            find, self.selection_only, selection_inputs, literal
+        )
+        if errors:
+            return replaced
+
+        if not greedy and not self.selection_only:
+            # Search from the cursor instead of collecting every match
+            try:
+                replaced = self.regex_find_next(find, flags, replace, literal, scope_filter)
+            except Exception as err:
+                print(str(traceback.format_exc()))
+                self.error('REGEX ERROR: %s' % str(err))
+            return replaced
+
+        # Find targets; replacements are expanded when needed
+        matches = deque()
+        try:
+            reuse = self.reusable(pattern, find, flags)
+            if reuse is not None:
+                # An earlier find already found the targets in this very buffer
+                self.set_expander(self.compile_find(find, flags, literal), replace, literal)
+                regions, matches = reuse
+            elif self.selection_only and not self.full_file:
+                regions = self.regex_findall_selections(find, flags, replace, matches, literal, sels)
+            else:
+                # Later multi-pass sweeps only need to look around earlier edits
+                sweep = self.changed is not None and not scope_filter
+                regions = self.regex_findall(find, flags, replace, matches, literal, sweep=sweep)
+            if self.found is not None:
+                self.found[pattern.name] = (pattern, find, flags, regions, matches)
+        except Exception as err:
+            print(str(traceback.format_exc()))
+            self.error('REGEX ERROR: %s' % str(err))
+            return replaced
+
+        if self.selection_only and self.full_file:
+            regions, matches = self.filter_by_selection(regions, matches)
+
+        # Where there any regions found?
+        if len(regions) > 0:
+            # Greedy or non-greedy search? Get replaced instances.
+            try:
+                if greedy:
+                    replaced = self.greedy_replace(matches, regions, scope_filter)
+                else:
+                    replaced = self.non_greedy_replace(matches, regions, scope_filter)
+            except Exception as err:
+                print(str(traceback.format_exc()))
+                self.error('REGEX ERROR: %s' % str(err))
+                return replaced
+
+        if self.selection_only:
+            new_sels = []
+            count = 0
+            offset = 0
+            for s in sels:
+                r = self.Region(sel_start[count] + offset, s.end())
+                new_sels.append(r)
+                offset += r.size() - sel_size[count]
+                count += 1
+            sels.clear()
+            sels.add_all(new_sels)
+
+        return replaced
+
+    def apply_scope_regex(
+        self, string, pattern, replace, greedy_replace, multi, start, sub_regions, found=None, edits=None
+    ):
+        """
+        Apply regex on a scope; `found` are its matches if it has already been searched.
+
+        Unless the scope takes multiple passes, the `(begin, end, size)` of each replacement is added to `edits`.
+        """
+
+        replaced = 0
+        extraction = string
+
+        scope_repl = ScopeRepl(self.plugin, replace, self.expand, self.on_replace)
+        if not self.plugin:
+            self.template = self.get_template(pattern, replace)
+        if multi and not self.find_only and self.action is None:
+            extraction, replaced = self.apply_multi_pass_scope_regex(
+                pattern, extraction, scope_repl.repl, greedy_replace
+            )
+        elif self.find_only or self.action is not None:
+            replaced = self.scope_find(pattern, string, start, sub_regions, greedy_replace, found)
+        else:
+            extraction, replaced = self.scope_sub(
+                pattern, scope_repl.repl, extraction, greedy_replace, edits=edits, found=found
+            )
+
+        return extraction, replaced
+
+    def apply_multi_pass_scope_regex(self, pattern, extraction, repl, greedy_replace):
+        """
+        Use a multi-pass scope regex.
+
+        When possible, sweeps after the first only search around the previous sweep's edits.
+        """
+
+        count = 0
+        total_replaced = 0
+        margin = self.sweep_margin(pattern) if greedy_replace else None
+        dirty = DirtyRegions() if margin is not None else None
+        windows = None
+        while count < self.max_sweeps:
+            count += 1
+            edits = [] if dirty is not None else None
+            extraction, multi_replaced = self.scope_sub(
+                pattern, repl, extraction, greedy_replace, windows, edits, margin
+            )
+            if multi_replaced == 0:
+                break
+            total_replaced += multi_replaced
+            if dirty is not None:
+                dirty.scanned(0)
+                dirty.record(edits)
+                windows = self.sweep_windows(dirty.get(0), margin)
+        return extraction, total_replaced
+
+    def scope_find(self, pattern, string, offset, sub_regions, greedy_replace, found=None):
+        """Find in scopes."""
+
+        reverse = self.is_reverse(pattern)
+
+        replaced = 0
+        for m in (self.finditer(pattern, string) if found is None else found):
+            if reverse:
+                sub_regions.appendleft(self.Region(offset + m.start(0), offset + m.end(0)))
+            else:
+                sub_regions.append(self.Region(offset + m.start(0), offset + m.end(0)))
+            replaced += 1
+            if not greedy_replace:
+                break
+        return replaced
+
+    def scope_sub(self, pattern, replace, string, greedy_replace, windows=None, edits=None, margin=0, found=None):
+        """
+        Substitute replace.
+
+        If `windows` are given, only matches starting in them are replaced.
+        If `edits` is given, `(begin, end, size)` of each replacement is added to it.
+        If the matches have already been `found`, they are used instead of searching the string.
+        """
+
+        reverse = self.is_reverse(pattern)
+
+        offset = len(string) if reverse else 0
+        text = deque()
+        replaced = 0
+        for m in (self.finditer(pattern, string, windows, margin) if found is None else found):
+            if reverse:
+                text.appendleft(string[m.end(0):offset])
+                text.appendleft(replace(m))
+                offset = m.start(0)
+            else:
+                text.append(string[offset:m.start(0)])
+                text.append(replace(m))
+                offset = m.end(0)
+            if edits is not None:
+                edits.append((m.start(0), m.end(0), len(text[0] if reverse else text[-1])))
+            replaced += 1
+            if not greedy_replace:
+                break
+        if reverse:
+            text.appendleft(string[:offset])
+        else:
+            text.append(string[offset:])
+        return ''.join(text), replaced
+
+    def greedy_scope_literal_replace(self, regions, find, replace, greedy_replace):
+        """Greedy literal scope replace."""
+
+        total_replaced = 0
+        scanned = self.scan_regions(find, regions, not greedy_replace)
+        tabs_to_spaces = self.disable_tab_translation()
+        try:
+            for index in reversed(range(len(regions))):
+                region = regions[index]
+                sub_regions = deque()
+                edits = []
+                start = region.begin()
+                if scanned is None:
+                    string, found = self.substr(region), None
+                else:
+                    string, found = scanned[index]
+                if self.find_only or self.action is not None:
+                    replace_count = self.scope_find(find, string, start, sub_regions, greedy_replace, found)
+                else:
+                    extraction, replace_count = self.scope_sub(
+                        find, replace, string, greedy_replace, edits=edits, found=found
+                    )
+
+                if replace_count > 0:
+                    total_replaced += 1
+                    if self.find_only or self.action is not None:
+                        self.target_regions.extend(sub_regions)
+                    else:
+                        self.replace_scope(region, string, extraction, edits)
+        finally:
+            # The rule may be aborted part way through
+            self.restore_tab_translation(tabs_to_spaces)
+        return total_replaced
+
+    def non_greedy_scope_literal_replace(self, regions, find, replace, greedy_replace):
+        """Non greedy literal scope replace."""
+
+        # Initialize replace
+        total_replaced = 0
+        selected_region = None
+        selected_sub_regions = None
+        selected_edit = None
+
+        # Find the first qualifying scope starting with the first scope after the cursor
+        for index in self.cursor_order(regions):
+            region = regions[index]
+            sub_regions = deque()
+            edits = []
+            start = region.begin()
+            string = extraction = self.substr(region)
+            if self.find_only or self.action is not None:
+                replace_count = self.scope_find(find, string, start, sub_regions, greedy_replace)
+            else:
+                extraction, replace_count = self.scope_sub(find, replace, string, greedy_replace, edits=edits)
+
+            if replace_count > 0:
+                selected_region = region
+                selected_sub_regions = sub_regions
+                selected_edit = (string, extraction, edits)
+                break
+
+        # Did we find a suitable region?
+        if selected_region is not None:
+            # Show Instance
+            total_replaced += 1
+            self.show(selected_region.begin())
+            if self.find_only or self.action is not None:
+                # If "find only" or replace action is overridden, just track regions
+                self.target_regions.extend(selected_sub_regions)
+            else:
+                # Apply replace
+                tabs_to_spaces = self.disable_tab_translation()
+                self.replace_scope(selected_region, *selected_edit)
+                self.restore_tab_translation(tabs_to_spaces)
+        return total_replaced
+
+    def greedy_scope_replace(self, regions, re_find, replace, greedy_replace, multi):
+        """Greedy scope replace."""
+
+        total_replaced = 0
+        tabs_to_spaces = self.disable_tab_translation()
+        try:
+            # Sweeps of multi-pass scopes search text that only exists once the previous sweep is done
+            scanned = None
+            if not multi or self.find_only or self.action is not None:
+                scanned = self.scan_regions(re_find, regions, not greedy_replace)
+            for index in reversed(range(len(regions))):
+                region = regions[index]
+                sub_regions = deque()
+                edits = None if multi else []
+                replaced = 0
+                if scanned is None:
+                    string, found = self.substr(region), None
+                else:
+                    string, found = scanned[index]
+                extraction, replaced = self.apply_scope_regex(
+                    string, re_find, replace, greedy_replace, multi, region.begin(), sub_regions, found, edits
+                )
+                if replaced > 0:
+                    total_replaced += 1
+                    if self.find_only or self.action is not None:
+                        self.target_regions.extend(sub_regions)
+                    else:
+                        self.replace_scope(region, string, extraction, edits)
+        except Exception as err:
+            print(str(traceback.format_exc()))
+            self.error('REGEX ERROR: %s' % str(err))
+        finally:
+            # The rule may be aborted part way through
+            self.restore_tab_translation(tabs_to_spaces)
+
+        return total_replaced
+
+    def non_greedy_scope_replace(self, regions, re_find, replace, greedy_replace, multi):
+        """Non greedy scope replace."""
+
+        # Initialize replace
+        total_replaced = 0
+        replaced = 0
+        selected_region = None
+        selected_sub_regions = None
+        selected_edit = None
+
+        # Find the first qualifying scope starting with the first scope after the cursor
+        try:
+            for index in self.cursor_order(regions):
+                region = regions[index]
+                sub_regions = deque()
+                edits = None if multi else []
+                string = self.substr(region)
+                extraction, replaced = self.apply_scope_regex(
+                    string, re_find, replace, greedy_replace, multi, region.begin(), sub_regions, edits=edits
+                )
+                if replaced > 0:
+                    selected_region = region
+                    selected_sub_regions = sub_regions
+                    selected_edit = (string, extraction, edits)
+                    break
+        except Exception as err:
+            print(str(traceback.format_exc()))
+            self.error('REGEX ERROR: %s' % str(err))
+            return total_replaced
+
+        # Did we find a suitable region?
+        if selected_region is not None:
+            # Show Instance
+            total_replaced += 1
+            self.show(selected_region.begin())
+            if self.find_only or self.action is not None:
+                # If "find only" or replace action is overridden, just track regions
+                self.target_regions.extend(selected_sub_regions)
+            else:
+                # Apply replace
+                tabs_to_spaces = self.disable_tab_translation()
+                self.replace_scope(selected_region, *selected_edit)
+                self.restore_tab_translation(tabs_to_spaces)
+        return total_replaced
+
+    def select_scope_regions(self, regions, greedy_scope):
+        """Select scope region."""
+
+        if greedy_scope:
+            # Greedy scope; return all scopes
+            replaced = len(regions)
+            self.target_regions += regions
+        else:
+            # Non-greedy scope; return first scope after the cursor,
+            # or the first scope if there is none after the cursor.
+            replaced = 0
+            for index in self.cursor_order(regions):
+                selected_region = regions[index]
+                replaced += 1
+                self.show(selected_region.begin())
+                self.target_regions += [selected_region]
+                break
+
+        return replaced
+
+    def process_selections(self, orig_find, selection_only, selection_inputs, literal):
+        """Process selections if necessary."""
+
+        sel_start = []
+        sel_size = []
+        find = orig_find
+        errors = False
+        sels = self.buffer.sel()
+
+        if selection_only and selection_inputs:
+            self.error("Cannot use 'selection_inputs' with global option 'selection_only'!")
+            errors = True
+        elif selection_only:
+            sel_start = []
+            sel_size = []
+            for s in sels:
+                sel_start.append(s.begin())
+                sel_size.append(s.size())
+        elif selection_inputs:
+            try:
+                sel_inputs = []
+                count = 0
+                for s in sels:
+                    assert s.size() <= self.sel_input_max_size, "Exceeded max selection size"
+                    engine = self.normal_module
+                    if not literal and self.extend:
+                        engine = self.extend_module
+                    sel_inputs.append(self.substr(self.to_current_region(s)))
+                    count += 1
+                    assert count <= self.sel_input_max_count
+                find = RegexInputFormatter(engine).format(orig_find, *sel_inputs, sel=sel_inputs)
+            except Exception:
+                print(str(traceback.format_exc()))
+                self.error('Failed to process selection inputs.')
+                errors = True
+        return find, sels, sel_start, sel_size, errors
+
+    def scope_apply(self, pattern):
+        """Find and replace based on scope."""
+
+        # Initialize replacement variables
+        replaced = 0
+        regions = []
+
+        # Grab pattern definitions
+        scope = pattern.scope
+        find = pattern.find
+        replace = pattern.replace
+        selection_inputs = pattern.selection_inputs
+        greedy_scope = pattern.greedy_scope
+        greedy_replace = pattern.greedy
+        literal = pattern.literal
+        literal_ignorecase = pattern.literal_ignorecase
+        multi = pattern.multi_pass
+        self.format = pattern.format_replace and self.use_format
+        self.plugin = pattern.plugin
+        self.plugin_args = pattern.args
+        self.margin = pattern.margin
+
+        if scope is None or scope == '':
+            return replaced
+
+        find, sels, sel_start, sel_size, errors = self.process_selections(
+            find, self.selection_only, selection_inputs, literal
+        )
+        if errors:
+            return replaced
+
+        regions = self.find_by_selector(scope)
+
+        if self.selection_only:
+            regions = self.filter_by_selection(regions)[0]
+
+        # Find supplied?
+        if find is not None:
+            if not literal:
+                try:
+                    re_find = self.compile_scope_find(find)
+                except Exception as err:
+                    print(str(traceback.format_exc()))
+                    self.error('REGEX ERROR: %s' % str(err))
+                    return replaced
+
+                # Greedy Scope?
+                if greedy_scope:
+                    replaced = self.greedy_scope_replace(regions, re_find, replace, greedy_replace, multi)
+                else:
+                    replaced = self.non_greedy_scope_replace(regions, re_find, replace, greedy_replace, multi)
+            else:
+                try:
+                    re_find = self.compile_scope_find(find, literal, literal_ignorecase)
+                except Exception as err:
+                    print(str(traceback.format_exc()))
+                    self.error('REGEX ERROR: %s' % str(err))
+                    return replaced
+
+                literal_repl = LiteralTemplate(replace).expand
+                if greedy_scope:
+                    replaced = self.greedy_scope_literal_replace(regions, re_find, literal_repl, greedy_replace)
+                else:
+                    replaced = self.non_greedy_scope_literal_replace(regions, re_find, literal_repl, greedy_replace)
+        else:
+            replaced = self.select_scope_regions(regions, greedy_scope)
+
+        if self.selection_only:
+            new_sels = []
+            count = 0
+            offset = 0
+            for s in sels:
+                r = self.Region(sel_start[count] + offset, s.end())
+                new_sels.append(r)
+                offset += r.size() - sel_size[count]
+                count += 1
+            sels.clear()
+            sels.add_all(new_sels)
+
+        return replaced
+
+    def fuse(self, names, rules):
+        """Plan the sequence, grouping consecutive rules that can be applied with a single scan."""
+
+        return fuse_sequence(
+            names, rules, lambda text: PatternCache.escape(self.normal_module, text), self.fusion_chars
+        )
+
+    def fusion_chars(self, pattern):
+        """
+        Get the characters the rule reads and writes, for planning which rules can be fused.
+
+        They are worked out from the pattern as parsed by the `re` parser, so rules can't be fused
+        with the `regex` module.  Returns `None` if they can't be worked out.
+        """
+
+        if self.use_regex:
+            return None
+        return pattern.memo(('fuse', self.options.key), lambda: self.rule_chars(pattern)) or None
+
+    def rule_chars(self, pattern):
+        """Work out the characters the rule reads and writes; `False` if they can't be worked out."""
+
+        self.rule = pattern
+        flags = self.normal_module.IGNORECASE if pattern.literal_ignorecase else 0
+        try:
+            compiled = self.compile_find(pattern.find, flags, pattern.literal)
+            chars = pattern_chars(compiled.pattern, compiled.flags)
+            if pattern.literal:
+                template = LiteralTemplate(pattern.replace)
+            else:
+                self.format = pattern.format_replace and self.use_format
+                template = self.get_template(compiled, pattern.replace)
+        except Exception:
+            return False
+        finally:
+            self.rule = None
+
+        if isinstance(template, LiteralTemplate):
+            pieces = [template.text]
+        elif isinstance(template, GroupTemplate):
+            pieces = template.pieces
+        elif self.format:
+            # Format templates are only understood if they are plain text
+            replace = pattern.replace
+            if '\\' in replace or '{' in replace or '}' in replace:
+                return False
+            pieces = [replace]
+        else:
+            # Backrefs templates that don't use its own escapes read the same as `re` templates
+            try:
+                pieces = parse_re_template(compiled, pattern.replace)
+            except Exception:
+                return False
+        pieces = [piece for piece in pieces if piece is not None]
+        return RuleChars(
+            chars,
+            ''.join(piece for piece in pieces if isinstance(piece, str)),
+            [piece for piece in pieces if not isinstance(piece, str)]
+        )
+
+    def search_fused(self, group, keys=None):
+        """
+        Apply a group of fused rules with a single scan of the buffer.
+
+        The rules of the group were planned so none of them changes what the ones after it match,
+        so the scan finds what the rules would find one after another.  Each match is expanded with
+        the rule that owns it; unless its replacement is constant, the rule's own pattern is matched
+        at the same position so the replace template sees the rule's groups.
+        Returns the number of replacements per rule and whether the group was actually fused.
+        If the fused pattern can't be compiled or a replacement fails, the rules are run one at a time,
+        as they are in sweeps that only search around the edits of the sweep before.
+        When tracking edits, `keys` identify the rules in the sequence.
+        """
+
+        if keys is None:
+            keys = [None] * len(group)
+        elif self.dirty is not None and all(self.dirty.get(key) is not None for key in keys):
+            return [self.search(pattern, key=key) for pattern, key in zip(group.patterns, keys)], False
+
+        try:
+            self.rule = None
+            fused = self.compile_find(group.find(), 0)
+            members = {}
+            for index, pattern in enumerate(group.patterns):
+                self.rule = pattern
+                flags = 0
+                if pattern.literal_ignorecase:
+                    flags |= self.extend_module.IGNORECASE if self.extend else self.normal_module.IGNORECASE
+                compiled = self.compile_find(pattern.find, flags, pattern.literal)
+                if pattern.literal:
+                    template = LiteralTemplate(pattern.replace)
+                else:
+                    self.format = pattern.format_replace and self.use_format
+                    template = self.get_template(compiled, pattern.replace)
+                if isinstance(template, LiteralTemplate):
+                    members[FusedGroup.group_name(index)] = (index, None, template.text)
+                else:
+                    members[FusedGroup.group_name(index)] = (index, compiled, self.timed('expand', template.expand))
+        except Exception:
+            return [self.search(pattern, key=key) for pattern, key in zip(group.patterns, keys)], False
+
+        counts = [0] * len(members)
+        targets = []
+        offset, bfr = self.get_buffer()
+        try:
+            for m in self.finditer(fused, bfr):
+                index, compiled, expander = members[m.lastgroup]
+                begin, end = m.span()
+                if compiled is None:
+                    text = expander
+                else:
+                    # Alternatives are tried in order, so the rule matches the same text on its own
+                    text = expander(compiled.match(bfr, begin, **self.time_left()))
+                targets.append((self.Region(begin, end), text, m.group(0)))
+                counts[index] += 1
+        except TimeoutError:
+            raise TimedOut()
+        except Exception:
+            # Nothing has been replaced yet; let the rules run (and report errors) on their own
+            return [self.search(pattern, key=key) for pattern, key in zip(group.patterns, keys)], False
+
+        # Apply replace
+        tabs_to_spaces = self.disable_tab_translation()
+        for region, text, original in reversed(targets):
+            self.replace_region(region, text, original)
+        self.restore_tab_translation(tabs_to_spaces)
+        self.flush()
+        self.track([key for key in keys if key is not None])
+        return counts, True
+
+    def run_budgeted(self, key, name, patterns, result, func, *args):
+        """
+        Run a step of the sequence with its time budget and return what `func` returns.
+
+        If the step runs out of time, it is aborted and `None` is returned; if it was the sequence
+        that ran out of time, `out_of_time` is set on the result.
+        """
+
+        regions = len(self.target_regions)
+        try:
+            with self.profile_rule(key, name):
+                self.set_deadline(patterns)
+                return func(*args)
+        except TimedOut:
+            self.abort(regions)
+            if self.budget == 'sequence':
+                result.out_of_time = name
+            return None
+        finally:
+            self.deadline = None
+
+    def sweep(self, steps, rules, result, keyed=False):
+        """
+        Apply each step of the sequence once.
+
+        Returns the number of replacements and the names of the rules that made any.
+        If `keyed`, the steps are identified so edits can be tracked between sweeps.
+        Rules that ran out of time in an earlier sweep are skipped, and the sweep stops
+        when the sequence runs out of time.  If a fused group runs out of time, its rules
+        are run on their own to find the ones that are too slow.
+        """
+
+        replaced = 0
+        matched = []
+        slot = 0
+        for index, step in enumerate(steps):
+            self.checkpoint()
+            fused = isinstance(step, FusedGroup)
+            # Is replacement available in the list?
+            if not fused and step not in rules:
+                continue
+            names = step.names if fused else (step,)
+            if self.out_of_time():
+                result.out_of_time = ' + '.join(names)
+                break
+            if self.progress is not None:
+                self.progress(' + '.join(names), index, len(steps), result.sweeps)
+
+            counts = None
+            if fused and not any(name in result.timed_out for name in names):
+                keys = [(index, name) for name in names] if keyed else None
+                outcome = self.run_budgeted(
+                    index, ' + '.join(names), step.patterns, result, self.search_fused, step, keys
+                )
+                if outcome is not None:
+                    counts, was_fused = outcome
+                    if was_fused and step.names not in result.fused:
+                        result.fused.append(step.names)
+            if counts is None:
+                counts = []
+                patterns = step.patterns if fused else (rules[step],)
+                for name, pattern in zip(names, patterns):
+                    count = 0
+                    if name not in result.timed_out and result.out_of_time is None:
+                        key = ((index, name) if fused else index) if keyed else None
+                        count = self.run_budgeted(
+                            (index, name) if fused else index, name, (pattern,), result,
+                            self.search, pattern, pattern.by_scope, key
+                        )
+                        if count is None:
+                            count = 0
+                            if result.out_of_time is None:
+                                result.timed_out.append(name)
+                    counts.append(count)
+
+            for offset, (name, count) in enumerate(zip(names, counts)):
+                result.counts[slot + offset][1] += count
+                if count:
+                    matched.append(name)
+            slot += len(names)
+            replaced += sum(counts)
+            if result.out_of_time is not None:
+                break
+        return replaced, matched
+
+    def apply_sequence(self, names, rules, multi_pass=False, fuse=False):
+        """
+        Apply a sequence of rules, looked up by name in `rules`.
+
+        With `multi_pass`, the sequence is applied until a sweep makes no replacements or only
+        replacements that change nothing, `max_sweeps` is reached, or a sweep brings the buffer back
+        to the state it was in at the start of that sweep or an earlier one (the rules would only keep
+        going around in a cycle, which is reported in the result).  With `fuse`, runs of
+        consecutive rules that can be fused are applied with a single scan.
+        The sequence also stops if it runs out of time.  Returns a `SequenceResult`.
+        """
+
+        result = SequenceResult()
+        self.start_budget()
+        if not isinstance(rules, RuleRegistry):
+            rules = RuleRegistry(rules)
+
+        # Group consecutive rules that can be applied with a single scan
+        steps = self.fuse(names, rules) if fuse else names
+        for step in steps:
+            if isinstance(step, FusedGroup):
+                result.counts.extend([[name, 0] for name in step.names])
+            elif step in rules:
+                result.counts.append([step, 0])
+            else:
+                result.not_found.append(step)
+
+        if not multi_pass:
+            result.sweeps = 1
+            self.sweep(steps, rules, result)
+            return self.finish_sequence(result)
+
+        # Sweeps after the first only need to search around the edits since each rule's last sweep
+        if not self.selection_only:
+            self.track_edits()
+
+        # Buffer fingerprints after each sweep (sweep 0 is the original buffer),
+        # and the rules that made replacements in each sweep.
+        fingerprint = self.fingerprint()
+        seen = {fingerprint: 0}
+        swept = []
+
+        # Sweep file until all instances are found
+        # Avoid infinite loop and break out if sweep threshold is met
+        while result.sweeps < self.max_sweeps:
+            result.sweeps += 1
+            edits = self.edits
+            replaced, matched = self.sweep(steps, rules, result, True)
+
+            # No more regions found, or out of time?
+            if replaced == 0 or result.out_of_time is not None:
+                break
+
+            # Replacements that didn't change the text?  Every sweep after this would do the same.
+            if self.edits == edits:
+                break
+
+            # Back to a buffer seen after an earlier sweep (or this sweep's own start)?  The rules
+            # that made replacements since then will only keep going around.
+            fingerprint = self.fingerprint()
+            swept.append(matched)
+            if fingerprint in seen:
+                first = seen[fingerprint]
+                cycle = []
+                for name in chain.from_iterable(swept[first:]):
+                    if name not in cycle:
+                        cycle.append(name)
+                result.cycle = (cycle, result.sweeps - first)
+                break
+            seen[fingerprint] = result.sweeps
+        return self.finish_sequence(result)
+
+    def finish_sequence(self, result):
+        """Finish applying a sequence."""
+
+        if self.profiler is not None:
+            self.profiler.info['sweeps'] = result.sweeps
+        return result
+
+    def search(self, pattern, scope=False, key=None):
+        """
+        Search with the given patter.
+
+        When tracking edits, `key` identifies the rule in the sequence.
+        """
+
+        self.rule = pattern
+        if self.action == 'count':
+            return self.count(pattern, scope)
+        self.changed = self.dirty.get(key) if self.dirty is not None and key is not None else None
+        replaced = self.scope_apply(pattern) if scope else self.apply(pattern)
+        self.flush()
+        self.track([key] if key is not None else [])
+        return replaced
@@ -0,0 +1,209 @@
+"""
+Reg Replace.
+
+Licensed under MIT
+Copyright (c) 2011 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+import re
+from RegReplace.rr_cache import PatternCache
+from RegReplace.rr_pattern import MAX_CHAR, merge, complement, intersects, text_ranges, escape as escape_char
+
+GROUP_PREFIX = '_rr_fused_'
+
+# Flags that can be scoped to a single rule with `(?flags:...)`
+SCOPED_FLAGS = frozenset('ims')
+
+RE_LEADING_FLAGS = re.compile(r'^\(\?([a-zA-Z0-9]+)\)')
+RE_INLINE_FLAGS = re.compile(r'\(\?[a-zA-Z0-9-]+\)')
+RE_GROUP_NAME = re.compile(r'\(\?P?<([a-zA-Z_]\w*)>')
+
+# Syntax that depends on the rule being compiled (and numbered) on its own,
+# or on text before the match that an earlier rule may have changed.
+RE_UNFUSABLE = re.compile(
+    r'''
+    \(\?<[=!]|                  # Lookbehind
+    \\[1-9]|\\g<\d|             # Numbered backreferences
+    \(\?\(\d|                   # Numbered conditionals
+    \(\?(?:R|[+-]?\d)|          # Recursion (`regex`)
+    \\[QEGK]                    # Quoting, search anchor and keep (`regex` and Backrefs)
+    ''',
+    re.X
+)
+
+
+class FusedGroup(object):
+    """A run of consecutive rules that are applied with a single scan."""
+
+    def __init__(self):
+        """Initialize."""
+
+        self.names = []
+        self.patterns = []
+        self.fragments = []
+        self.group_names = set()
+        self.chars = []
+
+    def __len__(self):
+        """Get the number of rules in the group."""
+
+        return len(self.names)
+
+    def add(self, name, pattern, fragment, group_names, chars):
+        """Add a rule to the group."""
+
+        self.names.append(name)
+        self.patterns.append(pattern)
+        self.fragments.append(fragment)
+        self.group_names |= group_names
+        self.chars.append(chars)
+
+    def find(self):
+        """
+        Get the alternation of the rules' find patterns; each rule is captured by a named group.
+
+        The alternation is only tried where one of the rules can start a match, as the `re` module
+        tries every alternative at every position otherwise.
+        """
+
+        find = '|'.join(
+            '(?P<%s>%s)' % (self.group_name(index), fragment) for index, fragment in enumerate(self.fragments)
+        )
+        first = merge([span for chars in self.chars for span in chars.first])
+        if first == [(0, MAX_CHAR)]:
+            return find
+        return '(?=[%s])(?:%s)' % (
+            ''.join(
+                escape_char(begin) if begin == end else '%s-%s' % (escape_char(begin), escape_char(end))
+                for begin, end in first
+            ),
+            find
+        )
+
+    @staticmethod
+    def group_name(index):
+        """Get the name of the group that captures the matches of the rule at the index."""
+
+        return '%s%d' % (GROUP_PREFIX, index)
+
+
+class RuleChars(object):
+    """
+    The characters a rule reads and writes, to tell if it can change what a later rule matches.
+
+    `looked_at` holds the characters the rule's matches can contain or look at, `first` the ones they
+    can start with, and `words` the word and other characters of each of its word boundaries.  `written`
+    holds the characters of the text the rule replaces and of its replacements, and `min_replace` the
+    length of its shortest replacement.  `prefixed` tells if the rule is searched for with a fast scan
+    on its own.
+    """
+
+    def __init__(self, chars, literal, groups=()):
+        """Describe a rule from its `PatternChars` and the literal text and group numbers of its replacement."""
+
+        self.looked_at = merge(chars.consumed + chars.inspected)
+        self.first = chars.first
+        self.prefixed = chars.prefixed
+        self.words = [(words, complement(words)) for words in chars.words]
+        self.written = merge(chars.consumed + text_ranges(literal))
+        self.min_replace = len(literal) + sum(chars.widths.get(group, 0) for group in groups)
+
+    def affects(self, later):
+        """
+        Check if the rule's replacements can change what a later rule matches.
+
+        A later rule that can't match or look at anything the rule replaces or inserts finds the same
+        matches before and after it, as long as replacements don't join the text around them and
+        don't turn word characters next to it into other characters (or the other way around).
+        """
+
+        if self.min_replace == 0 or intersects(self.written, later.looked_at):
+            return True
+        for words, others in later.words:
+            if intersects(self.written, words) and intersects(self.written, others):
+                return True
+        return False
+
+
+def fuse_fragment(pattern, escape):
+    """
+    Get the find pattern of the rule as a fragment of a fused pattern.
+
+    Returns `None` if the rule can't be fused.
+    """
+
+    if 'scope' in pattern or pattern.get('plugin') or pattern.get('scope_filter'):
+        return None
+    if pattern.get('selection_inputs', False) or not bool(pattern.get('greedy', True)):
+        return None
+
+    find = pattern.get('find')
+    if not find:
+        return None
+
+    if pattern.get('literal', False):
+        fragment = escape(find)
+        flags = 'i' if pattern.get('literal_ignorecase', False) else ''
+    else:
+        m = RE_LEADING_FLAGS.match(find)
+        flags = m.group(1) if m else ''
+        fragment = find[m.end():] if m else find
+        if not SCOPED_FLAGS.issuperset(flags):
+            return None
+        if RE_INLINE_FLAGS.search(fragment) or RE_UNFUSABLE.search(fragment):
+            return None
+
+    # Zero width matches would be lost to other rules' matches starting at the same place.
+    # Patterns the `re` parser can't read can't be checked.
+    try:
+        if PatternCache.width(fragment)[0] == 0:
+            return None
+    except Exception:
+        return None
+
+    return '(?%s:%s)' % (flags, fragment) if flags else fragment
+
+
+def fuse_sequence(names, rules, escape, describe):
+    """
+    Plan the sequence, grouping consecutive rules that can be fused.
+
+    Returns a list of steps: a rule name for rules that run on their own,
+    or a `FusedGroup` for two or more consecutive rules that can be fused.
+    `describe` gets the `RuleChars` of a rule, or `None` if they can't be worked out, in which case
+    the rule runs on its own.  Rules that an earlier rule of the group being built affects, or whose
+    group names clash with it, start a new group, so a fused scan finds what the rules would find
+    one after another.
+    """
+
+    steps = []
+    group = FusedGroup()
+
+    def close(group):
+        """Add the group to the steps; a single rule just runs on its own."""
+
+        if len(group) > 1:
+            steps.append(group)
+        else:
+            steps.extend(group.names)
+        return FusedGroup()
+
+    for name in names:
+        pattern = rules.get(name)
+        fragment = fuse_fragment(pattern, escape) if pattern is not None else None
+        chars = describe(pattern) if fragment is not None else None
+        # Rules the `re` module finds with a fast scan are faster on their own
+        if chars is None or chars.prefixed:
+            group = close(group)
+            steps.append(name)
+            continue
+
+        group_names = set(RE_GROUP_NAME.findall(fragment))
+        if any(n.startswith(GROUP_PREFIX) for n in group_names):
+            group = close(group)
+            steps.append(name)
+            continue
+        if group.group_names & group_names or any(earlier.affects(chars) for earlier in group.chars):
+            group = close(group)
+        group.add(name, pattern, fragment, group_names, chars)
+    close(group)
+    return steps
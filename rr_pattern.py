@@ -0,0 +1,293 @@
+"""
+Reg Replace.
+
+Licensed under MIT
+Copyright (c) 2011 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+import re
+import sys
+from array import array
+from bisect import bisect_right
+from RegReplace.rr_cache import PatternCache
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+MAX_CHAR = sys.maxunicode
+
+# Flags that change what a character class matches
+CLASS_FLAGS = re.IGNORECASE | re.ASCII
+
+CATEGORIES = {
+    sre_parse.CATEGORY_DIGIT: r'\d',
+    sre_parse.CATEGORY_NOT_DIGIT: r'\D',
+    sre_parse.CATEGORY_SPACE: r'\s',
+    sre_parse.CATEGORY_NOT_SPACE: r'\S',
+    sre_parse.CATEGORY_WORD: r'\w',
+    sre_parse.CATEGORY_NOT_WORD: r'\W'
+}
+
+REPEATS = tuple(
+    getattr(sre_parse, name) for name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT') if hasattr(sre_parse, name)
+)
+
+ATOMIC_GROUP = getattr(sre_parse, 'ATOMIC_GROUP', None)
+
+_all_chars = None
+_classes = {}
+
+
+class Unsupported(Exception):
+    """The pattern uses syntax that isn't understood."""
+
+
+def merge(ranges):
+    """Sort `(first, last)` character ranges and join the ones that overlap or touch."""
+
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            if last > merged[-1][1]:
+                merged[-1] = (merged[-1][0], last)
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def complement(ranges):
+    """Get the ranges of the characters that are not in the (merged) ranges."""
+
+    result = []
+    first = 0
+    for begin, end in ranges:
+        if begin > first:
+            result.append((first, begin - 1))
+        first = end + 1
+    if first <= MAX_CHAR:
+        result.append((first, MAX_CHAR))
+    return result
+
+
+def intersects(a, b):
+    """Check if two sets of (merged) ranges have a character in common."""
+
+    i = j = 0
+    while i < len(a) and j < len(b):
+        if a[i][1] < b[j][0]:
+            i += 1
+        elif b[j][1] < a[i][0]:
+            j += 1
+        else:
+            return True
+    return False
+
+
+def text_ranges(text):
+    """Get the ranges of the characters in the text."""
+
+    return merge([(ord(c), ord(c)) for c in set(text)])
+
+
+def contains(ranges, char):
+    """Check if the (merged) ranges contain the character."""
+
+    code = ord(char)
+    index = bisect_right(ranges, (code, MAX_CHAR)) - 1
+    return index >= 0 and ranges[index][1] >= code
+
+
+def all_chars():
+    """Get a string of every character; character classes are run over it to find what they match."""
+
+    global _all_chars
+    if _all_chars is None:
+        codes = array('I' if array('I').itemsize == 4 else 'L', range(MAX_CHAR + 1))
+        _all_chars = codes.tobytes().decode('utf-32-le' if sys.byteorder == 'little' else 'utf-32-be', 'surrogatepass')
+    return _all_chars
+
+
+def escape(code):
+    """Escape a character for a character class."""
+
+    return '\\U%08x' % code
+
+
+def class_ranges(source, flags):
+    """Get the characters a character class, given as pattern source, matches with the flags."""
+
+    key = (source, flags)
+    ranges = _classes.get(key)
+    if ranges is None:
+        ranges = _classes[key] = [(m.start(), m.end() - 1) for m in re.finditer(source + '+', all_chars(), flags)]
+    return ranges
+
+
+def in_ranges(items, flags):
+    """Get the characters the items of a parsed character class match."""
+
+    negate = False
+    plain = []
+    parts = []
+    for op, av in items:
+        if op == sre_parse.NEGATE:
+            negate = True
+        elif op == sre_parse.LITERAL:
+            plain.append((av, av))
+            parts.append(escape(av))
+        elif op == sre_parse.RANGE:
+            plain.append(av)
+            parts.append('%s-%s' % (escape(av[0]), escape(av[1])))
+        elif op == sre_parse.CATEGORY and av in CATEGORIES:
+            parts.append(CATEGORIES[av])
+        else:
+            raise Unsupported('character class item %s' % op)
+
+    if len(plain) == len(parts) and not flags & re.IGNORECASE:
+        ranges = merge(plain)
+        return complement(ranges) if negate else ranges
+    return class_ranges('[%s%s]' % ('^' if negate else '', ''.join(parts)), flags & CLASS_FLAGS)
+
+
+class PatternChars(object):
+    """
+    What a pattern's matches can contain and what they look at, worked out with the `re` parser.
+
+    `consumed` holds the characters matches can contain, `first` the ones they can start with, and
+    `inspected` the characters that lookarounds and line anchors look at around them.  `words` holds the
+    word characters of each word boundary, and `widths` the shortest text each group (by number, `0` for
+    the whole match) can match.  `prefixed` tells if the pattern starts with a literal or a character
+    class, which the `re` module searches for with a fast scan.
+    Patterns the parser can't read, or that use syntax that isn't understood, raise an error.
+    """
+
+    def __init__(self, find, flags=0):
+        """Parse and walk the pattern."""
+
+        parsed = sre_parse.parse(find, flags)
+        state = getattr(parsed, 'state', None) or parsed.pattern
+        consumed = []
+        inspected = []
+        self.words = []
+        self.widths = {0: parsed.getwidth()[0]}
+        self.walk(parsed, state.flags, consumed, inspected)
+        self.consumed = merge(consumed)
+        self.inspected = merge(inspected)
+        first = []
+        self.first_chars(parsed, state.flags, first)
+        self.first = merge(first)
+        self.prefixed = self.is_prefixed(parsed)
+
+    def walk(self, items, flags, consumed, inspected, required=True):
+        """
+        Gather the characters the parsed items can match, and the ones they look at.
+
+        Groups that are not `required` may not take part in a match, so they may match nothing.
+        """
+
+        for op, av in items:
+            if op == sre_parse.LITERAL:
+                if flags & re.IGNORECASE:
+                    consumed.extend(class_ranges(escape(av), flags & CLASS_FLAGS))
+                else:
+                    consumed.append((av, av))
+            elif op == sre_parse.NOT_LITERAL:
+                consumed.extend(in_ranges([(sre_parse.NEGATE, None), (sre_parse.LITERAL, av)], flags))
+            elif op == sre_parse.ANY:
+                consumed.extend([(0, MAX_CHAR)] if flags & re.DOTALL else complement([(10, 10)]))
+            elif op == sre_parse.IN:
+                consumed.extend(in_ranges(av, flags))
+            elif op == sre_parse.BRANCH:
+                for branch in av[1]:
+                    self.walk(branch, flags, consumed, inspected, False)
+            elif op == sre_parse.SUBPATTERN:
+                if av[0] is not None:
+                    self.widths[av[0]] = av[-1].getwidth()[0] if required else 0
+                if len(av) == 4:
+                    # Scoped flags: `(group, add_flags, del_flags, pattern)`
+                    self.walk(av[3], (flags | av[1]) & ~av[2], consumed, inspected, required)
+                else:
+                    self.walk(av[1], flags, consumed, inspected, required)
+            elif op in REPEATS:
+                self.walk(av[2], flags, consumed, inspected, required and av[0] > 0)
+            elif ATOMIC_GROUP is not None and op == ATOMIC_GROUP:
+                self.walk(av, flags, consumed, inspected, required)
+            elif op == sre_parse.GROUPREF_EXISTS:
+                self.walk(av[1], flags, consumed, inspected, False)
+                if av[2] is not None:
+                    self.walk(av[2], flags, consumed, inspected, False)
+            elif op == sre_parse.GROUPREF:
+                # A back reference matches what its group matched, unless case is ignored
+                if flags & re.IGNORECASE:
+                    raise Unsupported('back reference ignoring case')
+            elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+                # Everything a lookaround matches is only looked at
+                self.walk(av[1], flags, inspected, inspected, False)
+            elif op == sre_parse.AT:
+                if av in (sre_parse.AT_BEGINNING, sre_parse.AT_END):
+                    inspected.append((10, 10))
+                elif av in (sre_parse.AT_BOUNDARY, sre_parse.AT_NON_BOUNDARY):
+                    words = class_ranges(r'\w', flags & re.ASCII)
+                    if words not in self.words:
+                        self.words.append(words)
+                elif av not in (sre_parse.AT_BEGINNING_STRING, sre_parse.AT_END_STRING):
+                    raise Unsupported(str(av))
+            elif op == sre_parse.FAILURE:
+                pass
+            else:
+                raise Unsupported(str(op))
+
+    def first_chars(self, items, flags, first):
+        """Gather the characters the parsed items can start with; returns whether they can match nothing."""
+
+        for op, av in items:
+            if op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT, sre_parse.FAILURE):
+                continue
+            elif op == sre_parse.GROUPREF:
+                # A back reference starts with what its group, which comes before it, starts with
+                continue
+            elif op == sre_parse.SUBPATTERN:
+                if len(av) == 4:
+                    nullable = self.first_chars(av[3], (flags | av[1]) & ~av[2], first)
+                else:
+                    nullable = self.first_chars(av[1], flags, first)
+            elif ATOMIC_GROUP is not None and op == ATOMIC_GROUP:
+                nullable = self.first_chars(av, flags, first)
+            elif op == sre_parse.BRANCH:
+                nullable = False
+                for branch in av[1]:
+                    nullable = self.first_chars(branch, flags, first) or nullable
+            elif op in REPEATS:
+                nullable = self.first_chars(av[2], flags, first) or av[0] == 0
+            elif op == sre_parse.GROUPREF_EXISTS:
+                nullable = self.first_chars(av[1], flags, first)
+                nullable = (self.first_chars(av[2], flags, first) if av[2] is not None else True) or nullable
+            else:
+                self.walk([(op, av)], flags, first, [])
+                nullable = False
+            if not nullable:
+                return False
+        return True
+
+    @staticmethod
+    def is_prefixed(items):
+        """Check if the parsed items start with a literal or a character class (or a choice of literals)."""
+
+        while items:
+            op, av = items[0]
+            if op != sre_parse.SUBPATTERN:
+                break
+            items = av[-1]
+        else:
+            return False
+        if op in (sre_parse.LITERAL, sre_parse.IN):
+            return True
+        if op == sre_parse.BRANCH:
+            return all(branch and branch[0][0] == sre_parse.LITERAL for branch in av[1])
+        return False
+
+
+def pattern_chars(find, flags=0):
+    """Get what the pattern's matches can contain; errors are raised (and cached) like compile errors."""
+
+    return PatternCache.lookup(('chars', find, flags), lambda: PatternChars(find, flags))
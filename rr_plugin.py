@@ -5,8 +5,9 @@ Licensed under MIT
 Copyright (c) 2011 - 2016 Isaac Muse <isaacmuse@gmail.com>
 """
 import sublime
-import imp
+import hashlib
 import sys
+import types
 from os.path import join, normpath
 import re
 
@@ -20,40 +21,40 @@ def sublime_format_path(pth):
 
 
 class Plugin(object):
-    """Load plugins for RegReplace."""
+    """
+    Load plugins for RegReplace.
 
-    loaded = []
+    Compiled plugin modules are cached by resource path, along with a hash of their source,
+    and survive across commands.  A plugin's source is only read and hashed the first time it is
+    used after the settings or rules change (see `purge`), and it is only compiled again if the
+    source changed.  Every other request returns the cached module directly.
+    """
+
+    loaded = set()
+    modules = {}
 
     @classmethod
     def purge(cls):
-        """Purge list of loaded plugins."""
-        cls.loaded = []
+        """Check the source of each plugin again the next time it is used."""
+        cls.loaded = set()
 
     @classmethod
-    def get_module(cls, module_name, path_name):
-        """Get the requested module."""
-
-        module = None
-        try:
-            module = sys.modules[module_name]
-        except Exception:
-            module = cls.load_module(module_name, path_name)
-        return module
+    def reload(cls):
+        """Forget all cached plugins so they are compiled again on next use."""
+
+        for module_name in [entry[1].__name__ for entry in cls.modules.values()]:
+            sys.modules.pop(module_name, None)
+        cls.modules = {}
+        cls.loaded = set()
 
     @classmethod
-    def load_module(cls, module_name, path_name):
-        """Load the requested module."""
+    def load_module(cls, module_name, path_name, source, digest):
+        """Compile and run the plugin's source as a new module."""
 
-        module = imp.new_module(module_name)
+        module = types.ModuleType(module_name)
         sys.modules[module_name] = module
-        exec(
-            compile(
-                sublime.load_resource(sublime_format_path(path_name)),
-                module_name,
-                'exec'
-            ),
-            sys.modules[module_name].__dict__
-        )
+        exec(compile(source, module_name, 'exec'), module.__dict__)
+        cls.modules[path_name] = (digest, module)
         return module
 
     @classmethod
@@ -65,11 +66,17 @@ class Plugin(object):
         else:
             path_name = join("Packages", normpath(module_name.replace('.', '/')))
         path_name += ".py"
-        module = None
-        if module_name in cls.loaded:
-            module = cls.get_module(module_name, path_name)
+        cached = cls.modules.get(path_name)
+        if module_name in cls.loaded and cached is not None:
+            return cached[1]
+
+        source = sublime.load_resource(sublime_format_path(path_name))
+        digest = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        if cached is not None and cached[0] == digest:
+            module = cached[1]
         else:
-            module = cls.load_module(module_name, path_name)
+            module = cls.load_module(module_name, path_name, source, digest)
+        cls.loaded.add(module_name)
         return module
 
     @classmethod
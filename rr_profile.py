@@ -0,0 +1,281 @@
+"""
+Reg Replace.
+
+Licensed under MIT
+Copyright (c) 2011 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+import json
+import time
+from contextlib import contextmanager
+try:
+    import tracemalloc
+except ImportError:
+    # Not available in Sublime Text 3's Python 3.3
+    tracemalloc = None
+
+PHASES = ('compile', 'scan', 'expand', 'plugin', 'scope', 'edit')
+OUTSIDE = '(sequence)'
+
+
+class NullProfile(object):
+    """Context manager used for rules when not profiling."""
+
+    def __enter__(self):
+        """Enter."""
+
+        return self
+
+    def __exit__(self, *args):
+        """Exit."""
+
+        return False
+
+
+NULL_PROFILE = NullProfile()
+
+
+class RuleProfile(object):
+    """
+    Profile of a rule of the sequence, summed over all of its sweeps.
+
+    `phases` hold the seconds spent in each phase; `seconds` is the wall time of the rule,
+    which includes work that isn't part of a phase (collecting regions, filtering, etc.).
+    `scanned` is the number of characters searched, `matches` the number of matches found
+    (before being qualified), and `peak_memory` the most memory the rule allocated at once.
+    """
+
+    def __init__(self, name):
+        """Initialize."""
+
+        self.name = name
+        self.runs = 0
+        self.seconds = 0.0
+        self.phases = dict((phase, 0.0) for phase in PHASES)
+        self.scanned = 0
+        self.matches = 0
+        self.peak_memory = None
+
+    @property
+    def other(self):
+        """Get the time not spent in a phase."""
+
+        return max(0.0, self.seconds - sum(self.phases.values()))
+
+    def to_dict(self):
+        """Get the profile as a dictionary."""
+
+        return {
+            'name': self.name,
+            'runs': self.runs,
+            'seconds': self.seconds,
+            'phases': dict(self.phases, other=self.other),
+            'scanned': self.scanned,
+            'matches': self.matches,
+            'peak_memory': self.peak_memory
+        }
+
+
+class Profiler(object):
+    """
+    Profile a run of the replace engine.
+
+    Time is split per rule into phases.  Phases are exclusive: if a phase runs inside
+    another one (a plugin called while expanding, etc.), its time is only counted once.
+    Time outside of any rule (applying the shadow buffer, comparing multi-pass sweeps)
+    is kept as its own entry.  Tracing memory slows down the run, so it can be turned off.
+    """
+
+    def __init__(self, memory=True):
+        """Initialize."""
+
+        self.rules = []
+        self.slots = {}
+        self.outside = RuleProfile(OUTSIDE)
+        self.current = self.outside
+        self.stack = []
+        self.info = {}
+        self.seconds = 0.0
+        self.started = None
+        self.segment = None
+        self.base_memory = 0
+        self.peak_memory = None
+        self.trace_memory = memory and tracemalloc is not None
+        self.owns_tracing = False
+
+    def start(self):
+        """Start profiling."""
+
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.owns_tracing = True
+            elif not hasattr(tracemalloc, 'reset_peak'):
+                # Someone else is tracing and the peak can't be reset between rules
+                self.trace_memory = False
+        self.started = time.perf_counter()
+        self.begin_segment(self.outside)
+
+    def stop(self):
+        """Stop profiling."""
+
+        self.end_segment()
+        self.seconds = time.perf_counter() - self.started
+        if self.owns_tracing:
+            tracemalloc.stop()
+            self.owns_tracing = False
+
+    def begin_segment(self, record):
+        """Start counting time and memory toward the record."""
+
+        self.current = record
+        if self.trace_memory:
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            else:
+                # Restarting forgets earlier allocations, but clears the peak
+                tracemalloc.stop()
+                tracemalloc.start()
+            self.base_memory = tracemalloc.get_traced_memory()[0]
+        self.segment = time.perf_counter()
+
+    def end_segment(self):
+        """Stop counting time and memory toward the current record."""
+
+        record = self.current
+        record.seconds += time.perf_counter() - self.segment
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] - self.base_memory
+            record.peak_memory = max(record.peak_memory or 0, peak)
+            self.peak_memory = max(self.peak_memory or 0, peak)
+
+    @contextmanager
+    def rule(self, key, name):
+        """Count everything in the block toward the rule; `key` identifies the rule in the sequence."""
+
+        record = self.slots.get(key)
+        if record is None:
+            record = self.slots[key] = RuleProfile(name)
+            self.rules.append(record)
+        record.runs += 1
+        self.end_segment()
+        self.begin_segment(record)
+        try:
+            yield record
+        finally:
+            self.end_segment()
+            self.begin_segment(self.outside)
+
+    def add(self, phase, seconds):
+        """Add time to a phase of the current rule (and to the phase it runs inside of, if any)."""
+
+        self.current.phases[phase] += seconds
+        if self.stack:
+            self.stack[-1] += seconds
+
+    def timed(self, phase, func):
+        """Wrap the function so its calls are counted toward the phase."""
+
+        def timed_call(*args, **kwargs):
+            """Call the function and time it."""
+
+            self.stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                # Only count the time not already counted by phases inside this one
+                self.current.phases[phase] += elapsed - self.stack.pop()
+                if self.stack:
+                    self.stack[-1] += elapsed
+
+        return timed_call
+
+    def scan(self, matches, size):
+        """Count the characters searched, and count and time the matches as they are found."""
+
+        self.current.scanned += size
+        clock = time.perf_counter
+        matches = iter(matches)
+        while True:
+            start = clock()
+            try:
+                m = next(matches)
+            except StopIteration:
+                self.add('scan', clock() - start)
+                return
+            self.add('scan', clock() - start)
+            self.current.matches += 1
+            yield m
+
+    def to_dict(self):
+        """Get the profile as a dictionary."""
+
+        report = dict(self.info)
+        report.update(
+            {
+                'seconds': self.seconds,
+                'peak_memory': self.peak_memory,
+                'scanned': sum(record.scanned for record in self.rules),
+                'matches': sum(record.matches for record in self.rules),
+                'rules': [record.to_dict() for record in self.rules],
+                'outside_rules': self.outside.to_dict()
+            }
+        )
+        return report
+
+    def write(self, file_name, **extra):
+        """Append the profile to a JSON lines file."""
+
+        report = self.to_dict()
+        report.update(extra)
+        with open(file_name, 'a') as f:
+            f.write(json.dumps(report, sort_keys=True) + '\n')
+
+    def report(self):
+        """Format the profile as a table."""
+
+        def ms(seconds):
+            """Format seconds as milliseconds."""
+
+            return '%.1f' % (seconds * 1000.0)
+
+        def memory(size):
+            """Format a memory size."""
+
+            if size is None:
+                return 'n/a'
+            return '%.1fM' % (size / (1024.0 * 1024.0)) if size >= 1024 * 1024 else '%.1fK' % (size / 1024.0)
+
+        records = self.rules + [self.outside]
+        width = max([len('rule')] + [len(record.name) for record in records])
+        columns = ('total',) + PHASES + ('other',)
+        header = '%-*s %s %9s %8s %8s' % (
+            width, 'rule', ' '.join('%8s' % column for column in columns), 'scanned', 'matches', 'memory'
+        )
+        lines = [
+            'Profile: %s ms; %d chars scanned; %d matches; peak memory %s' % (
+                ms(self.seconds),
+                sum(record.scanned for record in self.rules),
+                sum(record.matches for record in self.rules),
+                memory(self.peak_memory)
+            ),
+            'Engine: %s%s%s; %d sweeps; times are in milliseconds.' % (
+                self.info.get('engine', 're'),
+                ' with backrefs' if self.info.get('extended_back_references') else '',
+                ' and a shadow buffer' if self.info.get('shadow_buffer') else '',
+                self.info.get('sweeps', 1)
+            ),
+            '',
+            header,
+            '-' * len(header)
+        ]
+        for record in records:
+            times = [record.seconds] + [record.phases[phase] for phase in PHASES] + [record.other]
+            lines.append(
+                '%-*s %s %9d %8d %8s' % (
+                    width, record.name, ' '.join('%8s' % ms(value) for value in times),
+                    record.scanned, record.matches, memory(record.peak_memory)
+                )
+            )
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,377 @@
+"""
+Reg Replace.
+
+Licensed under MIT
+Copyright (c) 2011 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+import hashlib
+from bisect import bisect_left, bisect_right
+
+# A chunk of lines ends after each line whose hash has these bits clear, which is every 64 lines on average
+CHUNK_MASK = 63
+
+
+class IntervalSet(object):
+    """
+    Sorted set of non-overlapping `[begin, end)` intervals.
+
+    Overlapping and touching intervals are merged so that coverage queries
+    only need to look at a single interval.
+    """
+
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self, intervals=()):
+        """Initialize from `(begin, end)` pairs."""
+
+        self.starts = []
+        self.ends = []
+        for begin, end in sorted(intervals):
+            if begin >= end:
+                continue
+            if self.ends and begin <= self.ends[-1]:
+                if end > self.ends[-1]:
+                    self.ends[-1] = end
+            else:
+                self.starts.append(begin)
+                self.ends.append(end)
+
+    @classmethod
+    def from_regions(cls, regions):
+        """Create from region objects."""
+
+        return cls((region.begin(), region.end()) for region in regions)
+
+    def __len__(self):
+        """Get the number of intervals."""
+
+        return len(self.starts)
+
+    def intersects(self, begin, end):
+        """Check if any character in `[begin, end)` is in the set."""
+
+        index = bisect_right(self.starts, begin) - 1
+        if index >= 0 and self.ends[index] > begin:
+            return True
+        index += 1
+        return index < len(self.starts) and self.starts[index] < end
+
+    def covers(self, begin, end):
+        """Check if every character in `[begin, end)` is in the set."""
+
+        index = bisect_right(self.starts, begin) - 1
+        return index >= 0 and self.ends[index] >= end
+
+
+class RegionSet(object):
+    """
+    Sorted set of `[begin, end]` regions, such as selections, for containment queries.
+
+    Regions are kept as given (not merged), so a region is only contained if a single
+    region of the set holds all of it.
+    """
+
+    __slots__ = ('starts', 'max_ends')
+
+    def __init__(self, regions=()):
+        """Initialize from `(begin, end)` pairs."""
+
+        self.starts = []
+        self.max_ends = []
+        max_end = None
+        for begin, end in sorted(regions):
+            # Track the furthest end seen so far so overlapping regions are handled
+            if max_end is None or end > max_end:
+                max_end = end
+            self.starts.append(begin)
+            self.max_ends.append(max_end)
+
+    @classmethod
+    def from_regions(cls, regions):
+        """Create from region objects."""
+
+        return cls((region.begin(), region.end()) for region in regions)
+
+    def __len__(self):
+        """Get the number of regions."""
+
+        return len(self.starts)
+
+    def contains(self, begin, end):
+        """Check if `[begin, end]` is contained by one of the regions."""
+
+        index = bisect_right(self.starts, begin) - 1
+        return index >= 0 and self.max_ends[index] >= end
+
+    def filter(self, regions, extractions=None):
+        """
+        Filter the regions down to those contained in the set.
+
+        If `extractions` is given, the extractions are filtered as well so they stay aligned
+        with the regions.
+        """
+
+        contains = self.contains
+        if extractions is None:
+            return [region for region in regions if contains(region.begin(), region.end())], None
+
+        new_regions = []
+        new_extractions = []
+        for region, extraction in zip(regions, extractions):
+            if contains(region.begin(), region.end()):
+                new_regions.append(region)
+                new_extractions.append(extraction)
+        return new_regions, new_extractions
+
+
+def parse_scope_filter(entries):
+    """Parse `scope_filter` entries into `(mode, selector)` pairs; empty entries are dropped."""
+
+    parsed = []
+    for entry in entries:
+        # Is there something to qualify?
+        if len(entry) > 0:
+            if entry.startswith('-!'):
+                parsed.append(('-!', entry.lstrip('-!')))
+            elif entry.startswith('-'):
+                parsed.append(('-', entry.lstrip('-')))
+            elif entry.startswith('!'):
+                parsed.append(('!', entry.lstrip('!')))
+            else:
+                parsed.append(('', entry))
+    return tuple(parsed)
+
+
+class ScopeFilter(object):
+    """
+    Qualify regions with a rule's `scope_filter`, as parsed by `parse_scope_filter`.
+
+    Each entry is resolved to an interval set once, on first use, with the given `find_by_selector` function.
+
+    - Any instance of scope qualifies match: `scope.name`
+    - Entire match of scope qualifies match: `!scope.name`
+    - Any instance of scope disqualifies match: `-scope.name`
+    - Entire match of scope disqualifies match: `-!scope.name`
+    """
+
+    def __init__(self, entries, find_by_selector):
+        """Initialize."""
+
+        self.find_by_selector = find_by_selector
+        self.entries = [[mode, selector, None] for mode, selector in entries]
+
+    def __len__(self):
+        """Get the number of filter entries."""
+
+        return len(self.entries)
+
+    def qualify(self, begin, end):
+        """Qualify the region `[begin, end)`."""
+
+        for entry in self.entries:
+            mode, selector, intervals = entry
+            if begin >= end:
+                # Nothing to check, only the default qualification applies
+                qualify = mode in ('-', '!')
+            else:
+                if intervals is None:
+                    intervals = entry[2] = IntervalSet.from_regions(self.find_by_selector(selector))
+                if mode == '-!':
+                    # Disqualify if entirely of scope
+                    qualify = not intervals.covers(begin, end)
+                elif mode == '-':
+                    # Disqualify if one or more instances of scope
+                    qualify = not intervals.intersects(begin, end)
+                elif mode == '!':
+                    # Qualify if entirely of scope
+                    qualify = intervals.covers(begin, end)
+                else:
+                    # Qualify if one or more instances of scope
+                    qualify = intervals.intersects(begin, end)
+            # If qualification of one fails, bail
+            if not qualify:
+                return False
+        # Qualification completed successfully
+        return True
+
+
+class DirtyRegions(object):
+    """
+    Track the parts of the buffer that changed since each key (rule) last scanned it.
+
+    Changed spans are kept per key as sorted, merged `(begin, end)` pairs in current
+    coordinates, and are moved along as edits are recorded.
+    """
+
+    def __init__(self):
+        """Initialize."""
+
+        self.spans = {}
+
+    def get(self, key):
+        """Get the spans changed since the key last scanned the buffer, or `None` if it never has."""
+
+        return self.spans.get(key)
+
+    def scanned(self, key):
+        """Mark the buffer as scanned by the key."""
+
+        self.spans[key] = []
+
+    def record(self, edits):
+        """
+        Record a batch of edits.
+
+        Edits are non-overlapping `(begin, end, size)` in coordinates from before the batch,
+        where `size` is the length of the new text.
+        """
+
+        if not edits:
+            return
+        edits = sorted(edits)
+        begins = [edit[0] for edit in edits]
+        new_spans = []
+        deltas = []
+        delta = 0
+        for begin, end, size in edits:
+            new_spans.append((begin + delta, begin + delta + size))
+            delta += size - (end - begin)
+            deltas.append(delta)
+
+        def move(pt, end=False):
+            """Move a point past the edits; points in an edited span snap to its new bounds."""
+
+            index = bisect_right(begins, pt) - 1
+            if index < 0:
+                return pt
+            if pt >= edits[index][1] and (pt > edits[index][0] or not end):
+                return pt + deltas[index]
+            return new_spans[index][1] if end else new_spans[index][0]
+
+        for key, spans in self.spans.items():
+            moved = [(move(begin), move(end, True)) for begin, end in spans]
+            self.spans[key] = merge_spans(moved + new_spans)
+
+
+class ChunkHashes(object):
+    """
+    Hash text by chunks of lines, so only the chunks that edits touch need hashing again.
+
+    A chunk ends after each line whose hash has the bits of `CHUNK_MASK` clear, and at the end of the
+    text, so the same text is always split the same way, whatever edits led to it.  Chunks are kept
+    as `[end, digest]` pairs in current coordinates; recording edits moves their ends along and
+    clears the digests of the chunks they touch.
+    """
+
+    def __init__(self):
+        """Initialize."""
+
+        self.chunks = None
+
+    def record(self, edits):
+        """Record a batch of `(begin, end, size)` edits, in coordinates from before the batch."""
+
+        if not edits or not self.chunks:
+            return
+        edits = sorted(edits)
+        begins = [edit[0] for edit in edits]
+        deltas = []
+        delta = 0
+        for begin, end, size in edits:
+            delta += size - (end - begin)
+            deltas.append(delta)
+
+        ends = [edit[1] for edit in edits]
+        last = len(self.chunks) - 1
+        start = 0
+        for number, chunk in enumerate(self.chunks):
+            # The first edit that reaches the chunk tells if any touches it; text added at the end goes to the last
+            index = bisect_left(ends, start)
+            start = chunk[0]
+            if index < len(edits) and (edits[index][0] < start or number == last):
+                chunk[1] = None
+
+            # Edits that start before the end of the chunk move it along
+            index = bisect_right(begins, chunk[0] - 1) - 1
+            if index < 0:
+                continue
+            begin, end, size = edits[index]
+            if chunk[0] >= end:
+                chunk[0] += deltas[index]
+            else:
+                # The end was in the edited text, so the chunk's digest was cleared
+                chunk[0] = begin + size + (deltas[index - 1] if index else 0)
+
+    def update(self, substr, size):
+        """Hash the chunks that changed; `substr(begin, end)` gets the text.  Returns a digest of the text."""
+
+        old = [[size, None]] if self.chunks is None else self.chunks
+        chunks = []
+        start = 0
+        index = 0
+        while index < len(old):
+            if old[index][1] is not None:
+                chunks.append(old[index])
+                start = old[index][0]
+                index += 1
+                continue
+            # Split the changed text; if it doesn't end where a chunk would, carry on into the next chunk
+            while True:
+                final = index == len(old) - 1
+                stop = size if final else old[index][0]
+                pieces, rest = self.split(substr(start, stop), start, final)
+                chunks.extend(pieces)
+                index += 1
+                if not rest:
+                    break
+                start = stop - rest
+            start = stop
+        if start < size:
+            chunks.extend(self.split(substr(start, size), start, True)[0])
+        self.chunks = chunks
+        return hashlib.sha1(b''.join(chunk[1] for chunk in chunks)).digest()
+
+    @staticmethod
+    def split(text, offset, final):
+        """
+        Split the text into chunks; returns the chunks and the length of the text left after the last one.
+
+        The text left over is a chunk of its own if the text is `final`.
+        """
+
+        chunks = []
+        lines = text.split('\n')
+        # The text after the last newline isn't a whole line
+        lines.pop()
+        begin = 0
+        last = 0
+        for index in [index for index, value in enumerate(map(hash, lines)) if not value & CHUNK_MASK]:
+            index += 1
+            pos = begin + sum(map(len, lines[last:index])) + index - last
+            chunks.append([offset + pos, digest(text[begin:pos])])
+            begin = pos
+            last = index
+        rest = len(text) - begin
+        if rest and final:
+            chunks.append([offset + len(text), digest(text[begin:])])
+            rest = 0
+        return chunks, rest
+
+
+def digest(text):
+    """Get the digest of the text."""
+
+    return hashlib.sha1(text.encode('utf-8', 'surrogatepass')).digest()
+
+
+def merge_spans(spans):
+    """Sort and merge overlapping or touching `(begin, end)` spans."""
+
+    merged = []
+    for begin, end in sorted(spans):
+        if merged and begin <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((begin, end))
+    return merged
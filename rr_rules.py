@@ -0,0 +1,319 @@
+"""
+Reg Replace.
+
+Licensed under MIT
+Copyright (c) 2011 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+import codecs
+import fnmatch
+import json
+import os
+import re
+from itertools import chain
+from RegReplace.rr_regions import parse_scope_filter
+
+# Sublime settings files are JSON with comments and trailing commas
+RE_SETTINGS_JUNK = re.compile(
+    r'''(?x)
+        (?P<string>"(?:\\.|[^"\\])*")          # double quoted string
+      | /\*[^*]*\*+(?:[^/*][^*]*\*+)*/          # multi-line comments
+      | //[^\r\n]*                              # single line comments
+      | ,(?=(?:\s|/\*[^*]*\*+(?:[^/*][^*]*\*+)*/|//[^\r\n]*(?![^\r\n]))*[\]}])  # trailing comma
+    ''',
+    re.DOTALL
+)
+
+# Literal text at the end of a glob
+RE_GLOB_TAIL = re.compile(r'[^*?\[\]]*$')
+
+# Global flags at the start of a file regex, and syntax that can't be embedded in a combined pattern:
+# group references (they would refer to other groups) and global flags elsewhere.
+RE_LEADING_FLAGS = re.compile(r'\(\?([aiLmsux]+)\)')
+RE_NOT_EMBEDDABLE = re.compile(r'\\[1-9]|\(\?P=|\(\?\(|\(\?[aiLmsux]+\)')
+
+# How many files' matches each index remembers
+MATCH_CACHE_SIZE = 256
+
+
+def parse_settings(text):
+    """Parse the text of a Sublime settings file."""
+
+    return json.loads(RE_SETTINGS_JUNK.sub(lambda m: m.group('string') or '', text))
+
+
+def load_settings(path):
+    """Load a Sublime settings file."""
+
+    with codecs.open(path, 'r', encoding='utf-8') as f:
+        return parse_settings(f.read())
+
+
+class OnSaveIndex(object):
+    """
+    The `on_save_sequences` entries compiled for quick lookup by file.
+
+    An entry applies to a file if the full path matches one of its `file_pattern` globs, or one of its
+    `file_regex` patterns (case insensitive unless `case` is enabled), or if the view's syntax is one of
+    its `syntax` names (the syntax file's name without its extension, or its full resource path).
+
+    Globs are bucketed by the extension or file name they end with, so only the globs that can match are
+    tried.  The file regexes are also combined into one pattern that rules out most files with a single
+    match.  Results are remembered per file and syntax, so the index must be rebuilt when the entries change.
+    """
+
+    def __init__(self, on_save_sequences):
+        """Compile the entries; invalid file regexes are listed in `errors`."""
+
+        self.entries = list(on_save_sequences)
+        self.errors = []
+        self.dotall = False
+        self.always = []
+        self.extensions = {}
+        self.basenames = {}
+        self.globs = []
+        self.syntaxes = {}
+        self.regexes = []
+        self.combined = None
+        self.cache = {}
+
+        parts = []
+        combine = True
+        for index, item in enumerate(self.entries):
+            for pattern in item.get('file_pattern', []):
+                self.add_glob(index, pattern)
+            for syntax in item.get('syntax', []):
+                self.syntaxes.setdefault(syntax, []).append(index)
+
+            regexes = item.get('file_regex', [])
+            if not regexes:
+                continue
+            flags = 0
+            letters = ''
+            if not bool(item.get('case', False)):
+                flags |= re.IGNORECASE
+                letters += 'i'
+            if bool(item.get('dotall', False)):
+                self.dotall = True
+                flags |= re.DOTALL
+                letters += 's'
+            for regex in regexes:
+                try:
+                    self.regexes.append((index, re.compile(regex, flags)))
+                except Exception as err:
+                    self.errors.append('invalid file_regex "%s": %s' % (regex, err))
+                    continue
+                part = self.embed(regex, letters)
+                if part is None:
+                    combine = False
+                else:
+                    parts.append(part)
+
+        if combine and parts:
+            try:
+                self.combined = re.compile('|'.join(parts))
+            except Exception:
+                # Scoped flags aren't supported by older versions of Python
+                self.combined = None
+
+    def add_glob(self, index, pattern):
+        """Add a `file_pattern` glob to the bucket of the extension or file name it ends with."""
+
+        pattern = os.path.normcase(pattern)
+        if pattern == '*':
+            self.always.append(index)
+            return
+        compiled = re.compile(fnmatch.translate(pattern))
+        # The literal text at the end of the glob
+        tail = RE_GLOB_TAIL.search(pattern).group(0)
+        if os.sep in tail:
+            self.basenames.setdefault(tail[tail.rindex(os.sep) + 1:], []).append((index, compiled))
+        elif '.' in tail:
+            self.extensions.setdefault(tail[tail.rindex('.'):], []).append((index, compiled))
+        else:
+            self.globs.append((index, compiled))
+
+    @staticmethod
+    def embed(regex, letters):
+        """Get the regex as part of the combined pattern, or `None` if it can't be embedded safely."""
+
+        m = RE_LEADING_FLAGS.match(regex)
+        if m is not None:
+            letters += m.group(1)
+            regex = regex[m.end(0):]
+        if 'x' in letters or RE_NOT_EMBEDDABLE.search(regex):
+            return None
+        letters = ''.join(sorted(set(letters)))
+        return '(?%s:%s)' % (letters, regex) if letters else '(?:%s)' % regex
+
+    def match(self, file_name, syntax=None):
+        """Get the entries that apply to the file (and the view's syntax), in order."""
+
+        key = (file_name, syntax)
+        indexes = self.cache.get(key)
+        if indexes is None:
+            indexes = self.lookup(file_name, syntax)
+            if len(self.cache) >= MATCH_CACHE_SIZE:
+                self.cache.clear()
+            self.cache[key] = indexes
+        return [self.entries[index] for index in indexes]
+
+    def lookup(self, file_name, syntax):
+        """Find the indexes of the entries that apply to the file."""
+
+        found = set(self.always)
+        if file_name is not None:
+            name = os.path.normcase(file_name)
+            base = name[name.rfind(os.sep) + 1:]
+            dot = base.rfind('.')
+            candidates = chain(
+                self.basenames.get(base, []),
+                self.extensions.get(base[dot:], []) if dot != -1 else [],
+                self.globs
+            )
+            for index, compiled in candidates:
+                if index not in found and compiled.match(name) is not None:
+                    found.add(index)
+
+            if self.regexes and (self.combined is None or self.combined.match(file_name) is not None):
+                for index, compiled in self.regexes:
+                    if index not in found and compiled.match(file_name) is not None:
+                        found.add(index)
+
+        if syntax:
+            found.update(self.syntaxes.get(syntax, []))
+            name = syntax[syntax.rfind('/') + 1:]
+            found.update(self.syntaxes.get(name[:name.rfind('.')] if '.' in name else name, []))
+        return sorted(found)
+
+
+class Rule(object):
+    """
+    A rule of the rules file with its options resolved.
+
+    Rules are immutable; what is compiled for a rule (its find pattern and replace template for a
+    given engine configuration) is kept in `compiled`, so it is only built once for the life of the rule.
+    The rule's definition can still be read like a dictionary.
+    """
+
+    __slots__ = (
+        'name', 'source', 'find', 'replace', 'scope', 'by_scope', 'scope_filter', 'selection_inputs',
+        'greedy', 'greedy_scope', 'literal', 'literal_ignorecase', 'multi_pass', 'format_replace',
+        'plugin', 'args', 'margin', 'timeout', 'compiled'
+    )
+
+    def __init__(self, name, source):
+        """Resolve the rule's definition."""
+
+        literal = bool(source.get('literal', False))
+        timeout = source.get('timeout')
+        fields = {
+            'name': name,
+            'source': source,
+            'find': source.get('find'),
+            'replace': source.get('replace', r'\g<0>'),
+            'scope': source.get('scope'),
+            'by_scope': 'scope' in source,
+            'scope_filter': parse_scope_filter(source.get('scope_filter', [])),
+            'selection_inputs': bool(source.get('selection_inputs', False)),
+            'greedy': bool(source.get('greedy', True)),
+            'greedy_scope': bool(source.get('greedy_scope', True)),
+            'literal': literal,
+            'literal_ignorecase': literal and bool(source.get('literal_ignorecase', False)),
+            'multi_pass': bool(source.get('multi_pass', False)),
+            'format_replace': bool(source.get('format_replace', False)),
+            'plugin': source.get('plugin'),
+            'args': source.get('args', {}),
+            'margin': source.get('multi_pass_margin'),
+            'timeout': float(timeout) if timeout is not None else None,
+            'compiled': {}
+        }
+        for key, value in fields.items():
+            super(Rule, self).__setattr__(key, value)
+
+    def __setattr__(self, name, value):
+        """Rules can't be changed."""
+
+        raise AttributeError("'Rule' object is read-only")
+
+    def __contains__(self, key):
+        """Check if the rule's definition has the key."""
+
+        return key in self.source
+
+    def __getitem__(self, key):
+        """Get a value of the rule's definition."""
+
+        return self.source[key]
+
+    def get(self, key, default=None):
+        """Get a value of the rule's definition."""
+
+        return self.source.get(key, default)
+
+    def memo(self, key, factory):
+        """Get what was compiled for the rule under the key, or compile it with the factory."""
+
+        value = self.compiled.get(key)
+        if value is None:
+            value = self.compiled[key] = factory()
+        return value
+
+
+class RuleRegistry(object):
+    """
+    The rules of the rules file by name.
+
+    Rules are resolved on first use.  When the rules file changes, `update` only drops the rules
+    whose definitions changed; the others keep what was compiled for them.
+    """
+
+    def __init__(self, rules=None):
+        """Initialize."""
+
+        self.sources = {}
+        self.rules = {}
+        if rules:
+            self.update(rules)
+
+    def update(self, rules):
+        """Use the new rule definitions; returns the names of the rules that changed (or were removed)."""
+
+        kept = {}
+        changed = set(name for name in self.sources if name not in rules)
+        for name, source in rules.items():
+            if self.sources.get(name) != source:
+                changed.add(name)
+            elif name in self.rules:
+                kept[name] = self.rules[name]
+        self.sources = rules
+        self.rules = kept
+        return changed
+
+    def forget_compiled(self):
+        """Drop what was compiled for the rules; used when the engine configuration changes."""
+
+        for rule in list(self.rules.values()):
+            rule.compiled.clear()
+
+    def __len__(self):
+        """Get the number of rules."""
+
+        return len(self.sources)
+
+    def __contains__(self, name):
+        """Check if there is a rule with the name."""
+
+        return name in self.sources
+
+    def __getitem__(self, name):
+        """Get the rule."""
+
+        rule = self.rules.get(name)
+        if rule is None:
+            rule = self.rules[name] = Rule(name, self.sources[name])
+        return rule
+
+    def get(self, name, default=None):
+        """Get the rule, or the default if there isn't one."""
+
+        return self[name] if name in self.sources else default
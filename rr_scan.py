@@ -0,0 +1,86 @@
+"""
+Reg Replace.
+
+Licensed under MIT
+Copyright (c) 2011 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+# Regions with less text than this in all are searched one at a time; threads wouldn't pay for themselves
+MIN_PARALLEL_SIZE = 64 * 1024
+
+# Batches each thread gets, so a few large regions don't leave the other threads idle
+BATCHES_PER_THREAD = 4
+
+
+class ScanPool(object):
+    """
+    Process wide pool of threads that search regions in parallel.
+
+    The pool is only created when first used, and is created again if the number of threads changes.
+    """
+
+    threads = 0
+    _executor = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, threads):
+        """Get the pool with the given number of threads."""
+
+        with cls._lock:
+            if cls._executor is None or cls.threads != threads:
+                if cls._executor is not None:
+                    cls._executor.shutdown(wait=False)
+                cls._executor = ThreadPoolExecutor(max_workers=threads)
+                cls.threads = threads
+            return cls._executor
+
+    @classmethod
+    def shutdown(cls):
+        """Shut the pool down; searches already running are left to finish."""
+
+        with cls._lock:
+            if cls._executor is not None:
+                cls._executor.shutdown(wait=False)
+            cls._executor = None
+            cls.threads = 0
+
+
+def batch_regions(sizes, threads):
+    """Split the regions, by their sizes, into consecutive batches of about the same amount of text."""
+
+    target = max(1, sum(sizes) // (threads * BATCHES_PER_THREAD))
+    batches = []
+    begin = 0
+    total = 0
+    for index, size in enumerate(sizes, 1):
+        total += size
+        if total >= target:
+            batches.append((begin, index))
+            begin = index
+            total = 0
+    if begin < len(sizes):
+        batches.append((begin, len(sizes)))
+    return batches
+
+
+def search_strings(pattern, strings, first, kwargs, cancelled=None):
+    """
+    Find the matches of the pattern in each string, or only the first match with `first`.
+
+    This runs on the scan threads: the `regex` module is told it can release the GIL while it searches,
+    as the strings aren't changed while it does.  Strings are skipped once the run has been cancelled.
+    """
+
+    found = []
+    for string in strings:
+        if cancelled is not None and cancelled.is_set():
+            found.append([])
+        elif first:
+            m = pattern.search(string, concurrent=True, **kwargs)
+            found.append([m] if m is not None else [])
+        else:
+            found.append(list(pattern.finditer(string, concurrent=True, **kwargs)))
+    return found
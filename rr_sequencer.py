@@ -6,9 +6,19 @@ Copyright (c) 2011 - 2016 Isaac Muse <isaacmuse@gmail.com>
 """
 import sublime
 import sublime_plugin
-import re
-from fnmatch import fnmatch
-from RegReplace.rr_replacer import FindReplace
+import os
+import time
+import traceback
+from array import array
+from bisect import bisect_left
+from RegReplace.rr_replacer import FindReplace, SnapshotBuffer
+from RegReplace.rr_engine import EngineOptions
+from RegReplace.rr_background import BackgroundJob
+from RegReplace.rr_rules import OnSaveIndex, RuleRegistry
+from RegReplace.rr_cache import PatternCache, DEFAULT_CACHE_SIZE
+from RegReplace.rr_scan import ScanPool
+from RegReplace.rr_plugin import Plugin
+from RegReplace.rr_profile import Profiler
 from RegReplace.rr_notify import error, deprecated, DEPRECATED_DOTALL
 
 
@@ -16,11 +26,25 @@ DEFAULT_SHOW_PANEL = False
 DEFAULT_HIGHLIGHT_COLOR = 'invalid'
 DEFAULT_HIGHLIGHT_STYLE = 'outline'
 DEFAULT_MULTI_PASS_MAX_SWEEP = 100
+DEFAULT_LAZY_HIGHLIGHT_THRESHOLD = 0
+LAZY_HIGHLIGHT_POLL = 250
 MODULE_NAME = 'RegReplace'
 
 rrsettings = {}
 rrsettingsrules = {}
 
+# Rules that ran out of time, skipped for the rest of the session (or until the rules change)
+quarantined = set()
+
+# The `on_save_sequences` compiled for lookup; rebuilt when the settings change
+on_save_index = OnSaveIndex([])
+
+# The rules, resolved on first use and kept until they change
+rule_registry = RuleRegistry()
+
+# The engine's settings, resolved once; resolved again when the settings change
+engine_options = None
+
 
 def underline(regions):
     """Convert to empty regions."""
@@ -35,6 +59,152 @@ def underline(regions):
     return new_regions
 
 
+class LazyHighlights(object):
+    """
+    Highlight only the regions in and near the visible viewport.
+
+    The full set of regions is kept in a compact, sorted index, and the
+    highlights are extended as the viewport moves.
+    """
+
+    active = {}
+
+    def __init__(self, view, key, regions, color, style, underline_regions):
+        """Initialize."""
+
+        self.view = view
+        self.key = key
+        self.color = color
+        self.style = style
+        self.underline = underline_regions
+        self.change_count = view.change_count()
+        self.rendered = None
+        regions = sorted((region.begin(), region.end()) for region in regions)
+        self.starts = array('l', [region[0] for region in regions])
+        self.ends = array('l', [region[1] for region in regions])
+        self.longest = max([end - begin for begin, end in regions]) if regions else 0
+
+    def __len__(self):
+        """Get total number of regions."""
+
+        return len(self.starts)
+
+    @classmethod
+    def start(cls, view, key, regions, color, style, underline_regions):
+        """Start lazily highlighting the regions."""
+
+        cls.stop(view, key)
+        highlights = cls(view, key, regions, color, style, underline_regions)
+        cls.active[(view.id(), key)] = highlights
+        highlights.poll()
+
+    @classmethod
+    def stop(cls, view, key):
+        """Stop extending the highlights of the given key."""
+
+        cls.active.pop((view.id(), key), None)
+
+    def is_active(self):
+        """Check if the highlights should still be extended."""
+
+        return (
+            self.view.is_valid() and
+            self.active.get((self.view.id(), self.key)) is self and
+            self.view.change_count() == self.change_count
+        )
+
+    def poll(self):
+        """Extend highlights to the viewport until stopped or the view changes."""
+
+        if not self.is_active():
+            self.stop(self.view, self.key)
+            return
+        self.update()
+        sublime.set_timeout(self.poll, LAZY_HIGHLIGHT_POLL)
+
+    def update(self):
+        """Render the regions around the viewport if it has moved outside the rendered area."""
+
+        visible = self.view.visible_region()
+        margin = max(visible.size(), 1024)
+        begin = max(0, visible.begin() - margin)
+        end = visible.end() + margin
+        if self.rendered is not None:
+            if self.rendered[0] <= visible.begin() and visible.end() <= self.rendered[1]:
+                return
+            if begin <= self.rendered[1] and self.rendered[0] <= end:
+                # Extend the rendered area
+                begin = min(begin, self.rendered[0])
+                end = max(end, self.rendered[1])
+        self.rendered = (begin, end)
+
+        regions = []
+        index = bisect_left(self.starts, begin - self.longest)
+        count = len(self.starts)
+        while index < count and self.starts[index] < end:
+            if self.ends[index] > begin or self.starts[index] == self.ends[index] == begin:
+                regions.append(sublime.Region(self.starts[index], self.ends[index]))
+            index += 1
+        if self.underline:
+            regions = underline(regions)
+        self.view.add_regions(self.key, regions, self.color, "", self.style)
+
+
+class FindResults(object):
+    """
+    What a find only run found in a view, kept while the replace prompt is shown.
+
+    If the targets are to be replaced, the run that replaces them uses what was found instead of searching
+    again, as long as the view hasn't changed since (its change count is the same) and the sequence is run
+    the same way.  Any other run in the view forgets what was found, and only the last find is kept.
+    """
+
+    results = {}
+
+    def __init__(self, view, key, found):
+        """Initialize."""
+
+        self.change_count = view.change_count()
+        self.key = key
+        self.found = found
+        self.confirmed = False
+
+    @classmethod
+    def keep(cls, view, key, found):
+        """Keep what a find found in the view."""
+
+        cls.results.clear()
+        cls.results[view.id()] = cls(view, key, found)
+
+    @classmethod
+    def confirm(cls, view):
+        """Let the next run in the view use what was found."""
+
+        results = cls.results.get(view.id())
+        if results is not None:
+            results.confirmed = True
+
+    @classmethod
+    def discard(cls, view):
+        """Forget what was found in the view, unless the targets are about to be replaced."""
+
+        results = cls.results.get(view.id())
+        if results is not None and not results.confirmed:
+            del cls.results[view.id()]
+
+    @classmethod
+    def take(cls, view, key):
+        """Get what was found in the view, if the run was confirmed and it still applies; it is forgotten either way."""
+
+        results = cls.results.pop(view.id(), None)
+        if (
+            results is None or not results.confirmed or results.key != key or
+            results.change_count != view.change_count()
+        ):
+            return None
+        return results.found
+
+
 class RegReplaceGlobal(object):
     """Global object to aid in replacing text in a view."""
 
@@ -58,6 +228,41 @@ class RegReplaceApplyCommand(sublime_plugin.TextCommand):
         self.view.replace(edit, RegReplaceGlobal.region, RegReplaceGlobal.bfr)
 
 
+class RegReplaceFinishCommand(sublime_plugin.TextCommand):
+    """Command to apply the results of a sequence that ran in the background."""
+
+    def run(self, edit, job):
+        """Finish the job if it is still the view's current job."""
+
+        job = BackgroundJob.get(self.view, job)
+        if job is not None:
+            job.finish(edit)
+
+
+class RegReplaceCancelCommand(sublime_plugin.TextCommand):
+    """Command to cancel a sequence running in the background."""
+
+    def run(self, edit):
+        """Cancel the view's background sequence."""
+
+        BackgroundJob.cancel(self.view)
+
+    def is_enabled(self):
+        """Only enable when a sequence is running in the background."""
+
+        return BackgroundJob.is_running(self.view)
+
+
+class RegReplaceReloadPluginsCommand(sublime_plugin.ApplicationCommand):
+    """Command to force replace plugins to be reloaded."""
+
+    def run(self):
+        """Forget all cached plugins."""
+
+        Plugin.reload()
+        sublime.status_message('RegReplace: plugins will be reloaded on next use')
+
+
 class RegReplaceListenerCommand(sublime_plugin.EventListener):
     """Event listener command."""
 
@@ -67,7 +272,6 @@ class RegReplaceListenerCommand(sublime_plugin.EventListener):
         match = False
         file_name = view.file_name()
         if file_name is not None and rrsettings.get('on_save', False):
-            replacements = rrsettings.get('on_save_sequences', [])
             scope = rrsettings.get('on_save_highlight_scope', None)
             style = rrsettings.get('on_save_highlight_style', None)
             self.options["key"] = MODULE_NAME
@@ -75,31 +279,9 @@ class RegReplaceListenerCommand(sublime_plugin.EventListener):
                 self.options["scope"] = scope
             if style is not None:
                 self.options["style"] = style
-            for item in replacements:
-                found = False
-                if 'file_pattern' in item:
-                    for pattern in item['file_pattern']:
-                        if fnmatch(file_name, pattern):
-                            found = True
-                            self.select(item)
-                            break
-                if not found and 'file_regex' in item:
-                    for regex in item['file_regex']:
-                        try:
-                            flags = 0
-                            if 'case' not in item or not bool(item['case']):
-                                flags |= re.IGNORECASE
-                            if 'dotall' in item and bool(item['dotall']):
-                                deprecated(DEPRECATED_DOTALL)
-                                flags |= re.DOTALL
-                            r = re.compile(regex, flags)
-                            if r.match(file_name) is not None:
-                                found = True
-                                self.select(item)
-                                break
-                        except Exception:
-                            pass
-                match |= found
+            for item in on_save_index.match(file_name, view.settings().get('syntax')):
+                self.select(item)
+                match = True
         return match
 
     def select(self, item):
@@ -128,23 +310,6 @@ class RegReplaceListenerCommand(sublime_plugin.EventListener):
                 }
             )
 
-    def apply(self, view, replacements, options=None, multi_pass=False, action=None):
-        """Run the actual RegReplace command."""
-
-        if options is None:
-            options = {}
-
-        view.run_command(
-            'reg_replace',
-            {
-                "replacements": replacements,
-                'action': action,
-                'options': options,
-                'multi_pass': multi_pass,
-                'no_selection': True
-            }
-        )
-
     def on_pre_save(self, view):
         """Perform searches and specified action on file save."""
 
@@ -155,17 +320,18 @@ class RegReplaceListenerCommand(sublime_plugin.EventListener):
         self.multi_pass = False
         self.options = {}
         if self.find_replacements(view):
-            for replacements in self.replacements:
-                self.apply(view, replacements['sequence'], multi_pass=replacements["multi_pass"])
-
+            # Replacements first, in order, then the actions
+            plan = list(self.replacements)
             if len(self.highlights) > 0:
-                self.apply(view, self.highlights, action="mark", options=self.options)
+                plan.append({'sequence': self.highlights, 'action': 'mark', 'options': self.options})
 
             if len(self.folds) > 0:
-                self.apply(view, self.folds, action="fold")
+                plan.append({'sequence': self.folds, 'action': 'fold'})
 
             if len(self.unfolds) > 0:
-                self.apply(view, self.unfolds, action="unfold")
+                plan.append({'sequence': self.unfolds, 'action': 'unfold'})
+
+            view.run_command('reg_replace_on_save', {'plan': plan})
 
 
 class RegReplaceCommand(sublime_plugin.TextCommand):
@@ -177,6 +343,7 @@ class RegReplaceCommand(sublime_plugin.TextCommand):
         """Forget current view."""
 
         self.handshake = None
+        FindResults.discard(self.view)
         self.clear_highlights(MODULE_NAME)
         self.replace_obj.close()
 
@@ -210,6 +377,8 @@ class RegReplaceCommand(sublime_plugin.TextCommand):
         view = window.active_view() if window is not None else None
         if view is not None:
             if self.handshake is not None and self.handshake == view.id():
+                # The run can replace the targets that were found instead of searching again
+                FindResults.confirm(view)
                 self.forget_handshake()
                 # re-run command to actually replace targets
                 view.run_command(
@@ -240,20 +409,34 @@ class RegReplaceCommand(sublime_plugin.TextCommand):
             cleared = True
         return cleared
 
-    def set_highlights(self, key, style, color):
+    def set_highlights(self, key, style, color, lazy=False):
         """Mark regions with specified highlight options."""
 
         # Process highlight style
         highlight_style = 0
+        underline_regions = False
         if (self.find_only and self.selection_only) or style == 'underline':
             # Use underline if explicitly requested,
             # or if doing a find only when under a selection only (only underline can be seen through a selection)
-            self.replace_obj.target_regions = underline(self.replace_obj.target_regions)
+            underline_regions = True
             highlight_style = sublime.DRAW_EMPTY_AS_OVERWRITE
         elif style == 'outline':
             highlight_style = sublime.DRAW_OUTLINED
 
+        # Only highlight the regions near the viewport if there are too many
+        threshold = rrsettings.get('find_highlight_lazy_threshold', DEFAULT_LAZY_HIGHLIGHT_THRESHOLD)
+        if lazy and threshold and len(self.replace_obj.target_regions) > threshold:
+            self.view.erase_regions(key)
+            LazyHighlights.start(
+                self.view, key, self.replace_obj.target_regions, color, highlight_style, underline_regions
+            )
+            return True
+
+        if underline_regions:
+            self.replace_obj.target_regions = underline(self.replace_obj.target_regions)
+
         # highlight all of the found regions
+        LazyHighlights.stop(self.view, key)
         self.view.erase_regions(key)
         self.view.add_regions(
             key,
@@ -262,10 +445,12 @@ class RegReplaceCommand(sublime_plugin.TextCommand):
             "",
             highlight_style
         )
+        return False
 
     def clear_highlights(self, key):
         """Clear all highlighted regions of given key."""
 
+        LazyHighlights.stop(self.view, key)
         self.view.erase_regions(key)
 
     def is_selection_available(self):
@@ -347,6 +532,9 @@ class RegReplaceCommand(sublime_plugin.TextCommand):
         elif self.action == 'select':
             self.view.sel().clear()
             self.view.sel().add_all(self.replace_obj.target_regions)
+        elif self.action == 'count':
+            # Counts are reported in the results
+            pass
         else:
             # Not a valid action
             status = False
@@ -359,64 +547,125 @@ class RegReplaceCommand(sublime_plugin.TextCommand):
         If allowed, replacements will be done as well.
         """
 
-        if self.use_test_buffer:
-            replace_list = sublime.load_settings('reg_replace_test.sublime-settings').get('replacements', {})
-        else:
-            replace_list = rrsettingsrules.get('replacements', {})
+        replace_list = self.get_rules()
         result_template = '%s: %d regions;\n' if self.panel_display else '%s: %d regions; '
+        fused_template = 'Fused: %s;\n' if self.panel_display else 'Fused: %s; '
+        cycle_template = 'Cycle: %s (%s);\n' if self.panel_display else 'Cycle: %s (%s); '
+        note_template = '%s: %s;\n' if self.panel_display else '%s: %s; '
         results = ''
 
+        # Rules that ran out of time earlier in the session are skipped
+        sequence = [name for name in self.replacements if name not in quarantined]
+        skipped = [name for name in self.replacements if name in quarantined]
+
         # Walk the sequence
         # Multi-pass only if requested and will be occurring
-        if self.multi_pass and not self.find_only and self.action is None:
-            # Multi-pass initialization
-            current_replacements = 0
-            total_replacements = 0
-            count = 0
-
-            # Sweep file until all instances are found
-            # Avoid infinite loop and break out if sweep threshold is met
-            while count < self.max_sweeps:
-                count += 1
-                current_replacements = 0
-
-                for replacement in self.replacements:
-                    # Is replacement available in the list?
-                    if replacement in replace_list:
-                        pattern = replace_list[replacement]
-                        current_replacements += self.replace_obj.search(pattern, 'scope' in pattern)
-                total_replacements += current_replacements
-
-                # No more regions found?
-                if current_replacements == 0:
-                    break
+        multi_pass = self.multi_pass and not self.find_only and self.action is None
+        if self.profiler is not None and self.profiler.started is None:
+            self.profiler.start()
+        result = self.replace_obj.apply_sequence(sequence, replace_list, multi_pass, self.fuse_rules)
+        notes = ''.join([fused_template % ', '.join(names) for names in result.fused])
+        if result.timed_out:
+            notes += note_template % ('Timed out', ', '.join(result.timed_out))
+            print('\n'.join(['RegReplace: "%s" ran out of time and was aborted!' % r for r in result.timed_out]))
+            if rrsettings.get('quarantine_timed_out_rules', False):
+                quarantined.update(result.timed_out)
+        if result.out_of_time is not None:
+            notes += note_template % ('Out of time at', result.out_of_time)
+            print('RegReplace: the sequence ran out of time at "%s"!' % result.out_of_time)
+        if skipped:
+            notes += note_template % ('Quarantined', ', '.join(skipped))
+        if multi_pass:
             # Record total regions found
-            results += 'Regions Found: %d regions;' % total_replacements
+            results += 'Regions Found: %d regions;' % result.total
+            if result.cycle is not None:
+                names, period = result.cycle
+                every = 'every sweep' if period == 1 else 'every %d sweeps' % period
+                notes += cycle_template % (', '.join(names), every)
+            if notes:
+                results += ' ' + notes
         else:
-            not_found = []
-            for replacement in self.replacements:
-                # Is replacement available in the list?
-                if replacement in replace_list:
-                    pattern = replace_list[replacement]
-                    results += result_template % (replacement, self.replace_obj.search(pattern, 'scope' in pattern))
-                else:
-                    not_found.append(replacement)
-            if not_found:
-                error("%d rules not found! See console." % len(not_found))
-                print('\n'.join(['RegReplace: "%s" not found!' % r for r in not_found]))
+            for replacement, replaced in result.counts:
+                results += result_template % (replacement, replaced)
+            results += notes
+            if result.not_found:
+                error("%d rules not found! See console." % len(result.not_found))
+                print('\n'.join(['RegReplace: "%s" not found!' % r for r in result.not_found]))
         return results
 
+    def get_rules(self):
+        """Get the rules; the test rules are only read once per command."""
+
+        if self.rules is None:
+            if self.use_test_buffer:
+                self.rules = RuleRegistry(
+                    sublime.load_settings('reg_replace_test.sublime-settings').get('replacements', {})
+                )
+            else:
+                self.rules = rule_registry
+        return self.rules
+
+    def commit(self):
+        """Apply the shadow buffer to the view if one was used."""
+
+        self.replace_obj.commit()
+        if self.profiler is not None:
+            self.profiler.stop()
+
+    def report_profile(self, results):
+        """Write the profile to the profile file and add it to the results."""
+
+        file_name = rrsettings.get('profile_file', '')
+        if not file_name:
+            file_name = os.path.join(sublime.cache_path(), MODULE_NAME, 'profile.jsonl')
+        try:
+            folder = os.path.dirname(file_name)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            self.profiler.write(
+                file_name,
+                time=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                file=self.view.file_name(),
+                size=self.view.size(),
+                sequence=self.replacements,
+                multi_pass=self.multi_pass,
+                find_only=self.find_only,
+                action=self.action,
+                selection_only=self.selection_only,
+                fuse_rules=self.fuse_rules,
+                background=self.background
+            )
+            written = 'Profile written to: %s\n' % file_name
+        except Exception:
+            print(str(traceback.format_exc()))
+            written = 'Profile could not be written to: %s\n' % file_name
+        return '%s\n\n%s\n%s' % (results, self.profiler.report(), written)
+
     def start_sequence(self):
-        """Run the replace sequence."""
+        """Run the replace sequence, in the background if enabled."""
+
+        if self.background:
+            BackgroundJob.start(self)
+            return
 
         # Find targets and replace if applicable
         results = self.find_and_replace()
+        self.commit()
+        self.finish_sequence(results)
+
+    def finish_sequence(self, results):
+        """Highlight, perform the action, and report the results of the sequence."""
 
         if self.find_only:
             # Highlight regions
             style = rrsettings.get('find_highlight_style', DEFAULT_HIGHLIGHT_STYLE)
             color = rrsettings.get('find_highlight_color', DEFAULT_HIGHLIGHT_COLOR)
-            self.set_highlights(MODULE_NAME, style, color)
+            if self.set_highlights(MODULE_NAME, style, color, lazy=True):
+                # Not all regions are drawn, so report the full count
+                self.print_results_status_bar(results)
+            if self.profiler is not None:
+                self.print_results_panel(self.report_profile(results))
+            FindResults.keep(self.view, self.find_key(), self.replace_obj.found)
             self.replace_prompt()
         else:
             self.clear_highlights(MODULE_NAME)
@@ -425,18 +674,58 @@ class RegReplaceCommand(sublime_plugin.TextCommand):
                 if not self.perform_action():
                     results = 'Error: %s - Bad Action!' % self.action
 
-            # Report results
-            if self.panel_display:
-                self.print_results_panel(results)
-            else:
-                self.print_results_status_bar(results)
+            self.report(results)
             self.replace_obj.close()
 
+    def find_key(self):
+        """Identify the run as far as what its rules find is concerned."""
+
+        sels = tuple((sel.begin(), sel.end()) for sel in self.view.sel()) if self.selection_only else None
+        return (
+            tuple(self.replacements), self.replace_obj.options.key, self.selection_only, self.full_file, sels
+        )
+
+    def report(self, results):
+        """Report the results."""
+
+        if self.profiler is not None:
+            # The profile is too much for the status bar
+            self.print_results_panel(self.report_profile(results))
+        elif self.panel_display:
+            self.print_results_panel(results)
+        else:
+            self.print_results_status_bar(results)
+
+    def create_replacer(self, edit):
+        """Create the find and replace object; background runs work on a snapshot of the view."""
+
+        self.profiler = Profiler(bool(rrsettings.get('profile_memory', True))) if self.profile else None
+        if self.background:
+            buffer = SnapshotBuffer(self.view)
+            # Replacements made on a snapshot are applied to the view at the end
+            shadow = not self.find_only and self.action is None
+        else:
+            buffer = None
+            shadow = self.shadow_buffer
+        return FindReplace(
+            self.view,
+            edit,
+            self.find_only,
+            self.full_file,
+            self.selection_only,
+            self.max_sweeps,
+            self.action,
+            shadow,
+            self.profiler,
+            buffer,
+            engine_options
+        )
+
     def run(
         self, edit, replacements=None,
         find_only=False, clear=False, action=None,
         multi_pass=False, no_selection=False, regex_full_file_with_selections=False,
-        options=None, use_test_buffer=False
+        options=None, use_test_buffer=False, shadow_buffer=None, fuse_rules=None, profile=None, background=None
     ):
         """Kick off sequence."""
 
@@ -446,6 +735,7 @@ class RegReplaceCommand(sublime_plugin.TextCommand):
             options = {}
 
         self.use_test_buffer = bool(use_test_buffer)
+        self.rules = None
         self.find_only = bool(find_only)
         self.action = action.strip() if action is not None else action
         self.full_file = bool(regex_full_file_with_selections)
@@ -459,17 +749,34 @@ class RegReplaceCommand(sublime_plugin.TextCommand):
         self.panel_display = rrsettings.get('results_in_panel', DEFAULT_SHOW_PANEL)
         self.options = options
         self.clear = clear
-
-        self.replace_obj = FindReplace(
-            self.view,
-            edit,
-            self.find_only,
-            self.full_file,
-            self.selection_only,
-            self.max_sweeps,
-            self.action
+        if shadow_buffer is None:
+            shadow_buffer = rrsettings.get('shadow_buffer', False)
+        # The shadow buffer is only used when replacing outside of selections
+        self.shadow_buffer = (
+            bool(shadow_buffer) and not self.find_only and self.action is None and not self.selection_only
+        )
+        if fuse_rules is None:
+            fuse_rules = rrsettings.get('fuse_rules', False)
+        # Fusing only applies to replacing outside of selections
+        self.fuse_rules = (
+            bool(fuse_rules) and not self.find_only and self.action is None and not self.selection_only
+        )
+        if profile is None:
+            profile = rrsettings.get('profile', False)
+        self.profile = bool(profile)
+        if background is None:
+            background = rrsettings.get('background', False)
+        # Replacing under selections edits the view as it goes, so it can't run on a snapshot
+        self.background = bool(background) and (
+            self.find_only or self.action is not None or not self.selection_only
         )
 
+        # A new run replaces a run still going in the background
+        BackgroundJob.cancel(self.view)
+        self.replace_obj = self.create_replacer(edit)
+        # Replacing the targets of a find can use what the find found
+        self.replace_obj.reuse = FindResults.take(self.view, self.find_key())
+
         # Clear regions and exit; no need to run sequences
         if self.clear_regions():
             self.replace_obj.close()
@@ -482,6 +789,124 @@ class RegReplaceCommand(sublime_plugin.TextCommand):
             self.replace_obj.close()
 
 
+class RegReplaceOnSaveCommand(RegReplaceCommand):
+    """
+    Command to apply everything that applies to a file on save in one go.
+
+    The plan holds the replace sequences, in order, followed by the mark, fold, and unfold actions.
+    Everything shares one find and replace object, and the rules and scopes are only looked up once.  With
+    `shadow_buffer` enabled, the replace sequences run against one shadow buffer that is applied to the view
+    before the actions (or before a sequence that needs the view's scopes).
+    """
+
+    def run(self, edit, plan):
+        """Apply the plan."""
+
+        self.use_test_buffer = False
+        self.rules = None
+        self.find_only = False
+        self.action = None
+        self.full_file = False
+        self.selection_only = False
+        self.max_sweeps = rrsettings.get('multi_pass_max_sweeps', DEFAULT_MULTI_PASS_MAX_SWEEP)
+        self.replacements = []
+        self.multi_pass = False
+        self.panel_display = rrsettings.get('results_in_panel', DEFAULT_SHOW_PANEL)
+        self.options = {}
+        self.clear = False
+        self.shadow_buffer = bool(rrsettings.get('shadow_buffer', False))
+        self.fuse_rules = bool(rrsettings.get('fuse_rules', False))
+        self.profile = bool(rrsettings.get('profile', False))
+        # The view must be edited before it is saved
+        self.background = False
+
+        BackgroundJob.cancel(self.view)
+        self.replace_obj = self.create_replacer(edit)
+        self.clear_highlights(MODULE_NAME)
+
+        results = []
+        names = []
+        committed = False
+        for step in plan:
+            if not step['sequence']:
+                continue
+            action = step.get('action')
+            if action is not None and not committed:
+                # Actions work on the text as it is after the replacements
+                self.replace_obj.commit()
+                committed = True
+            elif self.shadow_buffer and self.replace_obj.shadow.modified() and self.uses_scopes(step['sequence']):
+                # Scopes are only known for the view's text, so earlier replacements must be applied first
+                self.replace_obj.commit()
+            self.action = self.replace_obj.action = action
+            self.replace_obj.target_regions = []
+            self.replacements = step['sequence']
+            self.multi_pass = bool(step.get('multi_pass', False))
+            self.options = step.get('options', {})
+            names.extend(self.replacements)
+            result = self.find_and_replace()
+            if action is not None and not self.perform_action():
+                result = 'Error: %s - Bad Action!' % action
+            results.append(result.strip())
+        self.commit()
+
+        if results:
+            # Report the whole plan as one sequence
+            self.replacements = names
+            self.action = None
+            self.multi_pass = False
+            self.report(('\n' if self.panel_display else ' ').join(results))
+        self.replace_obj.close()
+
+    def uses_scopes(self, sequence):
+        """Check if any rule of the sequence searches by scope or filters its matches by scope."""
+
+        rules = self.get_rules()
+        for name in sequence:
+            rule = rules.get(name)
+            if rule is not None and (rule.by_scope or rule.scope_filter):
+                return True
+        return False
+
+
+def reset_pattern_cache():
+    """Clear compiled patterns and quarantined rules, and check plugins again, when the settings or rules change."""
+
+    quarantined.clear()
+    Plugin.purge()
+    PatternCache.clear()
+    PatternCache.resize(rrsettings.get('pattern_cache_size', DEFAULT_CACHE_SIZE))
+
+
+def reset_rule_registry():
+    """Update the rules when the rules file changes; only the rules that changed are resolved again."""
+
+    rule_registry.update(rrsettingsrules.get('replacements', {}))
+
+
+def reset_engine_options():
+    """Resolve the engine's settings when the settings change."""
+
+    global engine_options
+    options = EngineOptions(rrsettings)
+    if engine_options is not None and options.key != engine_options.key:
+        # Patterns compiled for the rules depend on the engine
+        rule_registry.forget_compiled()
+    engine_options = options
+
+
+def reset_on_save_index():
+    """Compile the `on_save_sequences` for lookup when the settings change."""
+
+    global on_save_index
+    on_save_index = OnSaveIndex(rrsettings.get('on_save_sequences', []))
+    if on_save_index.dotall:
+        deprecated(DEPRECATED_DOTALL)
+    if on_save_index.errors:
+        error('Errors in "on_save_sequences"! See console.')
+        print('\n'.join(['RegReplace: %s' % err for err in on_save_index.errors]))
+
+
 def plugin_loaded():
     """Setup plugin."""
 
@@ -489,3 +914,25 @@ def plugin_loaded():
     global rrsettingsrules
     rrsettings = sublime.load_settings('reg_replace.sublime-settings')
     rrsettingsrules = sublime.load_settings('reg_replace_rules.sublime-settings')
+    reset_pattern_cache()
+    reset_on_save_index()
+    reset_rule_registry()
+    reset_engine_options()
+    rrsettings.add_on_change('reg_replace_pattern_cache', reset_pattern_cache)
+    rrsettings.add_on_change('reg_replace_on_save_index', reset_on_save_index)
+    rrsettings.add_on_change('reg_replace_engine_options', reset_engine_options)
+    rrsettingsrules.add_on_change('reg_replace_pattern_cache', reset_pattern_cache)
+    rrsettingsrules.add_on_change('reg_replace_rule_registry', reset_rule_registry)
+
+
+def plugin_unloaded():
+    """Tear down plugin."""
+
+    rrsettings.clear_on_change('reg_replace_pattern_cache')
+    rrsettings.clear_on_change('reg_replace_on_save_index')
+    rrsettings.clear_on_change('reg_replace_engine_options')
+    rrsettingsrules.clear_on_change('reg_replace_pattern_cache')
+    rrsettingsrules.clear_on_change('reg_replace_rule_registry')
+    rule_registry.update({})
+    PatternCache.clear()
+    ScanPool.shutdown()
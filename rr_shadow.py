@@ -0,0 +1,239 @@
+"""
+Reg Replace.
+
+Licensed under MIT
+Copyright (c) 2011 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+from bisect import bisect_right
+
+
+def common_prefix(a, b):
+    """Get the length of the text both strings start with."""
+
+    size = min(len(a), len(b))
+    if not size or a[0] != b[0]:
+        return 0
+    if a[:size] == b[:size]:
+        return size
+    # The first `low` characters are the same, the first `high + 1` are not
+    low, high = 1, size - 1
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[low:mid] == b[low:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def common_suffix(a, b, limit):
+    """Get the length, up to `limit`, of the text both strings end with."""
+
+    size_a = len(a)
+    size_b = len(b)
+    size = min(size_a, size_b, limit)
+    if not size or a[-1] != b[-1]:
+        return 0
+    if a[size_a - size:] == b[size_b - size:]:
+        return size
+    low, high = 1, size - 1
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[size_a - mid:size_a - low] == b[size_b - mid:size_b - low]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def trim_edit(original, text):
+    """
+    Get how much of the start and the end of the original text the new text leaves as is.
+
+    Returns `(prefix, suffix)`, or `None` if the text is the same.
+    """
+
+    if original == text:
+        return None
+    # Most edits change the first or the last character
+    prefix = common_prefix(original, text) if original[:1] == text[:1] else 0
+    if original[-1:] != text[-1:]:
+        return prefix, 0
+    return prefix, common_suffix(original, text, min(len(original), len(text)) - prefix)
+
+
+class ShadowBuffer(object):
+    """
+    In-memory copy of a buffer that tracks edits against the original text.
+
+    Edited spans are kept as a sorted list of `[orig_start, orig_end, cur_start, cur_end]`
+    so positions can be mapped between the original buffer and the current text.
+    """
+
+    def __init__(self, text):
+        """Initialize."""
+
+        self.original = text
+        self.text = text
+        self.spans = []
+        self.starts = []
+
+    def size(self):
+        """Get the size of the current text."""
+
+        return len(self.text)
+
+    def substr(self, begin, end):
+        """Get a portion of the current text."""
+
+        return self.text[begin:end]
+
+    def modified(self):
+        """Check if the text has been edited."""
+
+        return bool(self.spans)
+
+    def apply(self, edits):
+        """
+        Apply a batch of edits.
+
+        Edits are `(begin, end, text)` in current coordinates.  They must not overlap
+        and are applied as if they were all made against the current text.
+        """
+
+        if not edits:
+            return
+        edits = sorted(edits, key=lambda e: (e[0], e[1]))
+
+        # Rebuild the text
+        pieces = []
+        last = 0
+        for begin, end, text in edits:
+            pieces.append(self.text[last:begin])
+            pieces.append(text)
+            last = end
+        pieces.append(self.text[last:])
+        self.text = ''.join(pieces)
+
+        # Merge the edits with the existing spans they touch; spans between the edits
+        # are only moved, so they are copied over a slice at a time.
+        old = self.spans
+        starts = self.starts
+        count = len(old)
+        spans = []
+        shift = 0
+        index = 0
+        edit_index = 0
+        while edit_index < len(edits):
+            begin, end = edits[edit_index][:2]
+            stop = bisect_right(starts, begin, index)
+            if stop > index and old[stop - 1][3] >= begin:
+                stop -= 1
+            self._move(old, index, stop, shift, spans)
+            index = stop
+            delta = old[index - 1][3] - old[index - 1][1] if index else 0
+
+            # Gather everything that touches the edit
+            group = [begin, end, []]
+            while True:
+                if edit_index < len(edits) and edits[edit_index][0] <= group[1]:
+                    item = edits[edit_index]
+                    edit_index += 1
+                elif index < count and old[index][2] <= group[1]:
+                    item = old[index]
+                    index += 1
+                else:
+                    break
+                if len(item) == 4:
+                    group[0] = min(group[0], item[2])
+                    group[1] = max(group[1], item[3])
+                else:
+                    group[1] = max(group[1], item[1])
+                group[2].append(item)
+            shift = self._close_group(group, delta, shift, spans)[1]
+        self._move(old, index, count, shift, spans)
+        self.spans = spans
+        self.starts = [span[2] for span in spans]
+
+    @staticmethod
+    def _move(spans, begin, end, shift, dest):
+        """Copy untouched spans to `dest`, moving their current positions by `shift`."""
+
+        if shift:
+            dest.extend([[s[0], s[1], s[2] + shift, s[3] + shift] for s in spans[begin:end]])
+        else:
+            dest.extend(spans[begin:end])
+
+    def _close_group(self, group, delta, shift, spans):
+        """
+        Convert a group of touching spans and edits to a single span.
+
+        `delta` is the current minus original offset before the group, `shift` is the
+        new minus current offset before the group.
+        """
+
+        begin, end, items = group
+        span_delta = 0
+        growth = 0
+        for item in items:
+            if len(item) == 4:
+                # Existing span
+                span_delta += (item[3] - item[2]) - (item[1] - item[0])
+            else:
+                # New edit
+                growth += len(item[2]) - (item[1] - item[0])
+        spans.append([begin - delta, end - delta - span_delta, begin + shift, end + shift + growth])
+        return delta + span_delta, shift + growth
+
+    def to_current(self, pt, end=False):
+        """
+        Map an original position to the current text.
+
+        Positions inside an edited span snap to the start of the span (or end if `end` is set).
+        """
+
+        index = bisect_right(self.spans, [pt, float('inf')]) - 1
+        if index < 0:
+            return pt
+        span = self.spans[index]
+        if pt >= span[1]:
+            return pt + (span[3] - span[1])
+        if pt == span[0]:
+            return span[2]
+        return span[3] if end else span[2]
+
+    def to_original(self, pt):
+        """Map a current position to the original buffer."""
+
+        index = bisect_right(self.starts, pt) - 1
+        if index < 0:
+            return pt
+        span = self.spans[index]
+        if pt >= span[3]:
+            return pt - (span[3] - span[1])
+        return span[0] + min(pt - span[2], max(span[1] - span[0] - 1, 0))
+
+    def hunks(self, gap=0):
+        """
+        Get the `(orig_begin, orig_end, text)` hunks to apply to the original buffer.
+
+        There is a hunk per edited span; spans closer than `gap` are merged, which replaces the text
+        between them as well, so by default only spans that touch are.  Each hunk is then trimmed to
+        the text that actually changed, and hunks whose text ended up the same as the original are dropped.
+        """
+
+        merged = []
+        for span in self.spans:
+            if merged and span[0] - merged[-1][1] <= gap:
+                merged[-1][1] = span[1]
+                merged[-1][3] = span[3]
+            else:
+                merged.append(list(span))
+        hunks = []
+        for orig_begin, orig_end, begin, end in merged:
+            text = self.text[begin:end]
+            trim = trim_edit(self.original[orig_begin:orig_end], text)
+            if trim is not None:
+                prefix, suffix = trim
+                hunks.append((orig_begin + prefix, orig_end - suffix, text[prefix:len(text) - suffix]))
+        return hunks
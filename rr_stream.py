@@ -0,0 +1,190 @@
+"""
+Reg Replace.
+
+Licensed under MIT
+Copyright (c) 2011 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+import traceback
+from RegReplace.rr_regions import ScopeFilter
+from RegReplace.rr_template import LiteralTemplate
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_OVERLAP = 64 * 1024
+
+
+class StreamError(Exception):
+    """A match is too long to be carried from one chunk to the next."""
+
+
+class NotStreamable(Exception):
+    """The sequence can't be applied to a stream."""
+
+
+class RuleStream(object):
+    """
+    Apply a rule to text that arrives in chunks, emitting the result as it goes.
+
+    Text is buffered until `chunk_size` characters have arrived, then searched.  A match is only
+    accepted once it ends at least `overlap` characters before the end of the text read so far, so the
+    text after it, which could change or extend the match, has been seen; the rest is searched again with
+    the next chunk.  Bounded patterns get an overlap that is exactly as wide as they look (see
+    `ReplaceEngine.sweep_margin`); others use the given `overlap`.  With the `regex` module, matches that
+    have started but need more text (`partial` matches) are carried to the next chunk as well, however
+    far back they start.  `overlap` characters before the search position are kept so lookbehinds,
+    anchors, and word boundaries see the text before it.  Carrying a match longer than `chunk_size`
+    raises `StreamError`, which keeps memory bounded by the chunk size rather than the size of the text.
+
+    There are no scopes outside of the editor, so scope filters are applied as they would be to a buffer
+    without scopes.  `count` holds the number of replacements, and `changed` whether any replacement
+    changed the text.
+    """
+
+    def __init__(self, engine, rule, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_OVERLAP):
+        """Compile the rule with the engine; compile errors are reported to the engine and the rule is skipped."""
+
+        self.rule = rule
+        self.chunk_size = chunk_size
+        self.count = 0
+        self.changed = False
+        self.incoming = []
+        self.size = 0
+        self.text = ''
+        self.pos = 0
+        self.empty_at = None
+        self.done = rule.by_scope
+        self.pattern = None
+        self.expand = None
+        self.overlap = max(1, overlap)
+        self.partial = {'partial': True} if engine.use_regex else {}
+        self.scope_filter = ScopeFilter(rule.scope_filter, lambda selector: [])
+        if self.done:
+            return
+
+        engine.rule = rule
+        engine.margin = rule.margin
+        flags = 0
+        if rule.literal_ignorecase:
+            flags |= engine.extend_module.IGNORECASE if engine.extend else engine.normal_module.IGNORECASE
+        try:
+            self.pattern = engine.compile_find(rule.find, flags, rule.literal)
+            self.expand = self.get_expander(engine)
+        except Exception as err:
+            print(str(traceback.format_exc()))
+            engine.error('REGEX ERROR: %s' % str(err))
+            self.done = True
+            return
+        if engine.is_reverse(self.pattern):
+            raise NotStreamable('"%s" searches in reverse' % rule.name)
+        margin = engine.sweep_margin(self.pattern)
+        if margin is not None:
+            self.overlap = margin
+
+    def get_expander(self, engine):
+        """Get the function that expands the rule's replacement for a match."""
+
+        rule = self.rule
+        if rule.literal:
+            return LiteralTemplate(rule.replace).expand
+        if rule.plugin is not None:
+            def replace(m):
+                """Run the rule's plugin."""
+
+                engine.plugin = rule.plugin
+                engine.plugin_args = rule.args
+                return engine.on_replace(m)
+
+            return replace
+        engine.format = rule.format_replace and engine.use_format
+        return engine.get_template(self.pattern, rule.replace).expand
+
+    def feed(self, text):
+        """Add text; returns the text that is done, if a chunk's worth has arrived."""
+
+        if text:
+            self.incoming.append(text)
+            self.size += len(text)
+        if self.size < self.chunk_size:
+            return ''
+        return self.process(False)
+
+    def finish(self, text=''):
+        """Add the last of the text; returns the rest of the result."""
+
+        if text:
+            self.incoming.append(text)
+            self.size += len(text)
+        return self.process(True)
+
+    def process(self, final):
+        """Search the buffered text and return the text that is done."""
+
+        text = self.text + ''.join(self.incoming)
+        self.incoming = []
+        self.size = 0
+        out = []
+        emitted = pos = self.pos
+
+        if not self.done:
+            safe = len(text) if final else len(text) - self.overlap
+            carried = None
+            for m in self.pattern.finditer(text, pos, **({} if final else self.partial)):
+                start, end = m.span()
+                if getattr(m, 'partial', False) or end > safe:
+                    # The match may still change with more text
+                    carried = start
+                    break
+                if start == end and start == self.empty_at:
+                    # Already found before the search was resumed here
+                    continue
+                self.empty_at = end if start == end else None
+                pos = end
+                if self.scope_filter and not self.scope_filter.qualify(start, end):
+                    continue
+                replacement = self.expand(m)
+                out.append(text[emitted:start])
+                out.append(replacement)
+                emitted = end
+                self.count += 1
+                if replacement != m.group(0):
+                    self.changed = True
+                if not self.rule.greedy:
+                    self.done = True
+                    break
+            else:
+                # Nothing else can start before the end of the text that is done
+                if not final and safe > pos:
+                    pos = safe
+                    self.empty_at = None
+            if carried is not None:
+                pos = carried
+
+        if self.done or final:
+            pos = len(text)
+        out.append(text[emitted:pos])
+
+        # Keep the text after the search position, and what is before it for context
+        cut = max(0, pos - self.overlap)
+        self.text = text[cut:]
+        self.pos = pos - cut
+        if self.empty_at is not None:
+            self.empty_at -= cut
+        if len(self.text) - self.pos > self.chunk_size + self.overlap:
+            raise StreamError('a match of "%s" is longer than the chunk size' % self.rule.name)
+        return ''.join(out)
+
+
+def stream_sequence(streams, chunks):
+    """Pass the chunks of text through the rule streams, in order, and yield the result as it is done."""
+
+    for chunk in chunks:
+        for stream in streams:
+            chunk = stream.feed(chunk)
+            if not chunk:
+                break
+        if chunk:
+            yield chunk
+    text = ''
+    for stream in streams:
+        text = stream.finish(text)
+    if text:
+        yield text
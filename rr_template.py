@@ -0,0 +1,139 @@
+"""
+Reg Replace.
+
+Licensed under MIT
+Copyright (c) 2011 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+import sys
+from RegReplace.rr_cache import PatternCache
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+
+class LiteralTemplate(object):
+    """Template with no group references; always expands to the same string."""
+
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        """Initialize."""
+
+        self.text = text
+
+    def expand(self, m):
+        """Expand the template."""
+
+        return self.text
+
+
+class GroupTemplate(object):
+    """Template made up of literal pieces and group references."""
+
+    __slots__ = ('pieces',)
+
+    def __init__(self, pieces):
+        """Initialize."""
+
+        self.pieces = tuple(pieces)
+
+    def expand(self, m):
+        """Expand the template."""
+
+        group = m.group
+        return ''.join(
+            [piece if isinstance(piece, str) else (group(piece) or '') for piece in self.pieces]
+        )
+
+
+class MatchTemplate(object):
+    """Template that is expanded by the match object itself."""
+
+    __slots__ = ('template', 'format')
+
+    def __init__(self, template, fmt=False):
+        """Initialize."""
+
+        self.template = template
+        self.format = fmt
+
+    def expand(self, m):
+        """Expand the template."""
+
+        return m.expandf(self.template) if self.format else m.expand(self.template)
+
+
+class CallableTemplate(object):
+    """Template that wraps a compiled Backrefs replace object."""
+
+    __slots__ = ('template',)
+
+    def __init__(self, template):
+        """Initialize."""
+
+        self.template = template
+
+    def expand(self, m):
+        """Expand the template."""
+
+        return self.template(m)
+
+
+def parse_re_template(pattern, template):
+    """Parse a Re template in to literal pieces and group indexes."""
+
+    parsed = sre_parse.parse_template(template, pattern)
+    if isinstance(parsed, tuple):
+        # Python < 3.12: `(groups, literals)` with `None` as group placeholders in literals.
+        groups, literals = parsed
+        pieces = list(literals)
+        for index, group in groups:
+            pieces[index] = group
+    else:
+        # Python >= 3.12: literals and group indexes alternate.
+        pieces = parsed
+    return pieces
+
+
+def parse_regex_template(engine, pattern, template):
+    """Parse a Regex template in to literal pieces and group indexes."""
+
+    return sys.modules[engine.compile.__module__]._compile_replacement_helper(pattern, template)
+
+
+def build_template(engine, pattern, replace, fmt):
+    """Build the expansion object for the replace template."""
+
+    if hasattr(engine, 'compile_replace'):
+        return CallableTemplate(engine.compile_replace(pattern, replace, engine.FORMAT if fmt else 0))
+    if fmt:
+        return MatchTemplate(replace, fmt)
+
+    try:
+        if engine.__name__ == 're':
+            pieces = parse_re_template(pattern, replace)
+        else:
+            pieces = parse_regex_template(engine, pattern, replace)
+    except Exception:
+        # Private parsers are not available or rejected the template;
+        # let the match object handle (and report) it.
+        return MatchTemplate(replace)
+
+    pieces = [piece for piece in pieces if piece is not None and piece != '']
+    if all(isinstance(piece, str) for piece in pieces):
+        return LiteralTemplate(''.join(pieces))
+    return GroupTemplate(pieces)
+
+
+def compile_template(engine, pattern, replace, fmt=False):
+    """
+    Compile a replace template once per rule, engine, and format.
+
+    Templates without group references expand to a constant string, templates with only
+    group references are expanded by joining the pieces, and Backrefs templates use
+    the Backrefs compiled replace object.
+    """
+
+    key = ('template', engine.__name__, type(pattern).__name__, pattern.pattern, pattern.flags, replace, bool(fmt))
+    return PatternCache.lookup(key, lambda: build_template(engine, pattern, replace, fmt))
@@ -1 +1,12 @@
 """Unit Tests."""
+import os
+import sys
+import types
+
+try:
+    import RegReplace  # noqa: F401
+except ImportError:
+    # Testing from a folder that isn't named `RegReplace`
+    package = types.ModuleType('RegReplace')
+    package.__path__ = [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+    sys.modules['RegReplace'] = package
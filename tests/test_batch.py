@@ -0,0 +1,77 @@
+"""Test the batch runner."""
+import os
+import shutil
+import tempfile
+import unittest
+from RegReplace import rr_batch
+
+RULES = {
+    'trailing': {'find': r'[ \t]+$', 'replace': ''},
+    'colour': {'find': 'colour', 'replace': 'color'}
+}
+
+
+class TestLineEndings(unittest.TestCase):
+    """Test that files keep their line endings."""
+
+    def setUp(self):
+        """Set up a folder for the files."""
+
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the files."""
+
+        shutil.rmtree(self.folder)
+
+    def process(self, data, names, check=False, stream=None):
+        """Write the data to a file and apply the rules to it; return the status and the file's data."""
+
+        file_name = os.path.join(self.folder, 'file.txt')
+        with open(file_name, 'wb') as f:
+            f.write(data)
+        rr_batch.init_worker(
+            {
+                'settings': {}, 'rules': RULES, 'packages': self.folder, 'check': check,
+                'stream': stream, 'chunk_size': 16, 'overlap': 8
+            }
+        )
+        status = rr_batch.process_file((file_name, [(tuple(names), False)]))[1]
+        with open(file_name, 'rb') as f:
+            return status, f.read()
+
+    def test_mixed_unchanged(self):
+        """Test that a file with mixed line endings that no rule matches is left alone."""
+
+        data = b'one\r\ntwo\nthree\r\n'
+        for stream in (None, 0):
+            for check in (False, True):
+                self.assertEqual(self.process(data, ['colour'], check, stream), ('unchanged', data))
+
+    def test_mixed_changed(self):
+        """Test that a file with mixed line endings keeps them when a rule matches."""
+
+        data = b'colour\r\ntwo  \nthree\r\n\nthe colour\n'
+        for stream in (None, 0):
+            self.assertEqual(
+                self.process(data, ['colour', 'trailing'], stream=stream),
+                ('changed', b'color\r\ntwo\nthree\r\n\nthe color\n')
+            )
+
+    def test_windows(self):
+        """Test that a file with Windows line endings is searched with Unix line endings and keeps them."""
+
+        data = b'colour  \r\ntwo\t\r\nthree\r\n'
+        for stream in (None, 0):
+            self.assertEqual(
+                self.process(data, ['colour', 'trailing'], stream=stream),
+                ('changed', b'color\r\ntwo\r\nthree\r\n')
+            )
+            clean = b'one\r\ntwo\r\n'
+            self.assertEqual(self.process(clean, ['trailing'], stream=stream), ('unchanged', clean))
+
+    def test_check(self):
+        """Test that check mode reports changes without writing them."""
+
+        data = b'colour\r\ntwo\n'
+        self.assertEqual(self.process(data, ['colour'], check=True), ('changed', data))
@@ -0,0 +1,309 @@
+"""Test the replace engine."""
+import random
+import re
+import unittest
+from RegReplace.rr_buffer import TextBuffer
+from RegReplace.rr_engine import ReplaceEngine
+from RegReplace.rr_regions import DirtyRegions, ChunkHashes
+from RegReplace.rr_rules import RuleRegistry
+
+RULES = {
+    'ab': {'find': 'ab', 'replace': 'b'},
+    'ba': {'find': 'ba', 'replace': 'a'},
+    'aa': {'find': 'a{2}', 'replace': 'a'},
+    'swap': {'find': r'(c)(x)', 'replace': r'\2\1'},
+    'word': {'find': r'\bx\b', 'replace': ''},
+    'eol': {'find': 'c$', 'replace': ''},
+    'spaces': {'find': ' +$', 'replace': '', 'multi_pass_margin': 100},
+    'grow': {'find': 'xa', 'replace': 'axb'},
+    'literal': {'find': 'bc', 'replace': 'cb', 'literal': True}
+}
+
+
+def reference(rules, names, text, multi_pass=False, max_sweeps=100):
+    """Apply the rules one after another with `re.sub`, sweeping until nothing changes with `multi_pass`."""
+
+    for sweep in range(max_sweeps if multi_pass else 1):
+        before = text
+        replaced = 0
+        for name in names:
+            rule = rules[name]
+            find = re.escape(rule['find']) if rule.get('literal', False) else rule['find']
+            text, count = re.subn(find, rule['replace'], text, flags=re.M)
+            replaced += count
+        if not replaced or text == before:
+            break
+    return text
+
+
+class FullSweepEngine(ReplaceEngine):
+    """Engine that rescans the whole buffer in every sweep."""
+
+    def track_edits(self):
+        """Don't track edits."""
+
+
+def apply(rules, names, text, multi_pass=False, engine=ReplaceEngine, settings=None, shadow=False):
+    """Apply the sequence to the text; return the text and the result."""
+
+    bfr = TextBuffer(text)
+    replacer = engine(bfr, settings or {}, False, False, False, 100, None, shadow)
+    result = replacer.apply_sequence(list(names), rules, multi_pass)
+    replacer.commit()
+    return bfr.substr(0, bfr.size()), result
+
+
+class TestSequence(unittest.TestCase):
+    """Test applying sequences against plain `re.sub`."""
+
+    def test_sequence(self):
+        """Test that a sequence gives the same text as applying its rules in turn."""
+
+        rand = random.Random(0)
+        for case in range(300):
+            text = ''.join(rand.choice('abcx \n') for _ in range(rand.randint(0, 40)))
+            names = rand.sample(sorted(RULES), rand.randint(1, 4))
+            for settings in ({}, {'use_regex_module': True}):
+                for shadow in (False, True):
+                    self.assertEqual(
+                        apply(RULES, names, text, settings=settings, shadow=shadow)[0], reference(RULES, names, text)
+                    )
+
+    def test_multi_pass(self):
+        """Test that multi-pass sweeps that rescan around edits give the same text as full sweeps."""
+
+        rand = random.Random(1)
+        for case in range(300):
+            text = ''.join(rand.choice('abcx \n') for _ in range(rand.randint(0, 40)))
+            names = rand.sample(sorted(RULES), rand.randint(1, 4))
+            for settings in ({}, {'use_regex_module': True}):
+                for shadow in (False, True):
+                    windowed, result = apply(RULES, names, text, True, settings=settings, shadow=shadow)
+                    full = apply(RULES, names, text, True, FullSweepEngine, settings, shadow)[0]
+                    self.assertEqual(windowed, full)
+                    if result.cycle is None:
+                        self.assertEqual(windowed, reference(RULES, names, text, True))
+
+    def test_sweep_margin(self):
+        """Test how far around edits multi-pass sweeps rescan."""
+
+        replacer = ReplaceEngine(TextBuffer(''), {}, False, False, False, 100, None)
+        self.assertEqual(replacer.sweep_margin(replacer.compile_find('ab', 0)), 3)
+        self.assertEqual(replacer.sweep_margin(replacer.compile_find(r'a\d{2,4}', 0)), 6)
+        self.assertIsNone(replacer.sweep_margin(replacer.compile_find(' +$', 0)))
+        self.assertIsNone(replacer.sweep_margin(replacer.compile_find('a?', 0)))
+        self.assertIsNone(replacer.sweep_margin(replacer.compile_find('a(?=b)', 0)))
+
+        # Widths can't be measured for the `regex` module
+        replacer = ReplaceEngine(TextBuffer(''), {'use_regex_module': True}, False, False, False, 100, None)
+        self.assertIsNone(replacer.sweep_margin(replacer.compile_find('ab', 0)))
+
+    def test_fixed_point(self):
+        """Test that a rule that matches its own replacement stops without a cycle."""
+
+        rules = {'same': {'find': 'foo', 'replace': 'foo'}}
+        text, result = apply(rules, ['same'], 'foo foo', True)
+        self.assertEqual(text, 'foo foo')
+        self.assertIsNone(result.cycle)
+        self.assertEqual(result.sweeps, 1)
+
+    def test_cycle(self):
+        """Test that rules going around in a cycle are stopped and reported."""
+
+        rules = {
+            'add_b': {'find': 'A', 'replace': 'AB'},
+            'trim_abb': {'find': 'ABB', 'replace': 'A'}
+        }
+        text, result = apply(rules, ['add_b', 'trim_abb'], 'AB', True)
+        self.assertEqual(text, 'AB')
+        self.assertEqual(result.cycle, (['add_b', 'trim_abb'], 2))
+        self.assertEqual(result.sweeps, 2)
+
+    def test_undo_cycle(self):
+        """Test that rules that undo each other within a sweep are reported as a cycle."""
+
+        rules = {
+            'a_to_b': {'find': 'A', 'replace': 'B'},
+            'b_to_a': {'find': 'B', 'replace': 'A'}
+        }
+        for settings in ({}, {'use_regex_module': True}):
+            for shadow in (False, True):
+                text, result = apply(rules, ['a_to_b', 'b_to_a'], 'xAx', True, settings=settings, shadow=shadow)
+                self.assertEqual(text, 'xAx')
+                self.assertEqual(result.cycle, (['a_to_b', 'b_to_a'], 1))
+                self.assertEqual(result.sweeps, 1)
+
+
+class TestFindNext(unittest.TestCase):
+    """Test that non-greedy rules replace the first match after the cursor, wrapping around once."""
+
+    FINDS = [
+        'x', r'x\ny', r'x[\t-\r]y', r'x[\12]y', r'x\012y', r'x\sy', r'x[^a]y', 'x.y', '(?s)x.y', r'x(?s:.)y',
+        r'x\Wy', r'x\Dy', r'(?i)X[\n]Y', r'x(?:a|\n)y', r'x$', r'^y'
+    ]
+
+    def reference(self, find, text, pt):
+        """Replace the first match that ends after the point (or the first match) with `re`."""
+
+        matches = list(re.finditer(find, text, re.M))
+        after = [m for m in matches if m.end() > pt]
+        m = after[0] if after else (matches[0] if matches else None)
+        return text if m is None else text[:m.start()] + '<%s>' % m.group(0) + text[m.end():]
+
+    def test_find_next(self):
+        """Test patterns that can and can't match across lines against searching the whole text."""
+
+        rules = {'next': {'find': None, 'replace': r'<\g<0>>', 'greedy': False}}
+        rand = random.Random(3)
+        for case in range(300):
+            text = ''.join(rand.choice(['x', 'y', 'a', ' ', '\n', '\t', 'x\ny']) for _ in range(rand.randint(0, 20)))
+            pt = rand.randint(0, len(text))
+            find = rand.choice(self.FINDS)
+            rules['next']['find'] = find
+            for settings in ({}, {'use_regex_module': True}):
+                bfr = TextBuffer(text, [(pt, pt)])
+                ReplaceEngine(bfr, settings, False, False, False, 100, None).apply_sequence(['next'], rules)
+                self.assertEqual(bfr.substr(0, bfr.size()), self.reference(find, text, pt), (find, text, pt))
+
+    def test_line_break(self):
+        """Test that a match across the line before the cursor is found first."""
+
+        rules = {'next': {'find': r'x[\t-\r]y', 'replace': 'Z', 'greedy': False}}
+        bfr = TextBuffer('x\ny zz x\ny', [(2, 2)])
+        ReplaceEngine(bfr, {}, False, False, False, 100, None).apply_sequence(['next'], rules)
+        self.assertEqual(bfr.substr(0, bfr.size()), 'Z zz x\ny')
+
+
+class TestDirtyRegions(unittest.TestCase):
+    """Test tracking the text that changed since each rule scanned the buffer."""
+
+    def test_record(self):
+        """Test that changed spans are added and moved along with later edits."""
+
+        dirty = DirtyRegions()
+        self.assertIsNone(dirty.get('a'))
+        dirty.scanned('a')
+        self.assertEqual(dirty.get('a'), [])
+
+        # Replace `[2, 4)` with 5 characters and insert 1 at 10
+        dirty.record([(2, 4, 5), (10, 10, 1)])
+        self.assertEqual(dirty.get('a'), [(2, 7), (13, 14)])
+
+        dirty.scanned('b')
+        # Delete `[0, 1)`: everything moves back one, and the deletion is a changed span for both keys
+        dirty.record([(0, 1, 0)])
+        self.assertEqual(dirty.get('a'), [(0, 0), (1, 6), (12, 13)])
+        self.assertEqual(dirty.get('b'), [(0, 0)])
+
+        # Edits that touch a changed span merge with it
+        dirty.record([(5, 8, 2)])
+        self.assertEqual(dirty.get('a'), [(0, 0), (1, 7), (11, 12)])
+
+
+class TestChunkHashes(unittest.TestCase):
+    """Test hashing the buffer again only where it was edited."""
+
+    def test_random(self):
+        """Test that hashing the edited chunks gives the same chunks as hashing the whole text."""
+
+        rand = random.Random(0)
+        words = ['', 'a', 'ab', 'abc', 'ba', 'cab', 'c', 'bb', 'abcab', 'ccc', 'xyz', 'y']
+
+        def line():
+            """Make a random line."""
+
+            return ' '.join(rand.choice(words) for _ in range(rand.randint(0, 3))) + '\n'
+
+        for case in range(100):
+            text = ''.join(line() for _ in range(rand.randint(0, 300)))
+            hashes = ChunkHashes()
+            hashes.update(lambda begin, end: text[begin:end], len(text))
+            for batch in range(rand.randint(1, 4)):
+                points = sorted(rand.randint(0, len(text)) for _ in range(2 * rand.randint(0, 5)))
+                edits = []
+                for begin, end in zip(points[::2], points[1::2]):
+                    edits.append((begin, end, ''.join(line() for _ in range(rand.randint(0, 2)))[:rand.randint(0, 20)]))
+                for begin, end, new in reversed(edits):
+                    text = text[:begin] + new + text[end:]
+                hashes.record([(begin, end, len(new)) for begin, end, new in edits])
+                if rand.random() < 0.5:
+                    continue
+                fresh = ChunkHashes()
+                self.assertEqual(
+                    hashes.update(lambda begin, end: text[begin:end], len(text)),
+                    fresh.update(lambda begin, end: text[begin:end], len(text))
+                )
+                self.assertEqual(hashes.chunks, fresh.chunks)
+                self.assertEqual(hashes.chunks[-1][0] if hashes.chunks else 0, len(text))
+
+
+class SearchCountEngine(ReplaceEngine):
+    """Engine that counts the searches of rules that target all of their matches."""
+
+    def __init__(self, *args, **kwargs):
+        """Initialize."""
+
+        super(SearchCountEngine, self).__init__(*args, **kwargs)
+        self.searches = 0
+
+    def regex_findall(self, *args, **kwargs):
+        """Count the search."""
+
+        self.searches += 1
+        return super(SearchCountEngine, self).regex_findall(*args, **kwargs)
+
+
+class TestFindReuse(unittest.TestCase):
+    """Test reusing what a find found for the replace that follows it."""
+
+    def find(self, rules, names, text):
+        """Find the targets of the sequence; return what the find found."""
+
+        replacer = ReplaceEngine(TextBuffer(text), {}, True, False, False, 100, None)
+        replacer.apply_sequence(list(names), rules)
+        return replacer.found
+
+    def replace(self, rules, names, text, found):
+        """Replace the targets of the sequence, reusing what a find found; return the text and the searches."""
+
+        bfr = TextBuffer(text)
+        replacer = SearchCountEngine(bfr, {}, False, False, False, 100, None)
+        replacer.reuse = found
+        replacer.apply_sequence(list(names), rules)
+        return bfr.substr(0, bfr.size()), replacer.searches
+
+    def test_reuse(self):
+        """Test that reusing what the find found gives the same text as searching again."""
+
+        rules = RuleRegistry(RULES)
+        rand = random.Random(2)
+        for case in range(200):
+            text = ''.join(rand.choice('abcx \n') for _ in range(rand.randint(0, 40)))
+            names = rand.sample(sorted(RULES), rand.randint(1, 4))
+            found = self.find(rules, names, text)
+            self.assertEqual(self.replace(rules, names, text, found)[0], reference(RULES, names, text))
+
+    def test_used_until_edited(self):
+        """Test that matches are only reused until the buffer is first edited."""
+
+        rules = RuleRegistry(
+            {
+                'a': {'find': 'a', 'replace': 'b'},
+                'b': {'find': 'b', 'replace': 'c'},
+                'x': {'find': 'x', 'replace': 'y'}
+            }
+        )
+        found = self.find(rules, ['x', 'a', 'b'], 'ab')
+        self.assertEqual(sorted(found), ['a', 'b', 'x'])
+        # `x` and `a` use what was found, `b` searches again after `a` edits the buffer
+        self.assertEqual(self.replace(rules, ['x', 'a', 'b'], 'ab', found), ('cc', 1))
+
+        # Matches found for an older version of a rule are not reused
+        rules.update(
+            {
+                'a': {'find': 'a', 'replace': 'b'},
+                'b': {'find': 'b', 'replace': 'c'},
+                'x': {'find': 'a', 'replace': 'y'}
+            }
+        )
+        self.assertEqual(self.replace(rules, ['x', 'a', 'b'], 'ab', found), ('yc', 3))
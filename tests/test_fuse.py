@@ -0,0 +1,175 @@
+"""Test fusing rules."""
+import random
+import re
+import unittest
+from RegReplace.rr_buffer import TextBuffer
+from RegReplace.rr_engine import ReplaceEngine
+from RegReplace.rr_fuse import FusedGroup
+from RegReplace.rr_rules import RuleRegistry
+
+
+def reference(rules, names, text):
+    """Apply the rules one after another with `re.sub`."""
+
+    for name in names:
+        text = re.sub(rules[name]['find'], rules[name]['replace'], text, flags=re.M)
+    return text
+
+
+class TestFuse(unittest.TestCase):
+    """Test that fused rules give the same result as rules run one after another."""
+
+    def apply(self, rules, names, text, fuse=True, settings=None):
+        """Apply the sequence to the text; return the text and the result."""
+
+        bfr = TextBuffer(text)
+        engine = ReplaceEngine(bfr, settings or {}, False, False, False, 100, None)
+        result = engine.apply_sequence(list(names), rules, fuse=fuse)
+        return bfr.substr(0, bfr.size()), result
+
+    def test_independent_rules(self):
+        """Test that rules that don't interact are fused."""
+
+        rules = {
+            'foo': {'find': r'\bfoo', 'replace': 'bar'},
+            'digits': {'find': r'\b(\d+)-(\d+)', 'replace': r'\2-\1'}
+        }
+        names = ['foo', 'digits']
+        text = 'foo 1-2\nfood 34-5 foo\n'
+        for settings in ({}, {'use_regex_module': True}, {'extended_back_references': True}):
+            result_text, result = self.apply(rules, names, text, settings=settings)
+            self.assertEqual(result_text, reference(rules, names, text))
+            # What `regex` patterns look at can't be worked out, so they aren't fused
+            self.assertEqual(result.fused, [] if settings.get('use_regex_module') else [names])
+
+    def test_later_rule_matches_replacement(self):
+        """Test that a rule that matches what an earlier rule replaced runs on its own."""
+
+        rules = {
+            'tabs': {'find': r'\t', 'replace': '    '},
+            'trailing': {'find': r' +$', 'replace': ''}
+        }
+        names = ['tabs', 'trailing']
+        text = 'a\t\nb  \n\tc\t\n'
+        for settings in ({}, {'use_regex_module': True}):
+            result_text, result = self.apply(rules, names, text, settings=settings)
+            self.assertEqual(result_text, reference(rules, names, text))
+            self.assertEqual(result_text, 'a\nb\n    c\n')
+            self.assertEqual(result.fused, [])
+
+    def test_later_rule_takes_match(self):
+        """Test that a rule whose match a later rule would take first runs on its own."""
+
+        rules = {
+            'bc': {'find': 'bc', 'replace': 'X'},
+            'ab': {'find': 'ab', 'replace': 'Y'}
+        }
+        names = ['bc', 'ab']
+        text = 'abc\nab bc\n'
+        result_text, result = self.apply(rules, names, text)
+        self.assertEqual(result_text, reference(rules, names, text))
+        self.assertEqual(result.fused, [])
+
+    def test_earlier_edit_breaks_match(self):
+        """Test that a rule whose match an earlier rule's replacement changes runs on its own."""
+
+        rules = {
+            'newline': {'find': r'\n', 'replace': ';'},
+            'trailing': {'find': r' +$', 'replace': ''}
+        }
+        names = ['newline', 'trailing']
+        text = 'a  \nb  '
+        result_text, result = self.apply(rules, names, text)
+        self.assertEqual(result_text, reference(rules, names, text))
+        self.assertEqual(result_text, 'a  ;b')
+
+    def test_random(self):
+        """Test random groups of rules against running them one after another."""
+
+        finds = [
+            'a', 'ab', 'a+', '[ab]c', 'c$', '^a', ' +$', '\t', r'\ba', r'\Bb', r'\bx{2,3}', r'\b(a)(b)?', '(?=a)a|c',
+            r'a(?!\n)', '.x', r'(?i)\bA', r'\b\w\s', r'\b(?P<n>a)(?P=n)'
+        ]
+        replaces = ['', 'a', 'b', 'ab', 'c', '    ', 'x', 'xx', '-', '\n']
+        rand = random.Random(0)
+        fused = 0
+        for case in range(300):
+            rules = {}
+            for index in range(rand.randint(2, 4)):
+                rules['rule%d' % index] = {'find': rand.choice(finds), 'replace': rand.choice(replaces)}
+            names = sorted(rules)
+            text = ''.join(rand.choice('abcx- \t\n') for _ in range(rand.randint(0, 30)))
+            for settings in ({}, {'use_regex_module': True}):
+                result_text, result = self.apply(rules, names, text, settings=settings)
+                self.assertEqual(result_text, reference(rules, names, text))
+                fused += len(result.fused)
+        self.assertGreater(fused, 20)
+
+
+class TestFusePlan(unittest.TestCase):
+    """Test grouping the rules of a sequence that can be fused."""
+
+    def plan(self, rules, names, settings=None):
+        """Plan the sequence; fused groups are listed by their names."""
+
+        engine = ReplaceEngine(TextBuffer(''), settings or {}, False, False, False, 100, None)
+        steps = engine.fuse(names, RuleRegistry(rules))
+        return [step.names if isinstance(step, FusedGroup) else step for step in steps]
+
+    def test_groups(self):
+        """Test that runs of rules that can be fused are grouped."""
+
+        rules = {
+            'a': {'find': r'\ba', 'replace': 'x'},
+            'b': {'find': r'(?i)\bb+', 'replace': 'y'},
+            'c': {'find': r'\bc\d', 'replace': 'z'},
+            'literal': {'find': 'c.d', 'replace': 'z', 'literal': True},
+            'prefixed': {'find': '[cd]x', 'replace': 'z'},
+            'scope': {'scope': 'comment', 'find': 'a', 'replace': 'x'},
+            'behind': {'find': '(?<=a)b', 'replace': 'x'},
+            'backref': {'find': r'(a)\1', 'replace': 'x'},
+            'empty': {'find': '^', 'replace': '>'},
+            'plugin': {'find': 'a', 'plugin': 'rr_modules.example'},
+            'first': {'find': 'a', 'replace': 'x', 'greedy': False},
+            'verbose': {'find': '(?x) a b', 'replace': 'x'},
+            'name1': {'find': r'\b(?P<x>e)', 'replace': r'\g<x>'},
+            'name2': {'find': r'\b(?P<x>f)', 'replace': r'\g<x>'}
+        }
+        self.assertEqual(self.plan(rules, ['a', 'b', 'c']), [['a', 'b', 'c']])
+        # Rules that start with a literal or a character class are found faster on their own
+        for name in ('scope', 'behind', 'backref', 'empty', 'plugin', 'first', 'verbose', 'literal', 'prefixed'):
+            self.assertEqual(self.plan(rules, ['a', 'b', name, 'a', 'c']), [['a', 'b'], name, ['a', 'c']])
+        self.assertEqual(self.plan(rules, ['a', 'scope', 'b']), ['a', 'scope', 'b'])
+        self.assertEqual(self.plan(rules, ['name1', 'a', 'name2', 'b']), [['name1', 'a'], ['name2', 'b']])
+        self.assertEqual(self.plan(rules, ['a', 'missing', 'b']), ['a', 'missing', 'b'])
+        self.assertEqual(self.plan(rules, ['a', 'b', 'c'], {'use_regex_module': True}), ['a', 'b', 'c'])
+
+    def test_affects(self):
+        """Test that a rule whose matches an earlier rule of the group can change starts a new group."""
+
+        rules = {
+            'tabs': {'find': r'^\t', 'replace': '    '},
+            'trailing': {'find': r'\b +$', 'replace': ''},
+            'foo': {'find': r'\bfoo\b', 'replace': 'qux'},
+            'bar': {'find': r'\bbar\b', 'replace': 'quux'},
+            'dash': {'find': '^x', 'replace': '-'},
+            'swap': {'find': r'\b(\d+)-(\d+)', 'replace': r'\2-\1'},
+            'upper': {'find': r'\b(\d+)\.', 'replace': r'\C\1.'}
+        }
+        # Replacements of tabs are matched by `trailing`
+        self.assertEqual(self.plan(rules, ['tabs', 'trailing']), ['tabs', 'trailing'])
+        # Deleting text can join what is around it
+        self.assertEqual(self.plan(rules, ['trailing', 'foo', 'bar']), ['trailing', ['foo', 'bar']])
+        # Rules that never see what the rules before them replace or insert are fused
+        self.assertEqual(self.plan(rules, ['bar', 'foo', 'tabs']), [['bar', 'foo', 'tabs']])
+        self.assertEqual(self.plan(rules, ['foo', 'bar', 'swap']), [['foo', 'bar', 'swap']])
+        self.assertEqual(self.plan(rules, ['swap', 'dash']), [['swap', 'dash']])
+        self.assertEqual(self.plan(rules, ['dash', 'swap']), ['dash', 'swap'])
+        # Turning word characters into others moves word boundaries
+        self.assertEqual(self.plan(rules, ['dash', 'bar']), ['dash', 'bar'])
+        self.assertEqual(self.plan(rules, ['foo', 'bar']), [['foo', 'bar']])
+
+        # Backrefs templates are understood as long as they read like `re` templates
+        settings = {'extended_back_references': True}
+        self.assertEqual(self.plan(rules, ['swap', 'tabs'], settings), [['swap', 'tabs']])
+        self.assertEqual(self.plan(rules, ['upper', 'tabs'], settings), ['upper', 'tabs'])
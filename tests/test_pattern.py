@@ -0,0 +1,47 @@
+"""Test working out what patterns match from the parsed pattern."""
+import random
+import re
+import unittest
+from RegReplace.rr_pattern import PatternChars, contains
+
+
+class TestPatternChars(unittest.TestCase):
+    """Test the characters patterns can match, start with, and look at."""
+
+    FINDS = [
+        'ab', 'a|b', r'\bfoo\b', '[a-c]+', '[^a]', '.x', '(?s).x', r'(?i)A\w', r'\d+', r'(a)?b', r'x(?=y)',
+        r'(?<!a)b', r'(?P<n>a*)(?P=n)b', r'(?:ab|c)*d', '^a|b$', r'[\t-\r]', r'\012', r'(?a:\w)+'
+    ]
+
+    def test_matches(self):
+        """Test that matches only contain, start with, and look at the characters worked out for them."""
+
+        rand = random.Random(0)
+        for find in self.FINDS:
+            chars = PatternChars(find, re.M)
+            looked_at = chars.consumed + chars.inspected
+            for case in range(50):
+                text = ''.join(rand.choice('abcdxyfoAB1_ \t\n\u00e9\u0660') for _ in range(rand.randint(0, 30)))
+                for m in re.finditer(find, text, re.M):
+                    for char in m.group(0):
+                        self.assertTrue(contains(chars.consumed, char), (find, text))
+                    if m.group(0):
+                        self.assertTrue(contains(chars.first, m.group(0)[0]), (find, text))
+                    # Lookarounds only look at characters they could match
+                    if find.startswith('x(?=') and m.end() < len(text):
+                        self.assertTrue(any(first <= ord(text[m.end()]) <= last for first, last in looked_at))
+
+    def test_prefixed(self):
+        """Test telling which patterns start with a literal or a character class."""
+
+        for find in ('foo', '(foo)', '[ab]c', 'a|b', '(?i)foo'):
+            self.assertTrue(PatternChars(find).prefixed, find)
+        for find in (r'\bfoo', '[ab]+', '.a', '(?=a)a', 'a|[bc]+', '^a'):
+            self.assertFalse(PatternChars(find).prefixed, find)
+
+    def test_widths(self):
+        """Test the shortest text each group can match."""
+
+        self.assertEqual(PatternChars(r'(a)(b+)c').widths, {0: 3, 1: 1, 2: 1})
+        # Groups that may not take part in a match can match nothing
+        self.assertEqual(PatternChars(r'(a)?(b)|(c)').widths, {0: 1, 1: 0, 2: 0, 3: 0})
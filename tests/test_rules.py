@@ -0,0 +1,125 @@
+"""Test resolving rules and on save sequences."""
+import fnmatch
+import os
+import random
+import re
+import unittest
+from RegReplace.rr_rules import OnSaveIndex, RuleRegistry
+
+GLOBS = [
+    '*', '*.py', '*.PY', '*.min.js', '*.js', '*test*', '[ab]*.md', 'Makefile', '*/Makefile', '*/src/*.c',
+    '/home/user/project/*.txt', '*.tar.gz', '*.?s', '*[0-9].log'
+]
+REGEXES = [
+    r'.*\.py$', r'(?i).*readme.*', r'.*/docs/.*', r'.*\.(js|ts)$', r'(?s).*notes', r'[^/]*$', r'.*/\w+_test\.py'
+]
+FOLDERS = ['/home/user/project', '/home/user/project/src', '/tmp/docs', '/a/b/c']
+NAMES = [
+    'main.py', 'MAIN.PY', 'app.min.js', 'app.js', 'a_test.py', 'notes', 'README.md', 'readme.txt', 'Makefile',
+    'file.c', 'archive.tar.gz', 'x.ts', 'b.md', 'server1.log', 'noext'
+]
+
+
+def match_file(item, file_name):
+    """Check if the entry applies to the file by trying each of its patterns in turn."""
+
+    for pattern in item.get('file_pattern', []):
+        if fnmatch.fnmatch(file_name, pattern):
+            return True
+
+    flags = 0
+    if not bool(item.get('case', False)):
+        flags |= re.IGNORECASE
+    if bool(item.get('dotall', False)):
+        flags |= re.DOTALL
+    for regex in item.get('file_regex', []):
+        if re.compile(regex, flags).match(file_name) is not None:
+            return True
+    return False
+
+
+class TestOnSaveIndex(unittest.TestCase):
+    """Test the on save sequence index."""
+
+    def test_match(self):
+        """Test that the index finds the same entries as trying each entry's patterns in turn."""
+
+        rand = random.Random(0)
+        for case in range(200):
+            entries = []
+            for index in range(rand.randint(1, 6)):
+                item = {'sequence': ['rule%d' % index]}
+                if rand.random() < 0.7:
+                    item['file_pattern'] = rand.sample(GLOBS, rand.randint(1, 3))
+                if rand.random() < 0.5:
+                    item['file_regex'] = rand.sample(REGEXES, rand.randint(1, 2))
+                    item['case'] = rand.random() < 0.5
+                    item['dotall'] = rand.random() < 0.2
+                entries.append(item)
+            index = OnSaveIndex(entries)
+            self.assertEqual(index.errors, [])
+            for folder in FOLDERS:
+                for name in NAMES:
+                    file_name = os.path.join(folder, name)
+                    expected = [item for item in entries if match_file(item, file_name)]
+                    self.assertEqual(index.match(file_name), expected)
+                    # Again from the cache
+                    self.assertEqual(index.match(file_name), expected)
+
+    def test_syntax(self):
+        """Test matching entries by the view's syntax."""
+
+        entries = [
+            {'sequence': ['a'], 'syntax': ['Python']},
+            {'sequence': ['b'], 'syntax': ['Packages/JavaScript/JavaScript.sublime-syntax']},
+            {'sequence': ['c'], 'file_pattern': ['*.py']}
+        ]
+        index = OnSaveIndex(entries)
+        self.assertEqual(index.match('/a/b.py', 'Packages/Python/Python.sublime-syntax'), [entries[0], entries[2]])
+        self.assertEqual(index.match(None, 'Packages/JavaScript/JavaScript.sublime-syntax'), [entries[1]])
+        self.assertEqual(index.match('/a/b.txt', 'Packages/Text/Plain text.tmLanguage'), [])
+
+    def test_errors(self):
+        """Test that invalid file regexes are reported."""
+
+        index = OnSaveIndex([{'sequence': ['a'], 'file_regex': ['(']}, {'sequence': ['b'], 'file_pattern': ['*']}])
+        self.assertEqual(len(index.errors), 1)
+        self.assertEqual(len(index.match('/a/b.txt')), 1)
+
+
+class TestRuleRegistry(unittest.TestCase):
+    """Test keeping resolved rules until they change."""
+
+    def test_update(self):
+        """Test that only the rules that changed are resolved again."""
+
+        registry = RuleRegistry({'a': {'find': 'a', 'replace': 'b'}, 'b': {'find': 'b', 'replace': 'c'}})
+        a = registry['a']
+        b = registry['b']
+        a.memo('compiled', lambda: 'pattern')
+        self.assertIs(registry['a'], a)
+
+        changed = registry.update(
+            {'a': {'find': 'a', 'replace': 'b'}, 'b': {'find': 'b', 'replace': 'd'}, 'c': {'find': 'c'}}
+        )
+        self.assertEqual(changed, {'b', 'c'})
+        self.assertIs(registry['a'], a)
+        self.assertEqual(a.compiled, {'compiled': 'pattern'})
+        self.assertIsNot(registry['b'], b)
+        self.assertEqual(registry['b'].replace, 'd')
+        self.assertEqual(registry['c'].replace, r'\g<0>')
+
+        self.assertEqual(registry.update({'a': {'find': 'a', 'replace': 'b'}}), {'b', 'c'})
+        self.assertNotIn('b', registry)
+        self.assertIsNone(registry.get('b'))
+
+        registry.forget_compiled()
+        self.assertIs(registry['a'], a)
+        self.assertEqual(a.compiled, {})
+
+    def test_read_only(self):
+        """Test that resolved rules can't be changed."""
+
+        rule = RuleRegistry({'a': {'find': 'a'}})['a']
+        with self.assertRaises(AttributeError):
+            rule.find = 'b'
@@ -0,0 +1,146 @@
+"""Test the shadow buffer."""
+import random
+import unittest
+from RegReplace.rr_buffer import TextBuffer
+from RegReplace.rr_shadow import ShadowBuffer, trim_edit
+
+
+def random_edits(rand, text):
+    """Get a batch of non-overlapping edits of the text."""
+
+    points = sorted(rand.sample(range(len(text) + 1), min(len(text) + 1, rand.randint(0, 12))))
+    edits = []
+    for begin, end in zip(points[::2], points[1::2]):
+        if rand.random() < 0.5:
+            end = begin
+        edits.append((begin, end, ''.join(rand.choice('ab\n') for _ in range(rand.randint(0, 4)))))
+    return edits
+
+
+def apply_edits(text, edits):
+    """Apply a batch of edits to the text, from the last to the first."""
+
+    for begin, end, new in sorted(edits, reverse=True):
+        text = text[:begin] + new + text[end:]
+    return text
+
+
+class TestShadowBuffer(unittest.TestCase):
+    """Test that shadow buffer hunks turn the original text into the edited text."""
+
+    def test_hunks(self):
+        """Test that the hunks reproduce the edited text."""
+
+        rand = random.Random(0)
+        for case in range(500):
+            original = ''.join(rand.choice('ab\n') for _ in range(rand.randint(0, 40)))
+            shadow = ShadowBuffer(original)
+            text = original
+            for batch in range(rand.randint(1, 4)):
+                edits = random_edits(rand, text)
+                shadow.apply(edits)
+                text = apply_edits(text, edits)
+                self.assertEqual(shadow.text, text)
+
+            hunks = shadow.hunks(rand.choice((0, 4, 256)))
+            self.assertEqual(apply_edits(original, hunks), text)
+            for begin, end, new in hunks:
+                self.assertNotEqual(original[begin:end], new)
+
+    def test_scattered(self):
+        """Test that many scattered edits are committed one hunk each, leaving the text between them alone."""
+
+        original = ''.join('line %d\n' % index for index in range(500))
+        shadow = ShadowBuffer(original)
+        # Edit every fifth line: far more edits than a view would want merged
+        edits = []
+        pos = 0
+        for index, line in enumerate(original.splitlines(True)):
+            if index % 5 == 0:
+                edits.append((pos, pos + 4, 'LINE'))
+            pos += len(line)
+        shadow.apply(edits)
+        hunks = shadow.hunks()
+        self.assertEqual(len(hunks), 100)
+        self.assertEqual(hunks, edits)
+        self.assertEqual(apply_edits(original, hunks), shadow.text)
+
+    def test_no_op(self):
+        """Test that edits that put back the original text leave no hunks."""
+
+        shadow = ShadowBuffer('foo bar baz')
+        shadow.apply([(0, 3, 'FOO'), (8, 11, 'qux')])
+        shadow.apply([(0, 3, 'foo'), (8, 11, 'baz')])
+        self.assertEqual(shadow.text, 'foo bar baz')
+        self.assertEqual(shadow.hunks(), [])
+
+    def test_mapping(self):
+        """Test that positions are mapped between the original and the edited text."""
+
+        shadow = ShadowBuffer('0123456789')
+        shadow.apply([(2, 4, 'abcd'), (7, 8, '')])
+        self.assertEqual(shadow.text, '01abcd45689')
+        self.assertEqual(shadow.to_current(1), 1)
+        self.assertEqual(shadow.to_current(5), 7)
+        self.assertEqual(shadow.to_current(9), 10)
+        self.assertEqual(shadow.to_original(7), 5)
+        self.assertEqual(shadow.to_original(10), 9)
+
+
+class TestReplaceAll(unittest.TestCase):
+    """Test committing hunks to a text buffer at once."""
+
+    def test_random(self):
+        """Test that replacing the hunks at once is the same as replacing them one at a time from the end."""
+
+        rand = random.Random(2)
+        for case in range(500):
+            original = ''.join(rand.choice('ab\n') for _ in range(rand.randint(0, 20)))
+            shadow = ShadowBuffer(original)
+            for edit in range(rand.randint(1, 4)):
+                size = len(shadow.text)
+                begin = rand.randint(0, size)
+                end = rand.randint(begin, size)
+                shadow.apply([(begin, end, ''.join(rand.choice('abc') for _ in range(rand.randint(0, 3))))])
+            points = [rand.randint(0, len(original)) for _ in range(6)]
+            selections = [(min(a, b), max(a, b)) for a, b in zip(points[::2], points[1::2])]
+            scopes = {'comment': list(selections)}
+            one_by_one = TextBuffer(original, selections, dict(scopes))
+            for begin, end, text in reversed(shadow.hunks()):
+                one_by_one.replace(begin, end, text)
+            at_once = TextBuffer(original, selections, dict(scopes))
+            at_once.replace_all(shadow.hunks())
+            self.assertEqual(at_once.text, shadow.text)
+            self.assertEqual(at_once.sel().regions, one_by_one.sel().regions)
+            self.assertEqual(at_once.scopes, one_by_one.scopes)
+
+
+class TestTrimEdit(unittest.TestCase):
+    """Test trimming edits to the text that changes."""
+
+    def test_trim(self):
+        """Test the text kept at the start and end of edits."""
+
+        self.assertIsNone(trim_edit('same', 'same'))
+        self.assertEqual(trim_edit('abc', 'xbc'), (0, 2))
+        self.assertEqual(trim_edit('abc', 'abx'), (2, 0))
+        self.assertEqual(trim_edit('foo(bar)', 'foo[bar]'), (3, 0))
+        self.assertEqual(trim_edit('color: red;', 'color: blue;'), (7, 1))
+        self.assertEqual(trim_edit('aaa', 'aaaa'), (3, 0))
+        self.assertEqual(trim_edit('', 'new'), (0, 0))
+
+    def test_random(self):
+        """Test that the trimmed edit gives the same text."""
+
+        rand = random.Random(1)
+        for case in range(1000):
+            original = ''.join(rand.choice('ab') for _ in range(rand.randint(0, 8)))
+            text = ''.join(rand.choice('ab') for _ in range(rand.randint(0, 8)))
+            trim = trim_edit(original, text)
+            if trim is None:
+                self.assertEqual(original, text)
+                continue
+            prefix, suffix = trim
+            self.assertLessEqual(prefix + suffix, min(len(original), len(text)))
+            self.assertEqual(original[:prefix], text[:prefix])
+            self.assertEqual(original[len(original) - suffix:], text[len(text) - suffix:])
@@ -0,0 +1,101 @@
+"""Test streaming rules over text in chunks."""
+import random
+import re
+import unittest
+from RegReplace.rr_buffer import TextBuffer
+from RegReplace.rr_engine import ReplaceEngine
+from RegReplace.rr_rules import RuleRegistry
+from RegReplace.rr_stream import RuleStream, StreamError, stream_sequence
+
+RULES = {
+    # Bounded: each rule reads exactly as far ahead as it can look with `re`
+    'swap': {'find': r'(\w)_(\w)', 'replace': r'\2_\1'},
+    'literal': {'find': 'ab', 'replace': 'X', 'literal': True},
+    'word': {'find': r'\bba\b', 'replace': 'BA'},
+    'look': {'find': r'(?<=a)b(?=a)', 'replace': 'Q'},
+    'stamp': {'find': r'(\d\d):(\d\d)', 'replace': r'\2h\1'},
+    # Unbounded: with `re`, matches (and what they look at) must fit in the overlap
+    'trailing': {'find': r'[ \t]+$', 'replace': ''},
+    'first': {'find': r'b+a', 'replace': r'<\g<0>>', 'greedy': False},
+    'lines': {'find': r'\n\n+', 'replace': '\n'},
+    'bol': {'find': r'^', 'replace': '>'}
+}
+
+PIECES = ['a', 'b', 'ab', '_', ' ', '\n', 'ba', '\t', '12:34', '7']
+
+# Runs that unbounded rules match are kept well within the overlap
+RE_LONG_RUN = re.compile(r'[ \t]{4,}|\n{4,}|b{4,}')
+
+OVERLAP = 8
+
+
+def chunks(text, size):
+    """Split the text in chunks of the given size."""
+
+    return [text[index:index + size] for index in range(0, len(text), size)]
+
+
+def random_text(rand, pieces):
+    """Get a random text that is several chunks long."""
+
+    text = ''.join(rand.choice(PIECES) for _ in range(pieces))
+    return RE_LONG_RUN.sub(lambda m: m.group(0)[:3], text)
+
+
+class TestStream(unittest.TestCase):
+    """Test that streamed text gives the same result as replacing the whole text at once."""
+
+    def whole(self, rules, names, text, settings):
+        """Apply the sequence to the whole text."""
+
+        bfr = TextBuffer(text)
+        ReplaceEngine(bfr, settings, False, False, False, 1, None).apply_sequence(list(names), rules)
+        return bfr.substr(0, bfr.size())
+
+    def stream(self, rules, names, text, settings, chunk_size, overlap):
+        """Apply the sequence to the text in chunks."""
+
+        engine = ReplaceEngine(TextBuffer(''), settings, False, False, False, 1, None)
+        streams = [RuleStream(engine, rules[name], chunk_size, overlap) for name in names]
+        return ''.join(stream_sequence(streams, chunks(text, chunk_size)))
+
+    def test_chunks(self):
+        """Test texts many chunks long with an overlap smaller than the chunks."""
+
+        rules = RuleRegistry(RULES)
+        rand = random.Random(0)
+        for case in range(300):
+            text = random_text(rand, rand.randint(100, 400))
+            names = rand.sample(sorted(RULES), rand.randint(1, 3))
+            chunk_size = rand.choice([16, 32, 64])
+            for settings in ({}, {'use_regex_module': True}):
+                self.assertEqual(
+                    self.stream(rules, names, text, settings, chunk_size, OVERLAP),
+                    self.whole(rules, names, text, settings),
+                    (names, chunk_size, settings)
+                )
+
+    def test_straddle(self):
+        """Test that matches that straddle the end of a chunk are carried to the next one."""
+
+        rules = RuleRegistry(RULES)
+        for settings in ({}, {'use_regex_module': True}):
+            for offset in range(1, 5):
+                # The match starts `offset` characters before the end of the first chunk
+                text = 'x' * (16 - offset) + '12:34' + 'y' * 40 + '56:78' + 'z' * 20
+                expected = 'x' * (16 - offset) + '34h12' + 'y' * 40 + '78h56' + 'z' * 20
+                self.assertEqual(self.stream(rules, ['stamp'], text, settings, 16, 4), expected)
+
+            # An unbounded match that runs from one chunk into the next
+            text = 'a' * 12 + ' \t \n' + 'b' * 20
+            self.assertEqual(self.stream(rules, ['trailing'], text, settings, 16, 8), 'a' * 12 + '\n' + 'b' * 20)
+
+    def test_too_long(self):
+        """Test that a match that can't fit in a chunk is an error instead of being read whole."""
+
+        rules = RuleRegistry({'long': {'find': r'a[^z]*z', 'replace': 'Z'}})
+        text = 'a' + 'b' * 100 + 'z'
+        # Partial matches are carried to the next chunk with the `regex` module
+        with self.assertRaises(StreamError):
+            self.stream(rules, ['long'], text, {'use_regex_module': True}, 8, 8)
+        self.assertEqual(self.stream(rules, ['long'], text, {'use_regex_module': True}, 128, 8), 'Z')
@@ -0,0 +1,54 @@
+"""Test compiling replace templates."""
+import re
+import unittest
+from RegReplace.rr_template import compile_template, LiteralTemplate, GroupTemplate, MatchTemplate
+try:
+    import regex
+except ImportError:
+    regex = None
+
+TEMPLATES = [
+    '', 'plain', r'\1', r'\g<1>', r'\g<name>', r'\2\1', r'\g<0>', r'a\tb\n', r'x\\y', r'<\g<name>\g<2>>', r'\1\1\1'
+]
+TEXTS = ['ab', 'a', 'xaby', 'aab']
+
+
+class TestTemplate(unittest.TestCase):
+    """Test that compiled templates expand like the match object."""
+
+    def check(self, engine, find):
+        """Check every template against every text with the engine."""
+
+        pattern = engine.compile(find)
+        for template in TEMPLATES:
+            compiled = compile_template(engine, pattern, template)
+            for text in TEXTS:
+                for m in pattern.finditer(text):
+                    self.assertEqual(compiled.expand(m), m.expand(template), (template, text))
+
+    def test_re(self):
+        """Test templates with Re."""
+
+        self.check(re, r'(?P<name>a)(b)?')
+
+    @unittest.skipIf(regex is None, 'regex is not installed')
+    def test_regex(self):
+        """Test templates with Regex."""
+
+        self.check(regex, r'(?P<name>a)(b)?')
+
+    def test_kinds(self):
+        """Test that templates are expanded the simplest way they can be."""
+
+        pattern = re.compile(r'(?P<name>a)(b)?')
+        self.assertIsInstance(compile_template(re, pattern, r'plain\t'), LiteralTemplate)
+        self.assertIsInstance(compile_template(re, pattern, r'<\1>'), GroupTemplate)
+        self.assertIsInstance(compile_template(re, pattern, r'{1}', True), MatchTemplate)
+
+    def test_invalid(self):
+        """Test that an invalid template is reported when it is expanded, like the match object does."""
+
+        pattern = re.compile(r'(a)')
+        compiled = compile_template(re, pattern, r'\3')
+        with self.assertRaises(re.error):
+            compiled.expand(pattern.match('a'))